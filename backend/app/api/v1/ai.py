@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from supabase import Client
 from app.core.supabase import get_supabase, get_supabase_admin
 from app.api.deps import get_current_user
@@ -7,12 +8,89 @@ from app.models.ai import (
     GenerateSimilarRequest, GradeEssayRequest, GradeEssayResponse
 )
 from app.services.chatgpt_service import chatgpt_service
+from app.services.dedup_service import dedup_service
+from app.services.similarity_service import similarity_index
 import logging
 import json
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+ALLOWED_QUESTION_TYPES = ['multiple_choice', 'multiple_answer', 'true_false',
+                          'short_answer', 'essay', 'fill_blank', 'ordering']
+
+# Từ ngưỡng này coi là chính câu hỏi gốc, không trả về như câu "tương tự"
+SAME_QUESTION_SIMILARITY = 0.95
+
+def create_question_bank_from_analysis(result: dict, current_user: dict, supabase: Client) -> tuple:
+    """
+    Lưu kết quả phân tích của ChatGPT thành ngân hàng câu hỏi mới
+    Returns:
+        (bank_id, bank_name, question_items)
+    """
+    bank_name = result.get("exam_title") or f"Ngân hàng từ AI - {current_user['email'][:20]}"
+    bank_description = result.get("exam_description") or "Tự động tạo từ AI"
+    
+    logger.info(f"💾 Creating question bank...")
+    
+    bank_data = {
+        "user_id": current_user["id"],
+        "name": bank_name,
+        "description": bank_description,
+        "is_public": False
+    }
+    
+    bank_response = supabase.table("question_banks").insert(bank_data).execute()
+    bank_id = bank_response.data[0]["id"]
+    
+    questions_to_insert = []
+    
+    for idx, q in enumerate(result["questions"]):
+        q_type = q.get("question_type", "multiple_choice")
+        
+        if q_type not in ALLOWED_QUESTION_TYPES:
+            logger.warning(f"Unknown question type '{q_type}', defaulting to 'multiple_choice'")
+            q_type = "multiple_choice"
+        
+        correct_ans = q["correct_answer"]
+        
+        question_item = {
+            "question_bank_id": bank_id,
+            "question_text": q["question_text"],
+            "question_type": q_type,
+            "options": q.get("options"),
+            "correct_answer": correct_ans,
+            "marks": 1,
+            "explanation": q.get("explanation"),
+            "difficulty": "medium",
+            "tags": [],
+            "times_used": 0,
+            "times_correct": 0,
+            "times_incorrect": 0,
+            "text_fingerprint": dedup_service.fingerprint(q["question_text"], q.get("options"))
+        }
+        questions_to_insert.append(question_item)
+    
+    # Insert questions
+    questions_response = supabase.table("question_bank_items").insert(questions_to_insert).execute()
+    question_items = questions_response.data
+    similarity_index.invalidate_items(question_items)
+    
+    # Track analytics
+    try:
+        supabase.rpc('track_action', {
+            'p_user_id': current_user['id'],
+            'p_action_type': 'ai_create_question_bank',
+            'p_metadata': {
+                'bank_id': bank_id,
+                'questions_count': len(question_items)
+            }
+        }).execute()
+    except Exception as analytics_error:
+        logger.warning(f"Analytics tracking failed: {str(analytics_error)}")
+    
+    return bank_id, bank_name, question_items
+
 @router.post("/analyze-text", response_model=AnalyzeTextResponse)
 async def analyze_text(
     data: AnalyzeTextRequest,
@@ -38,70 +116,9 @@ async def analyze_text(
                 detail="No questions found in the text"
             )
         
-        bank_name = result.get("exam_title") or f"Ngân hàng từ AI - {current_user['email'][:20]}"
-        bank_description = result.get("exam_description") or "Tự động tạo từ AI"
-        
-
-        logger.info(f"💾 Creating question bank...")
-        
-        bank_data = {
-            "user_id": current_user["id"],
-            "name": bank_name,
-            "description": bank_description,
-            "is_public": False
-        }
-        
-        bank_response = supabase.table("question_banks").insert(bank_data).execute()
-        bank_id = bank_response.data[0]["id"]
-    
-        questions_to_insert = []
-        allowed_types = ['multiple_choice', 'multiple_answer', 'true_false', 
-                        'short_answer', 'essay', 'fill_blank', 'ordering']
-        
-        for idx, q in enumerate(result["questions"]):
-            q_type = q.get("question_type", "multiple_choice")
-            
-            if q_type not in allowed_types:
-                logger.warning(f"Unknown question type '{q_type}', defaulting to 'multiple_choice'")
-                q_type = "multiple_choice"
-            
-            correct_ans = q["correct_answer"]
-            
-            question_item = {
-                "question_bank_id": bank_id,
-                "question_text": q["question_text"],
-                "question_type": q_type,
-                "options": q.get("options"),
-                "correct_answer": correct_ans,
-                "marks": 1,
-                "explanation": q.get("explanation"),
-                "difficulty": "medium",
-                "tags": [],
-                "times_used": 0,
-                "times_correct": 0,
-                "times_incorrect": 0
-            }
-            questions_to_insert.append(question_item)
-        
-        # Insert questions
-        questions_response = supabase.table("question_bank_items").insert(questions_to_insert).execute()
-        question_items = questions_response.data
-
-    
-        
-        # Track analytics
-        try:
-            supabase.rpc('track_action', {
-                'p_user_id': current_user['id'],
-                'p_action_type': 'ai_create_question_bank',
-                'p_metadata': {
-                    'bank_id': bank_id,
-                    'questions_count': len(question_items)
-                }
-            }).execute()
-        except Exception as analytics_error:
-            logger.warning(f"Analytics tracking failed: {str(analytics_error)}")
-            pass
+        bank_id, bank_name, question_items = create_question_bank_from_analysis(
+            result, current_user, supabase
+        )
 
         result["bank_id"] = bank_id
         result["bank_name"] = bank_name
@@ -119,6 +136,52 @@ async def analyze_text(
         )
 
 
+def create_exam_from_analysis(analysis_result: dict, file_data: dict, current_user: dict, supabase: Client) -> tuple:
+    """
+    Tạo exam từ kết quả phân tích file và gắn vào uploaded_files.exam_id
+    (dùng chung cho /ai/analyze-file và /upload/ingest)
+    Returns:
+        (exam_id, exam_title)
+    """
+    logger.info(f"📝 Creating exam...")
+    exam_data = {
+        "title": analysis_result.get("exam_title") or f"Exam from {file_data['file_name']}",
+        "description": analysis_result.get("exam_description") or "Auto-generated from uploaded file",
+        "created_by": current_user["id"],
+        "is_published": False,
+        "total_marks": len(analysis_result["questions"])
+    }
+    
+    exam_response = supabase.table("exams").insert(exam_data).execute()
+    exam_id = exam_response.data[0]["id"]
+    
+    # Add questions
+    logger.info(f"❓ Adding {len(analysis_result['questions'])} questions...")
+    questions_to_insert = []
+    
+    for idx, q in enumerate(analysis_result["questions"]):
+        question = {
+            "exam_id": exam_id,
+            "question_text": q["question_text"],
+            "question_type": q.get("question_type", "multiple_choice"),
+            "options": q.get("options"),
+            "correct_answer": q["correct_answer"],
+            "marks": 1,
+            "explanation": q.get("explanation"),
+            "order_index": idx
+        }
+        questions_to_insert.append(question)
+    
+    supabase.table("questions").insert(questions_to_insert).execute()
+    
+    # Update file record
+    supabase.table("uploaded_files")\
+        .update({"exam_id": exam_id})\
+        .eq("id", file_data["id"])\
+        .execute()
+    
+    return exam_id, exam_data["title"]
+
 @router.post("/analyze-file/{file_id}")
 async def analyze_uploaded_file(
     file_id: str,
@@ -167,43 +230,7 @@ async def analyze_uploaded_file(
                 detail="No questions found in the text"
             )
         
-        # Create exam
-        logger.info(f"📝 Creating exam...")
-        exam_data = {
-            "title": analysis_result.get("exam_title") or f"Exam from {file_data['file_name']}",
-            "description": analysis_result.get("exam_description") or "Auto-generated from uploaded file",
-            "created_by": current_user["id"],
-            "is_published": False,
-            "total_marks": len(analysis_result["questions"])
-        }
-        
-        exam_response = supabase.table("exams").insert(exam_data).execute()
-        exam_id = exam_response.data[0]["id"]
-        
-        # Add questions
-        logger.info(f"❓ Adding {len(analysis_result['questions'])} questions...")
-        questions_to_insert = []
-        
-        for idx, q in enumerate(analysis_result["questions"]):
-            question = {
-                "exam_id": exam_id,
-                "question_text": q["question_text"],
-                "question_type": q.get("question_type", "multiple_choice"),
-                "options": q.get("options"),
-                "correct_answer": q["correct_answer"],
-                "marks": 1,
-                "explanation": q.get("explanation"),
-                "order_index": idx
-            }
-            questions_to_insert.append(question)
-        
-        supabase.table("questions").insert(questions_to_insert).execute()
-        
-        # Update file record
-        supabase.table("uploaded_files")\
-            .update({"exam_id": exam_id})\
-            .eq("id", file_id)\
-            .execute()
+        exam_id, exam_title = create_exam_from_analysis(analysis_result, file_data, current_user, supabase)
         
         logger.info(f"✅ Exam created: {exam_id}")
         
@@ -211,7 +238,7 @@ async def analyze_uploaded_file(
             "message": "Exam created successfully",
             "exam_id": exam_id,
             "questions_count": len(analysis_result["questions"]),
-            "exam_title": exam_data["title"]
+            "exam_title": exam_title
         }
         
     except HTTPException:
@@ -228,18 +255,47 @@ async def analyze_uploaded_file(
 @router.post("/generate-similar")
 async def generate_similar_questions(
     data: GenerateSimilarRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase_admin)
 ):
     """
     Tạo câu hỏi tương tự
+    Ưu tiên lấy câu hỏi gần giống trong ngân hàng của user và ngân hàng công khai,
+    chỉ gọi AI để tạo phần còn thiếu
     """
     try:
-        questions = chatgpt_service.generate_similar_questions(
-            data.question, 
-            data.count
-        )
+        bank_questions = []
+        if data.use_bank:
+            banks = supabase.table("question_banks")\
+                .select("id")\
+                .or_(f"user_id.eq.{current_user['id']},is_public.eq.true")\
+                .execute()
+            
+            matches = await run_in_threadpool(
+                similarity_index.query,
+                supabase,
+                data.question,
+                [bank["id"] for bank in banks.data],
+                top_k=data.count,
+                min_similarity=data.min_similarity,
+                max_similarity=SAME_QUESTION_SIMILARITY
+            )
+            bank_questions = [{**match, "source": "bank"} for match in matches]
+        
+        shortfall = data.count - len(bank_questions)
+        generated = []
+        if shortfall > 0:
+            generated = [
+                {**q, "source": "ai"}
+                for q in chatgpt_service.generate_similar_questions(data.question, shortfall)
+            ]
         
-        return {"questions": questions}
+        logger.info(f"🔁 Similar questions: {len(bank_questions)} from bank, {len(generated)} generated")
+        return {
+            "questions": bank_questions + generated,
+            "from_bank": len(bank_questions),
+            "generated": len(generated)
+        }
         
     except Exception as e:
         logger.error(f"❌ Generate similar error: {str(e)}")
@@ -1,62 +1,66 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from typing import List
-import random
 from app.models.question_bank import (
     GenerateRandomExamRequest, GenerateRandomExamResponse,
+    GenerateBatchExamRequest, GenerateBatchExamResponse,
     ExamTemplateCreate, ExamTemplateResponse
 )
 from app.api.deps import get_current_user
 from supabase import Client
-from app.core.supabase import get_supabase
+from app.core.supabase import get_supabase_admin
+from app.services.exam_sampler import exam_sampler, SamplingError
+from app.services.item_stats_service import item_stats_service
 
 router = APIRouter()
 
+MAX_BATCH_VARIANTS = 200
+EXAM_QUESTIONS_INSERT_CHUNK = 1000
+DEFAULT_DURATION_MINUTES = 60
+
 
 @router.post("/generate-random", response_model=GenerateRandomExamResponse)
 async def generate_random_exam(
     data: GenerateRandomExamRequest,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase)
+    supabase: Client = Depends(get_supabase_admin)
 ):
-    """Tạo đề thi ngẫu nhiên từ question banks"""
+    """
+    Tạo đề thi ngẫu nhiên từ question banks
+    - difficulty_quotas: số câu theo độ khó, ví dụ {"easy": 10, "hard": 5}
+      (phần còn lại lấy từ các độ khó khác)
+    - max_per_category: tối đa số câu mỗi category
+    - prefer_unused: ưu tiên câu ít được dùng (theo times_used)
+    """
     try:
-        # Validate question banks access
-        all_questions = []
+        # Validate question banks access (1 query cho tất cả bank)
+        banks = supabase.table('question_banks')\
+            .select('id, user_id, is_public')\
+            .in_('id', data.question_bank_ids)\
+            .execute()
+        banks_by_id = {bank['id']: bank for bank in banks.data}
         
         for bank_id in data.question_bank_ids:
-            # Check access to bank
-            bank = supabase.table('question_banks').select('*').eq('id', bank_id).execute()
-            if not bank.data:
+            bank = banks_by_id.get(bank_id)
+            if not bank:
                 raise HTTPException(status_code=404, detail=f"Question bank {bank_id} not found")
-            if bank.data[0]['user_id'] != current_user['id'] and not bank.data[0]['is_public']:
+            if bank['user_id'] != current_user['id'] and not bank['is_public']:
                 raise HTTPException(status_code=403, detail=f"Access denied to question bank {bank_id}")
-            
-            # Get questions from this bank
-            query = supabase.table('question_bank_items').select('*').eq('question_bank_id', bank_id)
-            
-            # Apply filters
-            if data.category_ids:
-                query = query.in_('category_id', data.category_ids)
-            if data.difficulty_levels:
-                query = query.in_('difficulty', data.difficulty_levels)
-            if data.tags:
-                query = query.contains('tags', data.tags)
-            
-            questions = query.execute()
-            all_questions.extend(questions.data)
-        
-        if not all_questions:
-            raise HTTPException(status_code=400, detail="No questions found matching the criteria")
-        
-        # Check if enough questions available
-        if len(all_questions) < data.num_questions:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Not enough questions. Found {len(all_questions)}, requested {data.num_questions}"
-            )
         
-        # Randomly select questions
-        selected_questions = random.sample(all_questions, data.num_questions)
+        try:
+            selected_questions = exam_sampler.sample(
+                supabase,
+                data.question_bank_ids,
+                data.num_questions,
+                category_ids=data.category_ids,
+                difficulty_levels=data.difficulty_levels,
+                tags=data.tags,
+                difficulty_quotas=data.difficulty_quotas,
+                max_per_category=data.max_per_category,
+                prefer_unused=data.prefer_unused
+            )
+        except SamplingError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
         # Create exam
         exam_title = data.exam_title or f"Random Exam - {data.num_questions} questions"
@@ -72,9 +76,9 @@ async def generate_random_exam(
         
         exam_id = exam.data[0]['id']
         
-        # Add questions to exam
-        for idx, question in enumerate(selected_questions):
-            supabase.table('questions').insert({
+        # Add questions to exam (bulk insert)
+        supabase.table('questions').insert([
+            {
                 'exam_id': exam_id,
                 'question_text': question['question_text'],
                 'question_type': question['question_type'],
@@ -83,12 +87,12 @@ async def generate_random_exam(
                 'explanation': question['explanation'],
                 'marks': question['marks'],
                 'order_number': idx + 1
-            }).execute()
-            
-            # Update usage stats
-            supabase.table('question_bank_items').update({
-                'times_used': question['times_used'] + 1
-            }).eq('id', question['id']).execute()
+            }
+            for idx, question in enumerate(selected_questions)
+        ]).execute()
+        
+        # Update usage stats
+        item_stats_service.increment_usage(supabase, [q['id'] for q in selected_questions])
         
         # Track analytics
         supabase.rpc('track_action', {
@@ -117,7 +121,7 @@ async def generate_random_exam(
 async def create_exam_template(
     data: ExamTemplateCreate,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase)
+    supabase: Client = Depends(get_supabase_admin)
 ):
     """Tạo template để generate exam sau này"""
     try:
@@ -133,7 +137,7 @@ async def create_exam_template(
 @router.get("/templates", response_model=List[ExamTemplateResponse])
 async def get_exam_templates(
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase)
+    supabase: Client = Depends(get_supabase_admin)
 ):
     """Lấy danh sách templates"""
     try:
@@ -146,7 +150,7 @@ async def get_exam_templates(
 async def get_exam_template(
     template_id: str,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase)
+    supabase: Client = Depends(get_supabase_admin)
 ):
     """Lấy chi tiết template"""
     try:
@@ -163,7 +167,7 @@ async def get_exam_template(
 async def generate_exam_from_template(
     template_id: str,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase)
+    supabase: Client = Depends(get_supabase_admin)
 ):
     """Generate exam từ template"""
     try:
@@ -192,11 +196,132 @@ async def generate_exam_from_template(
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/templates/{template_id}/generate-batch", response_model=GenerateBatchExamResponse)
+async def generate_batch_from_template(
+    template_id: str,
+    data: GenerateBatchExamRequest,
+    current_user: dict = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase_admin)
+):
+    """
+    Sinh nhiều đề ngẫu nhiên khác nhau từ một template (vd. mỗi học sinh trong lớp một đề)
+    Pool câu hỏi chỉ tải một lần; exams và exam_questions được insert hàng loạt
+    """
+    try:
+        if not 1 <= data.num_variants <= MAX_BATCH_VARIANTS:
+            raise HTTPException(status_code=400, detail=f"num_variants must be between 1 and {MAX_BATCH_VARIANTS}")
+        if data.max_overlap is not None and not 0 <= data.max_overlap <= 1:
+            raise HTTPException(status_code=400, detail="max_overlap must be between 0 and 1")
+        
+        # Get template
+        template = supabase.table('exam_templates').select('*').eq('id', template_id).eq('user_id', current_user['id']).execute()
+        if not template.data:
+            raise HTTPException(status_code=404, detail="Template not found")
+        
+        template_data = template.data[0]
+        bank_ids = template_data['question_bank_ids']
+        
+        # Validate question banks access (1 query cho tất cả bank)
+        banks = supabase.table('question_banks')\
+            .select('id, user_id, is_public')\
+            .in_('id', bank_ids)\
+            .execute()
+        banks_by_id = {bank['id']: bank for bank in banks.data}
+        
+        for bank_id in bank_ids:
+            bank = banks_by_id.get(bank_id)
+            if not bank:
+                raise HTTPException(status_code=404, detail=f"Question bank {bank_id} not found")
+            if bank['user_id'] != current_user['id'] and not bank['is_public']:
+                raise HTTPException(status_code=403, detail=f"Access denied to question bank {bank_id}")
+        
+        try:
+            variants = await run_in_threadpool(
+                exam_sampler.sample_variants,
+                supabase,
+                bank_ids,
+                template_data['num_questions'],
+                data.num_variants,
+                category_ids=template_data.get('category_ids'),
+                difficulty_levels=template_data.get('difficulty_levels'),
+                tags=template_data.get('tags'),
+                difficulty_quotas=data.difficulty_quotas,
+                max_per_category=data.max_per_category,
+                max_overlap=data.max_overlap
+            )
+        except SamplingError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        # Create exams (bulk insert)
+        title_prefix = data.title_prefix or f"{template_data['name']} - {template_data['created_at'][:10]}"
+        pass_percentage = template_data.get('pass_percentage') or 70
+        exams_to_insert = []
+        for idx, questions in enumerate(variants):
+            total_marks = sum(q.get('marks') or 1 for q in questions)
+            exams_to_insert.append({
+                'title': f"{title_prefix} #{idx + 1}",
+                'description': template_data.get('description'),
+                'created_by': current_user['id'],
+                'question_bank_id': bank_ids[0],
+                'duration_minutes': template_data.get('duration') or DEFAULT_DURATION_MINUTES,
+                'total_marks': total_marks,
+                'passing_marks': int(total_marks * pass_percentage / 100),
+                'shuffle_questions': template_data.get('shuffle_questions', True),
+                'show_results_immediately': template_data.get('show_answers_after_submit', True),
+                'is_published': False
+            })
+        
+        exams = supabase.table('exams').insert(exams_to_insert).execute().data
+        
+        # Link questions to exams (bulk insert theo chunk)
+        exam_questions = [
+            {
+                'exam_id': exam['id'],
+                'question_bank_item_id': question['id'],
+                'order_index': idx,
+                'marks': question.get('marks') or 1
+            }
+            for exam, questions in zip(exams, variants)
+            for idx, question in enumerate(questions)
+        ]
+        for start in range(0, len(exam_questions), EXAM_QUESTIONS_INSERT_CHUNK):
+            supabase.table('exam_questions').insert(exam_questions[start:start + EXAM_QUESTIONS_INSERT_CHUNK]).execute()
+        
+        # Update usage stats (đếm cả số lần trùng giữa các đề)
+        item_stats_service.increment_usage(supabase, [q['id'] for questions in variants for q in questions])
+        
+        # Track analytics
+        supabase.rpc('track_action', {
+            'p_user_id': current_user['id'],
+            'p_action_type': 'generate_batch_exams',
+            'p_metadata': {
+                'template_id': template_id,
+                'num_variants': data.num_variants,
+                'exam_ids': [exam['id'] for exam in exams]
+            }
+        }).execute()
+        
+        return {
+            'exams': [
+                {
+                    'exam_id': exam['id'],
+                    'exam_title': exam['title'],
+                    'total_questions': len(questions),
+                    'selected_questions': [q['id'] for q in questions]
+                }
+                for exam, questions in zip(exams, variants)
+            ]
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.delete("/templates/{template_id}")
 async def delete_exam_template(
     template_id: str,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase)
+    supabase: Client = Depends(get_supabase_admin)
 ):
     """Xóa template"""
     try:
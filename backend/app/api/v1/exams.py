@@ -1,48 +1,71 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
 from supabase import Client
 from app.core.supabase import get_supabase_admin
 from app.api.deps import get_current_user
+from app.services.search_service import build_prefix_tsquery, without_search_columns, ITEM_FIELDS
+from app.services.cache_service import exam_payload_cache
+from app.services.item_stats_service import item_stats_service
+from app.services.shuffle_service import attempt_seed, make_seed, shuffle_exam_questions
 from typing import List, Optional
+import hashlib
+import json
 import random
 import logging
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Các cột câu hỏi học sinh được thấy khi làm bài (không có đáp án, giải thích, thống kê)
+STUDENT_QUESTION_FIELDS = "id, question_bank_id, question_text, question_type, options, difficulty, category_id, tags"
+
 
 @router.get("/")
 async def get_all_exams(
+    response: Response,
     is_published: Optional[bool] = None,
     search: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=200),
+    offset: int = Query(0, ge=0),
     current_user: dict = Depends(get_current_user),
     supabase: Client = Depends(get_supabase_admin)
 ):
-    """Lấy danh sách đề thi của user"""
+    """
+    Lấy danh sách đề thi của user
+    - search: tìm theo tiêu đề (full-text, không phân biệt dấu)
+    - limit + offset: phân trang, tổng số đề nằm trong header X-Total-Count
+    """
     try:
-        # User chỉ thấy đề của mình
+        # User chỉ thấy đề của mình, số câu hỏi đếm ngay trong cùng query
+        select_args = {"count": "exact"} if limit else {}
         query = supabase.table("exams")\
-            .select("*, question_banks(name, id)")\
+            .select("*, question_banks(name, id), exam_questions(count)", **select_args)\
             .eq("created_by", current_user["id"])
         
         if is_published is not None:
             query = query.eq("is_published", is_published)
         
         if search:
-            query = query.ilike("title", f"%{search}%")
+            tsquery = build_prefix_tsquery(search)
+            if tsquery:
+                query = query.text_search("title_search", tsquery, options={"config": "simple"})
+        
+        query = query.order("created_at", desc=True)
+        if limit:
+            query = query.range(offset, offset + limit - 1)
         
-        result = query.order("created_at", desc=True).execute()
+        result = query.execute()
         
-        # Count questions for each exam
         exams = []
         for exam in result.data:
-            questions_count = supabase.table("exam_questions")\
-                .select("id", count="exact")\
-                .eq("exam_id", exam["id"])\
-                .execute()
-            
-            exam["questions_count"] = questions_count.count
+            counts = exam.pop("exam_questions", None) or []
+            exam = without_search_columns(exam)
+            exam["questions_count"] = counts[0]["count"] if counts else 0
             exams.append(exam)
         
+        if limit:
+            response.headers["X-Total-Count"] = str(result.count or 0)
+        
         return exams
         
     except Exception as e:
@@ -73,7 +96,7 @@ async def get_exam_detail(
         
         # Get questions through exam_questions
         exam_questions = supabase.table("exam_questions")\
-            .select("*, question_bank_items(*)")\
+            .select(f"*, question_bank_items({', '.join(ITEM_FIELDS)})")\
             .eq("exam_id", exam_id)\
             .order("order_index")\
             .execute()
@@ -89,7 +112,7 @@ async def get_exam_detail(
         ]
         
         return {
-            **exam.data,
+            **without_search_columns(exam.data),
             "questions_count": len(questions),
             "questions": questions
         }
@@ -100,74 +123,116 @@ async def get_exam_detail(
         logger.error(f"Get exam detail error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
     
+def _build_take_payload(exam_id: str, supabase: Client) -> dict:
+    """
+    Đề thi dạng dành cho học sinh (không có đáp án đúng), chưa đảo thứ tự
+    Returns:
+        {"payload", "body" (JSON đã serialize), "etag"}
+    """
+    # Get exam
+    exam = supabase.table("exams")\
+        .select("*, question_banks(name, id)")\
+        .eq("id", exam_id)\
+        .execute()
+    
+    if not exam.data or len(exam.data) == 0:
+        raise HTTPException(status_code=404, detail="Exam not found")
+    
+    exam_data = exam.data[0]
+    #  Check if published
+    if not exam_data.get("is_published", False):
+        raise HTTPException(status_code=403, detail="Exam is not published yet")
+    
+    # Get questions (without correct answers and explanations)
+    exam_questions = supabase.table("exam_questions")\
+        .select(f"id, order_index, marks, question_bank_items({STUDENT_QUESTION_FIELDS})")\
+        .eq("exam_id", exam_id)\
+        .order("order_index")\
+        .order("id")\
+        .execute()
+    
+    questions = []
+    for eq in exam_questions.data:
+        questions.append({
+            **eq["question_bank_items"],
+            "exam_question_id": eq["id"],
+            "order_index": eq["order_index"],
+            "marks": eq["marks"]
+        })
+    
+    payload = {
+        "id": exam_data["id"],
+        "title": exam_data["title"],
+        "description": exam_data.get("description"),
+        "duration_minutes": exam_data["duration_minutes"],
+        "total_marks": exam_data["total_marks"],
+        "passing_marks": exam_data.get("passing_marks"),
+        "shuffle_questions": exam_data.get("shuffle_questions", False),
+        "shuffle_options": exam_data.get("shuffle_options", False),
+        "is_published": exam_data["is_published"],
+        "questions": questions,
+    }
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+    
+    return {
+        "payload": payload,
+        "body": body,
+        "etag": hashlib.sha1(body).hexdigest()
+    }
+
 @router.get("/{exam_id}/take")
 async def take_exam(
     exam_id: str,
+    request: Request,
+    user_exam_id: Optional[str] = None,
     current_user: dict = Depends(get_current_user),
     supabase: Client = Depends(get_supabase_admin)
 ):
     """
     Endpoint cho học sinh làm bài thi
     Trả về đề thi với câu hỏi (không có đáp án đúng)
+    Đề được cache sẵn; thứ tự câu hỏi / đáp án đảo theo seed của lượt làm bài (user_exam_id),
+    nếu không truyền thì theo seed của học sinh
+    Hỗ trợ ETag / If-None-Match
     """
     try:
-        # Get exam
-        exam = supabase.table("exams")\
-            .select("*, question_banks(name, id)")\
-            .eq("id", exam_id)\
-            .execute()
+        seed = make_seed(exam_id, current_user["id"])
+        if user_exam_id:
+            user_exam = supabase.table("user_exams")\
+                .select("id, shuffle_seed")\
+                .eq("id", user_exam_id)\
+                .eq("user_id", current_user["id"])\
+                .eq("exam_id", exam_id)\
+                .execute()
+            if not user_exam.data:
+                raise HTTPException(status_code=404, detail="Exam session not found")
+            seed = attempt_seed(user_exam.data[0])
         
-        if not exam.data or len(exam.data) == 0:
-            raise HTTPException(status_code=404, detail="Exam not found")
+        cached = exam_payload_cache.get(exam_id)
+        if cached is None:
+            cached = _build_take_payload(exam_id, supabase)
+            exam_payload_cache.set(exam_id, cached)
         
-        exam_data = exam.data[0]
-        #  Check if published
-        if not exam_data.get("is_published", False):
-            raise HTTPException(status_code=403, detail="Exam is not published yet")
+        payload = cached["payload"]
+        shuffled = payload["shuffle_questions"] or payload["shuffle_options"]
         
-        # Get questions (without correct answers and explanations)
-        exam_questions = supabase.table("exam_questions")\
-            .select("*, question_bank_items(*)")\
-            .eq("exam_id", exam_id)\
-            .order("order_index")\
-            .execute()
+        # Mỗi lượt làm bài có thứ tự riêng nên ETag gồm cả seed
+        etag = f'"{cached["etag"]}-{seed:x}"' if shuffled else f'"{cached["etag"]}"'
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
         
-        # Remove correct answers and explanations from questions
-        questions = []
-        for eq in exam_questions.data:
-            q = eq["question_bank_items"].copy()
-            # Remove sensitive data
-            q.pop("correct_answer", None)
-            q.pop("explanation", None)
-            q.pop("times_correct", None)
-            q.pop("times_incorrect", None)
-            q.pop("times_used", None)
-            
-            questions.append({
-                **q,
-                "exam_question_id": eq["id"],
-                "order_index": eq["order_index"],
-                "marks": eq["marks"]
-            })
-            # Shuffle questions if enabled
-        if exam_data.get("shuffle_questions", False):
-            import random
-            random.shuffle(questions)
-            # Re-index after shuffle
-            for idx, q in enumerate(questions):
-                q["order_index"] = idx
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
         
-        return {
-            "id": exam_data["id"],
-            "title": exam_data["title"],
-            "description": exam_data.get("description"),
-            "duration_minutes": exam_data["duration_minutes"],
-            "total_marks": exam_data["total_marks"],
-            "passing_marks": exam_data.get("passing_marks"),
-            "shuffle_options": exam_data.get("shuffle_options", False),
-            "is_published": exam_data["is_published"],
-            "questions": questions,
-        }
+        if not shuffled:
+            return Response(content=cached["body"], media_type="application/json", headers=headers)
+        
+        questions = shuffle_exam_questions(
+            payload["questions"],
+            seed,
+            shuffle_questions=payload["shuffle_questions"],
+            shuffle_options=payload["shuffle_options"]
+        )
+        return JSONResponse(content={**payload, "questions": questions}, headers=headers)
         
     except HTTPException:
         raise
@@ -224,7 +289,7 @@ async def create_exam_from_question_bank(
         
         # 2. Get questions with filters
         query = supabase.table("question_bank_items")\
-            .select("*")\
+            .select("id, marks")\
             .eq("question_bank_id", data["question_bank_id"])
         
         if data.get("difficulty_filter"):
@@ -282,17 +347,13 @@ async def create_exam_from_question_bank(
         
         supabase.table("exam_questions").insert(exam_questions).execute()
         
-        # 7. Update question usage stats
-        for q in selected_questions:
-            supabase.table("question_bank_items")\
-                .update({"times_used": (q.get('times_used', 0) + 1)})\
-                .eq("id", q["id"])\
-                .execute()
+        # 7. Update question usage stats (1 RPC cho cả đề)
+        item_stats_service.increment_usage(supabase, [q["id"] for q in selected_questions])
         
         logger.info(f"✅ Exam created: {exam_id} with {len(selected_questions)} questions")
         
         return {
-            **exam_response.data[0],
+            **without_search_columns(exam_response.data[0]),
             "questions_count": len(selected_questions)
         }
         
@@ -352,7 +413,7 @@ async def create_exam_from_selected_questions(
         
         # 2. Get selected questions
         selected_questions = supabase.table("question_bank_items")\
-            .select("*")\
+            .select("id, marks")\
             .eq("question_bank_id", data["question_bank_id"])\
             .in_("id", data["question_ids"])\
             .execute()
@@ -383,10 +444,10 @@ async def create_exam_from_selected_questions(
         exam_id = exam_response.data[0]["id"]
         
         # 5. Link questions to exam (preserve user's selection order)
+        questions_by_id = {q["id"]: q for q in selected_questions.data}
         exam_questions = []
         for idx, question_id in enumerate(data["question_ids"]):
-            # Find question in selected_questions
-            question = next((q for q in selected_questions.data if q["id"] == question_id), None)
+            question = questions_by_id.get(question_id)
             if question:
                 exam_questions.append({
                     "exam_id": exam_id,
@@ -397,17 +458,13 @@ async def create_exam_from_selected_questions(
         
         supabase.table("exam_questions").insert(exam_questions).execute()
         
-        # 6. Update question usage stats
-        for q in selected_questions.data:
-            supabase.table("question_bank_items")\
-                .update({"times_used": (q.get('times_used', 0) + 1)})\
-                .eq("id", q["id"])\
-                .execute()
+        # 6. Update question usage stats (1 RPC cho cả đề)
+        item_stats_service.increment_usage(supabase, [q["id"] for q in selected_questions.data])
         
         logger.info(f"✅ Exam created: {exam_id} with {len(exam_questions)} questions")
         
         return {
-            **exam_response.data[0],
+            **without_search_columns(exam_response.data[0]),
             "questions_count": len(exam_questions)
         }
         
@@ -443,8 +500,9 @@ async def update_exam(
             .update(data)\
             .eq("id", exam_id)\
             .execute()
+        exam_payload_cache.delete(exam_id)
         
-        return result.data[0]
+        return without_search_columns(result.data[0])
         
     except HTTPException:
         raise
@@ -476,6 +534,7 @@ async def delete_exam(
             .delete()\
             .eq("id", exam_id)\
             .execute()
+        exam_payload_cache.delete(exam_id)
         
         
     except HTTPException as he:
@@ -504,6 +563,8 @@ async def publish_exam(
         if not result.data:
             raise HTTPException(status_code=404, detail="Exam not found")
         
+        exam_payload_cache.delete(exam_id)
+        
         return {"message": "Exam published successfully"}
         
     except HTTPException:
@@ -528,6 +589,8 @@ async def unpublish_exam(
         if not result.data:
             raise HTTPException(status_code=404, detail="Exam not found")
         
+        exam_payload_cache.delete(exam_id)
+        
         return {"message": "Exam unpublished successfully"}
         
     except HTTPException:
@@ -1,9 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List, Optional
+from typing import Any, List, Optional
 from app.api.deps import get_current_user
 from supabase import Client
 from app.core.supabase import get_supabase, get_supabase_admin
-from datetime import datetime, timezone
+from app.services.spaced_repetition_service import spaced_repetition_service
+from app.services.cache_service import practice_questions_cache
+from app.services.accuracy_service import accuracy_service
+from app.services.grading_service import grading_service
+from app.services.item_stats_service import item_stats_service
+from app.services.streak_service import streak_service
+from app.services.activity_service import activity_service
+from app.services.search_service import ITEM_FIELDS
+from datetime import datetime, timedelta, timezone
 from pydantic import BaseModel
 import logging
 import uuid
@@ -11,6 +19,9 @@ import uuid
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+ANSWER_FIELDS = ('correct_answer', 'explanation')
+WEAK_TOPICS_RECENT_DAYS = 3  # Không lặp lại câu đã ôn trong khoảng này
+
 # ============ MODELS ============
 
 class PracticeSessionCreate(BaseModel):
@@ -30,6 +41,10 @@ class PracticeSessionResponse(BaseModel):
     started_at: datetime
     completed_at: Optional[datetime] = None
 
+class PracticeAnswerRequest(BaseModel):
+    question_id: str
+    user_answer: Any
+
 # ============ PRACTICE SUGGESTIONS ============
 
 @router.get("/suggestions")
@@ -42,104 +57,45 @@ async def get_practice_suggestions(
         logger.info(f"📊 Getting practice suggestions for user {current_user['id']}")
         suggestions = []
         
-        # 1. Get wrong answers count
+        # Thống kê đã cộng dồn sẵn khi chấm bài (1 query)
         try:
-            # Get all user_exam_ids for this user
-            user_exams = supabase.table('user_exams')\
-                .select('id')\
-                .eq('user_id', current_user['id'])\
-                .eq('status', 'graded')\
-                .execute()
-            
-            if user_exams.data:
-                user_exam_ids = [ue['id'] for ue in user_exams.data]
-                
-                # Count wrong answers
-                wrong_answers = supabase.table('user_answers')\
-                    .select('id', count='exact')\
-                    .in_('user_exam_id', user_exam_ids)\
-                    .eq('is_correct', False)\
-                    .execute()
-                
-                wrong_count = wrong_answers.count or 0
-                
-                if wrong_count > 0:
-                    suggestions.append({
-                        'type': 'wrong_answers',
-                        'title': 'Ôn lại câu sai',
-                        'description': f'Bạn có {wrong_count} câu cần ôn lại',
-                        'count': wrong_count,
-                        'priority': 'high'
-                    })
-                    logger.info(f"✅ Found {wrong_count} wrong answers")
-            else:
-                logger.info("No graded exams found")
+            rollup = accuracy_service.get_rollup(supabase, current_user['id'])
         except Exception as e:
-            logger.error(f"Error getting wrong answers: {str(e)}")
+            logger.error(f"Error getting accuracy rollup: {str(e)}")
+            rollup = []
+        
+        # 1. Get wrong answers count
+        wrong_count = sum(row['total'] - row['correct'] for row in rollup)
+        if wrong_count > 0:
+            suggestions.append({
+                'type': 'wrong_answers',
+                'title': 'Ôn lại câu sai',
+                'description': f'Bạn có {wrong_count} câu cần ôn lại',
+                'count': wrong_count,
+                'priority': 'high'
+            })
+            logger.info(f"✅ Found {wrong_count} wrong answers")
         
         # 2. Get weak topics based on question types
-        try:
-            if user_exams.data:
-                user_exam_ids = [ue['id'] for ue in user_exams.data]
-                
-                # Get question type statistics
-                type_stats = {}
-                
-                answers = supabase.table('user_answers')\
-                    .select('exam_question_id, is_correct')\
-                    .in_('user_exam_id', user_exam_ids)\
-                    .execute()
-                
-                for ans in answers.data:
-                    try:
-                        # Get question type
-                        exam_question = supabase.table('exam_questions')\
-                            .select('question_bank_item_id')\
-                            .eq('id', ans['exam_question_id'])\
-                            .single()\
-                            .execute()
-                        
-                        if exam_question.data:
-                            question = supabase.table('question_bank_items')\
-                                .select('question_type')\
-                                .eq('id', exam_question.data['question_bank_item_id'])\
-                                .single()\
-                                .execute()
-                            
-                            if question.data:
-                                q_type = question.data['question_type']
-                                
-                                if q_type not in type_stats:
-                                    type_stats[q_type] = {'total': 0, 'correct': 0}
-                                
-                                type_stats[q_type]['total'] += 1
-                                if ans.get('is_correct'):
-                                    type_stats[q_type]['correct'] += 1
-                    except:
-                        continue
-                
-                # Find weak topics (accuracy < 70%)
-                weak_topics = []
-                for q_type, stats in type_stats.items():
-                    if stats['total'] >= 3:  # At least 3 attempts
-                        accuracy = (stats['correct'] / stats['total']) * 100
-                        if accuracy < 70:
-                            weak_topics.append({
-                                'type': q_type,
-                                'accuracy': round(accuracy, 1)
-                            })
-                
-                if weak_topics:
-                    suggestions.append({
-                        'type': 'weak_topics',
-                        'title': 'Luyện điểm yếu',
-                        'description': f'Tập trung vào {len(weak_topics)} loại câu cần cải thiện',
-                        'categories': [t['type'] for t in weak_topics],
-                        'priority': 'medium'
+        weak_topics = []
+        for q_type, stats in accuracy_service.accuracy_by(rollup, 'question_type').items():
+            if stats['total'] >= 3:  # At least 3 attempts
+                accuracy = (stats['correct'] / stats['total']) * 100
+                if accuracy < 70:
+                    weak_topics.append({
+                        'type': q_type,
+                        'accuracy': round(accuracy, 1)
                     })
-                    logger.info(f"✅ Found {len(weak_topics)} weak topics")
-        except Exception as e:
-            logger.error(f"Error getting weak topics: {str(e)}")
+        
+        if weak_topics:
+            suggestions.append({
+                'type': 'weak_topics',
+                'title': 'Luyện điểm yếu',
+                'description': f'Tập trung vào {len(weak_topics)} loại câu cần cải thiện',
+                'categories': [t['type'] for t in weak_topics],
+                'priority': 'medium'
+            })
+            logger.info(f"✅ Found {len(weak_topics)} weak topics")
         
         # 3. Regular practice reminder
         suggestions.append({
@@ -179,40 +135,27 @@ async def create_practice_session(
         question_ids = []
         
         if data.session_type == "wrong_answers":
-            # Get questions user answered incorrectly
-            user_exams = supabase.table('user_exams')\
-                .select('id')\
+            # Câu đã từng sai, ưu tiên câu đến hạn ôn sớm nhất
+            question_ids = spaced_repetition_service.due_items(
+                supabase,
+                current_user['id'],
+                limit=data.num_questions or 20,
+                lapsed_only=True,
+                include_upcoming=True
+            )
+        
+        if data.session_type == "wrong_answers" and not question_ids:
+            # Chưa có lịch ôn tập: lấy câu sai từ các bài thi đã chấm (lọc thẳng theo user_id)
+            wrong_answers = supabase.table('user_answers')\
+                .select('question_bank_item_id')\
                 .eq('user_id', current_user['id'])\
-                .eq('status', 'graded')\
+                .eq('is_correct', False)\
+                .not_.is_('question_bank_item_id', 'null')\
+                .limit(data.num_questions or 20)\
                 .execute()
             
-            if user_exams.data:
-                user_exam_ids = [ue['id'] for ue in user_exams.data]
-                
-                wrong_answers = supabase.table('user_answers')\
-                    .select('exam_question_id')\
-                    .in_('user_exam_id', user_exam_ids)\
-                    .eq('is_correct', False)\
-                    .limit(20)\
-                    .execute()
-                
-                # Get unique question_bank_item_ids
-                seen = set()
-                for ans in wrong_answers.data:
-                    try:
-                        exam_q = supabase.table('exam_questions')\
-                            .select('question_bank_item_id')\
-                            .eq('id', ans['exam_question_id'])\
-                            .single()\
-                            .execute()
-                        
-                        if exam_q.data:
-                            qb_id = exam_q.data['question_bank_item_id']
-                            if qb_id not in seen:
-                                question_ids.append(qb_id)
-                                seen.add(qb_id)
-                    except:
-                        continue
+            # Get unique question_bank_item_ids
+            question_ids = list(dict.fromkeys(ans['question_bank_item_id'] for ans in wrong_answers.data))
             
             if not question_ids:
                 raise HTTPException(
@@ -220,12 +163,41 @@ async def create_practice_session(
                     detail="Không tìm thấy câu sai nào để ôn luyện"
                 )
                 
+        elif data.session_type == "review":
+            # Các câu đến hạn ôn tập (spaced repetition)
+            question_ids = spaced_repetition_service.due_items(
+                supabase,
+                current_user['id'],
+                limit=data.num_questions or 20
+            )
+            
+            if not question_ids:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Không có câu hỏi nào đến hạn ôn tập"
+                )
+                
         elif data.session_type == "weak_topics":
-            # Get random questions from question bank
-            questions = supabase.table('question_bank_items')\
-                .select('id')\
-                .limit(data.num_questions or 15)\
-                .execute()
+            # Tầng (loại câu, category, độ khó) user hay sai → lấy mẫu theo tỉ lệ sai
+            strata = accuracy_service.weak_strata(
+                accuracy_service.get_rollup(supabase, current_user['id'])
+            )
+            
+            if not strata:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Chưa đủ dữ liệu để xác định điểm yếu, hãy làm thêm bài thi"
+                )
+            
+            recent_since = datetime.now(timezone.utc) - timedelta(days=WEAK_TOPICS_RECENT_DAYS)
+            questions = supabase.rpc('weak_topic_candidates', {
+                'p_user_id': current_user['id'],
+                'p_strata': strata,
+                'p_limit': data.num_questions or 15,
+                'p_recent_since': recent_since.isoformat(),
+                'p_categories': data.categories or None,
+                'p_difficulty': data.difficulty or None
+            }).execute()
             
             question_ids = [q['id'] for q in questions.data]
             
@@ -346,14 +318,18 @@ async def get_practice_session(
 @router.get("/sessions/{session_id}/questions")
 async def get_practice_questions(
     session_id: str,
+    hide_answers: bool = False,
     current_user: dict = Depends(get_current_user),
     supabase: Client = Depends(get_supabase_admin)
 ):
-    """Lấy câu hỏi trong practice session"""
+    """
+    Lấy câu hỏi trong practice session (giữ thứ tự của session)
+    hide_answers: ẩn đáp án / giải thích của các câu chưa làm
+    """
     try:
         # Get session
         session = supabase.table('practice_sessions')\
-            .select('*')\
+            .select('question_ids, completed_question_ids')\
             .eq('id', session_id)\
             .eq('user_id', current_user['id'])\
             .single()\
@@ -366,24 +342,42 @@ async def get_practice_questions(
             )
         
         question_ids = session.data['question_ids']
+        completed_ids = session.data.get('completed_question_ids') or []
+        
+        # Payload cache dùng lại đến khi completed_question_ids thay đổi
+        cache_key = f"{session_id}:{hide_answers}"
+        cached = practice_questions_cache.get(cache_key)
+        if cached and cached['completed'] == completed_ids:
+            return cached['payload']
+        
+        # Get questions from question_bank_items (1 query)
+        rows_by_id = {}
+        if question_ids:
+            rows = supabase.table('question_bank_items')\
+                .select(', '.join(ITEM_FIELDS))\
+                .in_('id', question_ids)\
+                .execute()
+            rows_by_id = {row['id']: row for row in rows.data}
         
-        # Get questions from question_bank_items
+        completed_set = set(completed_ids)
         questions = []
         for q_id in question_ids:
-            q = supabase.table('question_bank_items')\
-                .select('*')\
-                .eq('id', q_id)\
-                .execute()
-            
-            if q.data:
-                questions.append(q.data[0])
-        
-        return {
+            q = rows_by_id.get(q_id)
+            if not q:
+                continue
+            if hide_answers and q_id not in completed_set:
+                q = {key: value for key, value in q.items() if key not in ANSWER_FIELDS}
+            questions.append(q)
+        
+        payload = {
             'session_id': session_id,
             'questions': questions,
             'total': len(questions),
-            'completed': len(session.data['completed_question_ids'])
+            'completed': len(completed_ids)
         }
+        practice_questions_cache.set(cache_key, {'completed': list(completed_ids), 'payload': payload})
+        
+        return payload
         
     except HTTPException:
         raise
@@ -401,13 +395,15 @@ async def mark_question_completed(
     current_user: dict = Depends(get_current_user),
     supabase: Client = Depends(get_supabase_admin)
 ):
-    """Đánh dấu câu hỏi đã hoàn thành"""
+    """
+    Đánh dấu câu hỏi đã hoàn thành
+    Không ghi kết quả đúng/sai: lịch ôn tập chỉ cập nhật qua /answer (chấm phía server)
+    """
     try:
         logger.info(f"📝 Marking question {question_id} as completed in session {session_id}")
         
-        # Get session
         session = supabase.table('practice_sessions')\
-            .select('*')\
+            .select('question_ids')\
             .eq('id', session_id)\
             .eq('user_id', current_user['id'])\
             .single()\
@@ -419,34 +415,24 @@ async def mark_question_completed(
                 detail="Practice session not found"
             )
         
-        completed_ids = session.data.get('completed_question_ids', []) or []
+        if question_id not in (session.data.get('question_ids') or []):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Question is not part of this practice session"
+            )
         
-        # Add question_id if not already completed
-        if question_id not in completed_ids:
-            completed_ids.append(question_id)
-            
-            # Update session
-            update_data = {
-                'completed_question_ids': completed_ids
-            }
-            
-            # Check if all questions completed
-            total_questions = len(session.data.get('question_ids', []))
-            if len(completed_ids) >= total_questions:
-                update_data['status'] = 'completed'
-                update_data['completed_at'] = datetime.now(timezone.utc).isoformat()
-            
-            result = supabase.table('practice_sessions')\
-                .update(update_data)\
-                .eq('id', session_id)\
-                .execute()
-            
-            logger.info(f"✅ Question marked as completed. Progress: {len(completed_ids)}/{total_questions}")
+        progress = _complete_question(supabase, session_id, current_user['id'], question_id)
+        
+        if not progress:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Practice session not found"
+            )
         
         return {
             "message": "Question marked as completed",
-            "completed": len(completed_ids),
-            "total": len(session.data.get('question_ids', []))
+            "completed": progress['completed'],
+            "total": progress['total']
         }
         
     except HTTPException:
@@ -461,6 +447,147 @@ async def mark_question_completed(
         )
 
 
+@router.post("/sessions/{session_id}/answer")
+async def answer_practice_question(
+    session_id: str,
+    data: PracticeAnswerRequest,
+    current_user: dict = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase_admin)
+):
+    """
+    Chấm ngay câu trả lời trong practice session và trả về nhận xét
+    Đồng thời đánh dấu câu đã hoàn thành, cập nhật lịch ôn tập, tỉ lệ đúng
+    và bộ đếm đúng/sai của câu hỏi (ghi theo lô)
+    Chỉ lần trả lời đầu tiên của mỗi câu được chấm và ghi nhận; gọi lại trả về kết quả đã lưu
+    """
+    try:
+        session = supabase.table('practice_sessions')\
+            .select('question_ids, completed_question_ids, practice_answers')\
+            .eq('id', session_id)\
+            .eq('user_id', current_user['id'])\
+            .single()\
+            .execute()
+        
+        if not session.data:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Practice session not found"
+            )
+        
+        question_ids = session.data.get('question_ids') or []
+        if data.question_id not in question_ids:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Question is not part of this practice session"
+            )
+        
+        stored = (session.data.get('practice_answers') or {}).get(data.question_id)
+        if stored:
+            completed_ids = session.data.get('completed_question_ids') or []
+            return {**stored, "completed": len(completed_ids), "total": len(question_ids)}
+        
+        question = supabase.table('question_bank_items')\
+            .select('id, question_text, question_type, correct_answer, explanation, marks, category_id, difficulty')\
+            .eq('id', data.question_id)\
+            .single()\
+            .execute()
+        
+        if not question.data:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Question not found"
+            )
+        
+        q = question.data
+        if data.user_answer in (None, "", []):
+            is_correct, marks_obtained, feedback = False, 0, "Chưa trả lời"
+        else:
+            is_correct, marks_obtained, feedback = grading_service.grade_answer(
+                q['question_type'],
+                q['question_text'],
+                data.user_answer,
+                q['correct_answer'],
+                q.get('marks') or 1
+            )
+        
+        result = {
+            "question_id": q['id'],
+            "is_correct": is_correct,
+            "marks_obtained": marks_obtained,
+            "feedback": feedback,
+            "correct_answer": q['correct_answer'],
+            "explanation": q.get('explanation')
+        }
+        
+        progress = _complete_question(supabase, session_id, current_user['id'], data.question_id, result) or {}
+        
+        if progress.get('newly_answered'):
+            try:
+                spaced_repetition_service.record_outcomes(supabase, current_user['id'], [(q['id'], is_correct)])
+                accuracy_service.record_answers(supabase, current_user['id'], [(q, is_correct)])
+                item_stats_service.record_answers(supabase, [(q['id'], is_correct)])
+            except Exception as e:
+                logger.error(f"Update practice stats error: {str(e)}")
+        elif progress.get('answer'):
+            # Lần gọi đồng thời khác đã lưu kết quả trước → trả lại kết quả đó
+            result = progress['answer']
+        
+        return {
+            **result,
+            "completed": progress.get('completed', 0),
+            "total": len(question_ids)
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Answer practice question error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
+def _complete_question(
+    supabase: Client,
+    session_id: str,
+    user_id: str,
+    question_id: str,
+    answer: Optional[dict] = None
+) -> Optional[dict]:
+    """
+    Thêm câu vào completed_question_ids (RPC atomic, idempotent), chuyển session sang completed khi làm hết
+    answer (nếu có) chỉ được lưu vào practice_answers khi câu chưa có kết quả
+    Returns:
+        {completed, total, status, newly_completed, newly_answered, answer} hoặc None nếu không có session
+    """
+    result = supabase.rpc('complete_practice_question', {
+        'p_session_id': session_id,
+        'p_user_id': user_id,
+        'p_question_id': question_id,
+        'p_answer': answer
+    }).execute()
+    
+    if not result.data:
+        return None
+    
+    progress = result.data[0]
+    logger.info(f"✅ Question marked as completed. Progress: {progress['completed']}/{progress['total']}")
+    
+    if progress.get('newly_completed'):
+        _record_practice_activity(supabase, user_id)
+    return progress
+
+
+def _record_practice_activity(supabase: Client, user_id: str):
+    """Hoàn thành luyện tập: cộng vào hoạt động trong ngày và chuỗi ngày học liên tiếp"""
+    try:
+        day = activity_service.record_practice(supabase, user_id)
+        streak_service.record_activity(supabase, user_id, day)
+    except Exception as e:
+        logger.error(f"Record practice activity error: {str(e)}")
+
+
 @router.post("/sessions/{session_id}/complete")
 async def complete_practice_session(
     session_id: str,
@@ -469,6 +596,7 @@ async def complete_practice_session(
 ):
     """Hoàn thành practice session"""
     try:
+        # Chỉ chuyển trạng thái (và ghi nhận hoạt động) nếu session chưa hoàn thành
         result = supabase.table('practice_sessions')\
             .update({
                 'status': 'completed',
@@ -476,13 +604,23 @@ async def complete_practice_session(
             })\
             .eq('id', session_id)\
             .eq('user_id', current_user['id'])\
+            .neq('status', 'completed')\
             .execute()
         
-        if not result.data:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Practice session not found"
-            )
+        if result.data:
+            _record_practice_activity(supabase, current_user['id'])
+        else:
+            existing = supabase.table('practice_sessions')\
+                .select('id')\
+                .eq('id', session_id)\
+                .eq('user_id', current_user['id'])\
+                .execute()
+            
+            if not existing.data:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Practice session not found"
+                )
         
         return {"message": "Practice session completed"}
         
@@ -1,15 +1,79 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, File, HTTPException, Query, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from typing import List, Optional
 from app.models.question_bank import (
     QuestionBankCreate, QuestionBankUpdate, QuestionBankResponse,
-    QuestionBankItemCreate, QuestionBankItemUpdate, QuestionBankItemResponse,
-    ShareQuestionBankRequest, ShareQuestionBankResponse
+    QuestionBankItemCreate, QuestionBankItemUpdate, QuestionBankItemResponse, QuestionBankItemListResponse,
+    QuestionBankItemSearchResponse, ShareQuestionBankRequest, ShareQuestionBankResponse,
+    DuplicateScanResponse, MergeDuplicatesRequest
 )
 from app.api.deps import get_current_user
 from supabase import Client
 from app.core.supabase import get_supabase_admin, get_supabase
+from app.services.question_import_service import question_import_service
+from app.services.progress_service import progress_tracker
+from app.services.search_service import search_service, build_prefix_tsquery, ITEM_FIELDS
+from app.services.dedup_service import dedup_service, DEFAULT_MAX_DISTANCE
+from app.services.similarity_service import similarity_index
+from app.services.cache_service import exam_payload_cache, practice_questions_cache
+from datetime import datetime
+import base64
+import json
+import logging
+import os
+import shutil
+import tempfile
+import uuid
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+MAX_IMPORT_FILE_SIZE = 50 * 1024 * 1024  # 50MB
+BACKGROUND_IMPORT_THRESHOLD = 2 * 1024 * 1024  # Lớn hơn 2MB → chạy background job
+
+
+def _encode_cursor(item: dict) -> str:
+    raw = json.dumps([item['created_at'], item['id']]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    """
+    Giải mã cursor thành (created_at, id) đã chuẩn hoá
+    Giá trị được đưa vào filter or_() nên phải là timestamp ISO / UUID hợp lệ (chặn chèn cú pháp PostgREST)
+    """
+    try:
+        created_at, item_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        created_at = datetime.fromisoformat(str(created_at).replace('Z', '+00:00')).isoformat()
+        item_id = str(uuid.UUID(str(item_id)))
+        return created_at, item_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _get_user_bank_ids(user_id: str, supabase: Client) -> List[str]:
+    banks = supabase.table('question_banks').select('id').eq('user_id', user_id).execute()
+    return [bank['id'] for bank in banks.data]
+
+
+def _run_import_job(job_id: str, tmp_path: str, file_format: str, bank_id: str, supabase: Client):
+    """Background job import câu hỏi từ file tạm"""
+    try:
+        with open(tmp_path, 'rb') as f:
+            summary = question_import_service.import_rows(
+                question_import_service.iter_rows(f, file_format),
+                bank_id,
+                supabase,
+                on_progress=lambda **fields: progress_tracker.update(job_id, **fields)
+            )
+        summary.pop('item_ids', None)
+        progress_tracker.finish(job_id, "completed", **summary)
+        logger.info(f"Import job {job_id} completed: {summary['imported']} imported, {summary['failed']} failed")
+    except Exception as e:
+        logger.error(f"Import job {job_id} failed: {str(e)}")
+        progress_tracker.finish(job_id, "failed", error=str(e))
+    finally:
+        os.unlink(tmp_path)
 
 @router.post("/", response_model=QuestionBankResponse)
 async def create_question_bank(
@@ -72,6 +136,114 @@ async def get_question_banks(
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.get("/search", response_model=QuestionBankItemSearchResponse)
+async def search_questions(
+    q: str = Query(..., min_length=1),
+    bank_id: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    current_user: dict = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase_admin)
+):
+    """Tìm kiếm câu hỏi (không phân biệt dấu) trong ngân hàng của user và ngân hàng công khai"""
+    try:
+        items, total = search_service.search_questions(
+            supabase, current_user['id'], q, bank_id, limit, offset
+        )
+        
+        return {
+            'items': items,
+            'total': total,
+            'limit': limit,
+            'offset': offset
+        }
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/duplicates", response_model=DuplicateScanResponse)
+async def find_duplicate_questions(
+    bank_id: Optional[str] = None,
+    max_distance: int = Query(DEFAULT_MAX_DISTANCE, ge=0, le=10),
+    current_user: dict = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase_admin)
+):
+    """Tìm các nhóm câu hỏi gần trùng lặp trong một bank hoặc giữa tất cả bank của user"""
+    try:
+        bank_ids = _get_user_bank_ids(current_user['id'], supabase)
+        if bank_id:
+            if bank_id not in bank_ids:
+                raise HTTPException(status_code=403, detail="Access denied")
+            bank_ids = [bank_id]
+        
+        if not bank_ids:
+            return {'groups': [], 'scanned': 0, 'backfilled': 0}
+        
+        result = await run_in_threadpool(
+            dedup_service.scan_banks, supabase, bank_ids, max_distance
+        )
+        
+        return {
+            'groups': [{'items': group} for group in result['groups']],
+            'scanned': result['scanned'],
+            'backfilled': result['backfilled']
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/duplicates/merge")
+async def merge_duplicate_questions(
+    data: MergeDuplicatesRequest,
+    current_user: dict = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase_admin)
+):
+    """
+    Gộp câu hỏi trùng vào một câu hỏi giữ lại (RPC merge_duplicate_questions, 1 transaction):
+    chuyển đề thi, lịch sử trả lời, lịch ôn tập, practice session sang câu giữ lại,
+    cộng dồn thống kê rồi xóa bản trùng
+    Từ chối (400) nếu bản trùng nằm trong đề của user khác, hoặc phải bỏ dòng trùng khỏi đề đã có lượt làm bài
+    """
+    try:
+        duplicate_ids = [item_id for item_id in dict.fromkeys(data.duplicate_ids) if item_id != data.keep_id]
+        if not duplicate_ids:
+            raise HTTPException(status_code=400, detail="No duplicates to merge")
+        
+        bank_ids = _get_user_bank_ids(current_user['id'], supabase)
+        if not bank_ids:
+            raise HTTPException(status_code=403, detail="Access denied")
+        
+        items = supabase.table('question_bank_items')\
+            .select('id, question_bank_id')\
+            .in_('id', [data.keep_id] + duplicate_ids)\
+            .in_('question_bank_id', bank_ids)\
+            .execute()
+        
+        if len(items.data) != len(duplicate_ids) + 1:
+            raise HTTPException(status_code=404, detail="Question not found")
+        
+        supabase.rpc('merge_duplicate_questions', {
+            'p_user_id': current_user['id'],
+            'p_keep_id': data.keep_id,
+            'p_duplicate_ids': duplicate_ids
+        }).execute()
+        
+        similarity_index.invalidate_items(items.data)
+        # Câu hỏi trong đề / practice session đã đổi → bỏ cache
+        exam_payload_cache.clear()
+        practice_questions_cache.clear()
+        
+        logger.info(f"Merged {len(duplicate_ids)} duplicates into {data.keep_id}")
+        return {
+            "message": "Duplicates merged successfully",
+            "keep_id": data.keep_id,
+            "merged": len(duplicate_ids)
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/{bank_id}", response_model=QuestionBankResponse)
 async def get_question_bank(
     bank_id: str,
@@ -140,6 +312,7 @@ async def delete_question_bank(
             raise HTTPException(status_code=403, detail="Access denied")
         
         supabase.table('question_banks').delete().eq('id', bank_id).execute()
+        similarity_index.invalidate_banks([bank_id])
         
         return {"message": "Question bank deleted successfully"}
     except HTTPException:
@@ -169,37 +342,160 @@ async def add_question_to_bank(
             'p_metadata': {'bank_id': bank_id}
         }).execute()
         
+        fingerprint = dedup_service.fingerprint(data.question_text, data.options)
         result = supabase.table('question_bank_items').insert({
             'question_bank_id': bank_id,
-            **data.dict()
+            **data.dict(),
+            'text_fingerprint': fingerprint
         }).execute()
+        item = result.data[0]
+        similarity_index.invalidate_items([item])
         
-        return result.data[0]
+        # Cảnh báo câu hỏi gần trùng trong các bank của user
+        item['possible_duplicate_ids'] = dedup_service.find_similar_in_banks(
+            supabase, fingerprint, _get_user_bank_ids(current_user['id'], supabase), exclude_id=item['id']
+        )
+        
+        return item
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@router.get("/{bank_id}/items", response_model=List[QuestionBankItemResponse])
+@router.post("/{bank_id}/import")
+async def bulk_import_questions(
+    bank_id: str,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    current_user: dict = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase_admin)
+):
+    """
+    Import hàng loạt câu hỏi từ file CSV / XLSX / JSON
+    File nhỏ được import ngay; file lớn chạy background job (xem /import-jobs/{job_id})
+    """
+    try:
+        # Check ownership
+        bank = supabase.table('question_banks').select('id, user_id').eq('id', bank_id).execute()
+        if not bank.data or bank.data[0]['user_id'] != current_user['id']:
+            raise HTTPException(status_code=403, detail="Access denied")
+        
+        file_format = question_import_service.detect_format(file.filename)
+        if file_format == 'unknown':
+            raise HTTPException(status_code=400, detail="Unsupported file type. Allowed types: .csv, .xlsx, .json, .jsonl")
+        
+        file.file.seek(0, os.SEEK_END)
+        file_size = file.file.tell()
+        file.file.seek(0)
+        if file_size > MAX_IMPORT_FILE_SIZE:
+            raise HTTPException(
+                status_code=400,
+                detail=f"File too large. Maximum size: {MAX_IMPORT_FILE_SIZE / 1024 / 1024}MB"
+            )
+        
+        # Track analytics
+        supabase.rpc('track_action', {
+            'p_user_id': current_user['id'],
+            'p_action_type': 'bulk_import_questions',
+            'p_metadata': {'bank_id': bank_id, 'format': file_format, 'file_size': file_size}
+        }).execute()
+        
+        if file_size > BACKGROUND_IMPORT_THRESHOLD:
+            # UploadFile bị đóng sau khi trả response → copy ra file tạm cho job
+            suffix = os.path.splitext(file.filename)[1]
+            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+                shutil.copyfileobj(file.file, tmp)
+                tmp_path = tmp.name
+            
+            job_id = str(uuid.uuid4())
+            progress_tracker.start(
+                job_id,
+                user_id=current_user['id'],
+                bank_id=bank_id,
+                total_rows=0,
+                imported=0,
+                failed=0
+            )
+            background_tasks.add_task(_run_import_job, job_id, tmp_path, file_format, bank_id, supabase)
+            
+            return {
+                'job_id': job_id,
+                'status': 'processing',
+                'status_url': f"/question-banks/import-jobs/{job_id}"
+            }
+        
+        summary = await run_in_threadpool(
+            question_import_service.import_rows,
+            question_import_service.iter_rows(file.file, file_format),
+            bank_id,
+            supabase
+        )
+        summary.pop('item_ids', None)
+        
+        return {'status': 'completed', **summary}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/import-jobs/{job_id}")
+async def get_import_job(
+    job_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Trạng thái background job import câu hỏi"""
+    job = progress_tracker.get(job_id)
+    if not job or job.get('user_id') != current_user['id']:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    
+    job.pop('version', None)
+    return {'job_id': job_id, **job}
+
+@router.get(
+    "/{bank_id}/items",
+    response_model=List[QuestionBankItemListResponse],
+    response_model_exclude_unset=True
+)
 async def get_questions_from_bank(
     bank_id: str,
+    response: Response,
     category_id: Optional[str] = None,
     difficulty: Optional[str] = None,
     tags: Optional[str] = Query(None),  # Comma-separated
     search: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None),  # Comma-separated, ví dụ: id,question_text,question_type
+    include_total: bool = False,
     current_user: dict = Depends(get_current_user),
     supabase: Client = Depends(get_supabase_admin)
 ):
-    """Lấy câu hỏi từ ngân hàng"""
+    """
+    Lấy câu hỏi từ ngân hàng
+    - limit + cursor: phân trang keyset, cursor trang sau nằm trong header X-Next-Cursor
+    - fields: chỉ lấy các cột cần thiết (id, created_at luôn có)
+    - include_total: trả tổng số câu hỏi khớp filter trong header X-Total-Count
+    """
     try:
         # Check access
-        bank = supabase.table('question_banks').select('*').eq('id', bank_id).execute()
+        bank = supabase.table('question_banks').select('user_id, is_public').eq('id', bank_id).execute()
         if not bank.data:
             raise HTTPException(status_code=404, detail="Question bank not found")
         if bank.data[0]['user_id'] != current_user['id'] and not bank.data[0]['is_public']:
             raise HTTPException(status_code=403, detail="Access denied")
         
-        query = supabase.table('question_bank_items').select('*').eq('question_bank_id', bank_id)
+        columns = ITEM_FIELDS
+        if fields:
+            requested = [f.strip() for f in fields.split(',') if f.strip()]
+            unknown = [f for f in requested if f not in ITEM_FIELDS]
+            if unknown:
+                raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+            columns = ['id', 'created_at'] + [f for f in requested if f not in ('id', 'created_at')]
+        
+        select_args = {'count': 'exact'} if include_total else {}
+        query = supabase.table('question_bank_items')\
+            .select(', '.join(columns), **select_args)\
+            .eq('question_bank_id', bank_id)
         
         # Apply filters
         if category_id:
@@ -210,11 +506,32 @@ async def get_questions_from_bank(
             tag_list = tags.split(',')
             query = query.contains('tags', tag_list)
         if search:
-            query = query.ilike('question_text', f'%{search}%')
-        
-        result = query.order('created_at', desc=True).execute()
-        
-        return result.data
+            # Full-text index, không phân biệt dấu
+            tsquery = build_prefix_tsquery(search)
+            if tsquery:
+                query = query.text_search('search_vector', tsquery, options={'config': 'simple'})
+        
+        if cursor:
+            created_at, item_id = _decode_cursor(cursor)
+            query = query.or_(
+                f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{item_id})'
+            )
+        
+        query = query.order('created_at', desc=True).order('id', desc=True)
+        if limit:
+            # Lấy dư 1 dòng để biết còn trang sau hay không
+            query = query.limit(limit + 1)
+        
+        result = query.execute()
+        items = result.data
+        
+        if limit and len(items) > limit:
+            items = items[:limit]
+            response.headers['X-Next-Cursor'] = _encode_cursor(items[-1])
+        if include_total:
+            response.headers['X-Total-Count'] = str(result.count or 0)
+        
+        return items
     except HTTPException:
         raise
     except Exception as e:
@@ -238,11 +555,26 @@ async def update_question_in_bank(
         update_data = data.dict(exclude_unset=True)
         update_data['updated_at'] = 'now()'
         
+        # Nội dung thay đổi → tính lại fingerprint
+        if 'question_text' in update_data or 'options' in update_data:
+            current = supabase.table('question_bank_items')\
+                .select('question_text, options')\
+                .eq('id', item_id)\
+                .eq('question_bank_id', bank_id)\
+                .execute()
+            if not current.data:
+                raise HTTPException(status_code=404, detail="Question not found")
+            content = {**current.data[0], **update_data}
+            update_data['text_fingerprint'] = dedup_service.fingerprint_item(content)
+        
         result = supabase.table('question_bank_items').update(update_data).eq('id', item_id).eq('question_bank_id', bank_id).execute()
         
         if not result.data:
             raise HTTPException(status_code=404, detail="Question not found")
         
+        similarity_index.invalidate_items(result.data)
+        exam_payload_cache.clear()
+        
         return result.data[0]
     except HTTPException:
         raise
@@ -264,6 +596,8 @@ async def delete_question_from_bank(
             raise HTTPException(status_code=403, detail="Access denied")
         
         supabase.table('question_bank_items').delete().eq('id', item_id).eq('question_bank_id', bank_id).execute()
+        similarity_index.invalidate_banks([bank_id])
+        exam_payload_cache.clear()
         
         return {"message": "Question deleted successfully"}
     except HTTPException:
@@ -313,52 +647,46 @@ async def import_shared_bank(
     """Import ngân hàng câu hỏi được chia sẻ"""
     try:
         # Find bank by share code
-        bank = supabase.table('question_banks').select('*').eq('shared_code', share_code).execute()
+        bank = supabase.table('question_banks').select('id, name, description').eq('shared_code', share_code).execute()
         
         if not bank.data:
             raise HTTPException(status_code=404, detail="Question bank not found")
         
         original_bank = bank.data[0]
         
-        # Check if already imported
-        existing = supabase.table('question_banks').select('*').eq('user_id', current_user['id']).ilike('name', f"%{original_bank['name']}%").execute()
+        # Check if already imported (exact name, uses (user_id, name) index)
+        existing = supabase.table('question_banks')\
+            .select('id')\
+            .eq('user_id', current_user['id'])\
+            .eq('name', original_bank['name'])\
+            .limit(1)\
+            .execute()
         
         new_name = f"{original_bank['name']} (Copy)" if existing.data else original_bank['name']
         
-        # Create copy of bank
-        new_bank = supabase.table('question_banks').insert({
-            'user_id': current_user['id'],
-            'name': new_name,
-            'description': original_bank['description'],
-            'is_public': False
+        # Create copy of bank and all questions server-side (INSERT ... SELECT)
+        clone = supabase.rpc('clone_question_bank', {
+            'p_source_bank_id': original_bank['id'],
+            'p_user_id': current_user['id'],
+            'p_name': new_name,
+            'p_description': original_bank['description']
         }).execute()
         
-        # Copy all questions
-        questions = supabase.table('question_bank_items').select('*').eq('question_bank_id', original_bank['id']).execute()
-        
-        for q in questions.data:
-            q_copy = q.copy()
-            q_copy.pop('id', None)
-            q_copy.pop('created_at', None)
-            q_copy.pop('updated_at', None)
-            q_copy['question_bank_id'] = new_bank.data[0]['id']
-            q_copy['times_used'] = 0
-            q_copy['times_correct'] = 0
-            q_copy['times_incorrect'] = 0
-            
-            supabase.table('question_bank_items').insert(q_copy).execute()
+        new_bank_id = clone.data[0]['bank_id']
+        similarity_index.invalidate_banks([new_bank_id])
+        questions_imported = clone.data[0]['questions_imported']
         
         # Track analytics
         supabase.rpc('track_action', {
             'p_user_id': current_user['id'],
             'p_action_type': 'import_question_bank',
-            'p_metadata': {'original_bank_id': original_bank['id'], 'new_bank_id': new_bank.data[0]['id']}
+            'p_metadata': {'original_bank_id': original_bank['id'], 'new_bank_id': new_bank_id}
         }).execute()
         
         return {
             'message': 'Question bank imported successfully',
-            'bank_id': new_bank.data[0]['id'],
-            'questions_imported': len(questions.data)
+            'bank_id': new_bank_id,
+            'questions_imported': questions_imported
         }
     except HTTPException:
         raise
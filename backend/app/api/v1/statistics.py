@@ -6,6 +6,8 @@ from app.models.statistics import (
     UserStats, ExamHistoryItem, ScoreDataPoint,
     QuestionTypeStats, WeakAreaItem
 )
+from app.services.streak_service import current_streak
+from app.services.activity_service import activity_service, user_today
 from typing import List
 from datetime import datetime, timedelta, timezone
 import logging
@@ -50,14 +52,15 @@ async def get_user_statistics(
             wrong_count = await _count_wrong_answers(current_user["id"], supabase)
             stats_data["wrong_answers_count"] = wrong_count
 
-            # Calculate streak days
-            streak = await _calculate_streak_days(current_user["id"], supabase)
-            stats_data["streak_days"] = streak
-            
+            # Streak lưu sẵn, chỉ kiểm tra còn hiệu lực
+            stats_data["streak_days"] = current_streak(
+                stats_data.get("current_streak"),
+                stats_data.get("last_active_date"),
+                user_today(current_user)
+            )
             
             return UserStats(**stats_data)
         else:
-            streak = await _calculate_streak_days(current_user["id"], supabase)
             # Return default stats if no data
             return UserStats(
                 user_id=current_user["id"],
@@ -69,7 +72,7 @@ async def get_user_statistics(
                 total_question_banks=total_question_banks,
                 score_trend=0,
                 wrong_answers_count=0,
-                streaks_day=streak
+                streak_days=0
             )
             
     except Exception as e:
@@ -82,85 +85,10 @@ async def get_user_statistics(
         )
 
 async def _calculate_score_trend(user_id: str, supabase: Client) -> float:
-    """Calculate score trend comparing recent vs previous period"""
+    """Calculate score trend comparing recent vs previous period (RPC score_trend, 1 query)"""
     try:
-        now = datetime.now(timezone.utc)
-        last_7_days = now - timedelta(days=7)
-        prev_7_days = now - timedelta(days=14)
-        
-        # Get scores from last 7 days
-        recent = supabase.table("user_exams")\
-            .select("exam_id, total_score")\
-            .eq("user_id", user_id)\
-            .eq("status", "graded")\
-            .gte("submitted_at", last_7_days.isoformat())\
-            .execute()
-        
-        if not recent.data:
-            return 0
-        
-        # Calculate average percentage for recent period
-        recent_scores = []
-        for ue in recent.data:
-            try:
-                exam = supabase.table("exams")\
-                    .select("total_marks")\
-                    .eq("id", ue["exam_id"])\
-                    .single()\
-                    .execute()
-                
-                if exam.data and exam.data.get("total_marks", 0) > 0:
-                    total_score = float(ue.get("total_score", 0))
-                    max_score = float(exam.data["total_marks"])
-                    percentage = (total_score / max_score) * 100
-                    recent_scores.append(percentage)
-            except Exception as e:
-                logger.error(f"Error calculating score for exam {ue.get('exam_id')}: {str(e)}")
-                continue
-        
-        if not recent_scores:
-            return 0
-        
-        recent_avg = sum(recent_scores) / len(recent_scores)
-        
-        # Get scores from previous 7 days
-        previous = supabase.table("user_exams")\
-            .select("exam_id, total_score")\
-            .eq("user_id", user_id)\
-            .eq("status", "graded")\
-            .gte("submitted_at", prev_7_days.isoformat())\
-            .lt("submitted_at", last_7_days.isoformat())\
-            .execute()
-        
-        if not previous.data:
-            return round(recent_avg, 1) if recent_avg > 50 else 0
-        
-        # Calculate average percentage for previous period
-        previous_scores = []
-        for ue in previous.data:
-            try:
-                exam = supabase.table("exams")\
-                    .select("total_marks")\
-                    .eq("id", ue["exam_id"])\
-                    .single()\
-                    .execute()
-                
-                if exam.data and exam.data.get("total_marks", 0) > 0:
-                    total_score = float(ue.get("total_score", 0))
-                    max_score = float(exam.data["total_marks"])
-                    percentage = (total_score / max_score) * 100
-                    previous_scores.append(percentage)
-            except Exception as e:
-                logger.error(f"Error calculating score for exam {ue.get('exam_id')}: {str(e)}")
-                continue
-        
-        if not previous_scores:
-            return round(recent_avg, 1) if recent_avg > 50 else 0
-        
-        previous_avg = sum(previous_scores) / len(previous_scores)
-        trend = recent_avg - previous_avg
-        
-        return round(trend, 1)
+        trend = supabase.rpc("score_trend", {"p_user_id": user_id}).execute()
+        return float(trend.data or 0)
         
     except Exception as e:
         logger.error(f"Calculate trend error: {str(e)}")
@@ -171,23 +99,13 @@ async def _calculate_score_trend(user_id: str, supabase: Client) -> float:
 async def _count_wrong_answers(user_id: str, supabase: Client) -> int:
     """Count wrong answers that need review"""
     try:
-        # Get all user exam IDs
-        user_exams = supabase.table("user_exams")\
-            .select("id")\
-            .eq("user_id", user_id)\
-            .eq("status", "graded")\
-            .execute()
-        
-        if not user_exams.data:
-            return 0
-        
-        user_exam_ids = [ue["id"] for ue in user_exams.data]
-        
-        # Count wrong answers
+        # Count wrong answers (lọc thẳng theo user_id, chỉ bài đã chấm)
         wrong_answers = supabase.table("user_answers")\
-            .select("id", count="exact")\
-            .in_("user_exam_id", user_exam_ids)\
+            .select("id, user_exams!inner(status)", count="exact")\
+            .eq("user_id", user_id)\
+            .eq("user_exams.status", "graded")\
             .eq("is_correct", False)\
+            .limit(1)\
             .execute()
         
         return wrong_answers.count or 0
@@ -272,82 +190,23 @@ async def get_scores_for_chart(
     Lấy dữ liệu điểm số để vẽ biểu đồ
     """
     try:
-        cutoff_date = datetime.now(timezone.utc) - timedelta(days=days)
+        # Điểm trung bình theo ngày (theo múi giờ của user), 1 query trên bảng tổng hợp
+        cutoff_date = user_today(current_user) - timedelta(days=days)
         
         logger.info(f"📊 Getting chart data for user {current_user['id']} from {cutoff_date}")
         
-        # Get user exams from last N days
-        user_exams = supabase.table("user_exams")\
-            .select("id, exam_id, total_score, submitted_at")\
-            .eq("user_id", current_user["id"])\
-            .eq("status", "graded")\
-            .gte("submitted_at", cutoff_date.isoformat())\
-            .order("submitted_at")\
-            .execute()
-        
-        logger.info(f"📊 Found {len(user_exams.data) if user_exams.data else 0} graded exams")
+        activity = activity_service.get_days(supabase, current_user["id"], cutoff_date)
         
-        if not user_exams.data:
-            logger.warning("📊 No exam data found for chart")
-            return []
-        
-        scores = []
-        for ue in user_exams.data:
-            try:
-                # Validate data
-                if not ue.get("submitted_at"):
-                    logger.warning(f"⚠️ Exam {ue.get('id')} has no submitted_at")
-                    continue
-                
-                if ue.get("total_score") is None:
-                    logger.warning(f"⚠️ Exam {ue.get('id')} has no total_score")
-                    continue
-                
-                # Get exam details
-                exam = supabase.table("exams")\
-                    .select("title, total_marks")\
-                    .eq("id", ue["exam_id"])\
-                    .single()\
-                    .execute()
-                
-                if not exam.data:
-                    logger.warning(f"⚠️ Exam {ue['exam_id']} not found in exams table")
-                    continue
-                
-                if not exam.data.get("total_marks") or exam.data["total_marks"] <= 0:
-                    logger.warning(f"⚠️ Exam {ue['exam_id']} has invalid total_marks: {exam.data.get('total_marks')}")
-                    continue
-                
-                # Calculate percentage
-                total_score = float(ue["total_score"])
-                max_score = float(exam.data["total_marks"])
-                percentage = (total_score / max_score) * 100
-                
-                # Format date
-                submitted_at = ue["submitted_at"]
-                if isinstance(submitted_at, str):
-                    # Handle different datetime formats
-                    if 'T' in submitted_at:
-                        date_str = submitted_at.split('T')[0]
-                    else:
-                        date_str = submitted_at[:10]
-                else:
-                    date_str = submitted_at.strftime("%Y-%m-%d")
-                
-                score_point = ScoreDataPoint(
-                    date=date_str,
-                    score=round(percentage, 2),
-                    exam_title=exam.data.get("title", "Untitled Exam")
-                )
-                scores.append(score_point)
-                
-                logger.info(f"✅ Score point: {date_str} | {percentage:.2f}% | {exam.data.get('title')}")
-                
-            except Exception as e:
-                logger.error(f"❌ Error processing exam {ue.get('id')}: {str(e)}")
-                import traceback
-                logger.error(traceback.format_exc())
-                continue
+        scores = [
+            ScoreDataPoint(
+                date=day["local_date"],
+                score=round(day["score_pct_sum"] / day["scored_exams"], 2),
+                exam_title=f"{day['scored_exams']} bài thi",
+                exams_count=day["scored_exams"]
+            )
+            for day in activity
+            if day["scored_exams"] > 0
+        ]
         
         logger.info(f"📊 Returning {len(scores)} score points")
         return scores
@@ -371,64 +230,30 @@ async def get_question_type_statistics(
     Hỗ trợ: multiple_choice, multiple_answer, true_false, short_answer, essay, fill_blank, ordering
     """
     try:
-        # Get all user exam IDs
-        user_exams = supabase.table("user_exams")\
-            .select("id")\
-            .eq("user_id", current_user["id"])\
-            .eq("status", "graded")\
-            .execute()
-        
-        if not user_exams.data:
-            return []
-        
-        user_exam_ids = [ue["id"] for ue in user_exams.data]
-        
-        # Get all answers
+        # Câu trả lời của các bài đã chấm (graded) của user, kèm loại câu hỏi (1 query)
         answers = supabase.table("user_answers")\
-            .select("id, exam_question_id, is_correct")\
-            .in_("user_exam_id", user_exam_ids)\
+            .select("question_type, is_correct, user_exams!inner(status)")\
+            .eq("user_id", current_user["id"])\
+            .eq("user_exams.status", "graded")\
+            .not_.is_("is_correct", "null")\
             .execute()
         
         if not answers.data:
             return []
         
-        # Get question types for each answer
         type_stats = {}
         
         for ans in answers.data:
-            try:
-                # Get exam_question
-                exam_question = supabase.table("exam_questions")\
-                    .select("question_bank_item_id")\
-                    .eq("id", ans["exam_question_id"])\
-                    .single()\
-                    .execute()
-                
-                if not exam_question.data:
-                    continue
-                
-                # Get question from question_bank_items
-                question = supabase.table("question_bank_items")\
-                    .select("question_type")\
-                    .eq("id", exam_question.data["question_bank_item_id"])\
-                    .single()\
-                    .execute()
-                
-                if not question.data:
-                    continue
-                
-                q_type = question.data["question_type"]
-                
-                if q_type not in type_stats:
-                    type_stats[q_type] = {"total": 0, "correct": 0}
-                
-                type_stats[q_type]["total"] += 1
-                if ans.get("is_correct"):
-                    type_stats[q_type]["correct"] += 1
-                    
-            except Exception as e:
-                logger.error(f"Error processing answer {ans.get('id')}: {str(e)}")
+            q_type = ans.get("question_type")
+            if not q_type:
                 continue
+            
+            if q_type not in type_stats:
+                type_stats[q_type] = {"total": 0, "correct": 0}
+            
+            type_stats[q_type]["total"] += 1
+            if ans.get("is_correct"):
+                type_stats[q_type]["correct"] += 1
         
         # Convert to response format
         result = []
@@ -467,22 +292,12 @@ async def get_weak_areas(
     Phân tích điểm yếu - Các câu hỏi hay sai
     """
     try:
-        # Get all user exam IDs
-        user_exams = supabase.table("user_exams")\
-            .select("id")\
-            .eq("user_id", current_user["id"])\
-            .eq("status", "graded")\
-            .execute()
-        
-        if not user_exams.data:
-            return []
-        
-        user_exam_ids = [ue["id"] for ue in user_exams.data]
-        
-        # Get all answers
+        # Câu trả lời của các bài đã chấm (graded) của user (1 query)
         answers = supabase.table("user_answers")\
-            .select("*")\
-            .in_("user_exam_id", user_exam_ids)\
+            .select("question_bank_item_id, is_correct, user_exams!inner(status)")\
+            .eq("user_id", current_user["id"])\
+            .eq("user_exams.status", "graded")\
+            .not_.is_("is_correct", "null")\
             .execute()
         
         if not answers.data:
@@ -490,46 +305,21 @@ async def get_weak_areas(
         
         # Group by question_bank_item_id (the actual question)
         question_stats = {}
-        question_texts = {}
         
         for ans in answers.data:
-            try:
-                # Get exam_question
-                exam_question = supabase.table("exam_questions")\
-                    .select("question_bank_item_id")\
-                    .eq("id", ans["exam_question_id"])\
-                    .single()\
-                    .execute()
-                
-                if not exam_question.data:
-                    continue
-                
-                qb_item_id = exam_question.data["question_bank_item_id"]
-                
-                # Initialize stats for this question
-                if qb_item_id not in question_stats:
-                    question_stats[qb_item_id] = {
-                        "attempted": 0,
-                        "correct": 0
-                    }
-                    
-                    # Get question text
-                    question = supabase.table("question_bank_items")\
-                        .select("question_text")\
-                        .eq("id", qb_item_id)\
-                        .single()\
-                        .execute()
-                    
-                    if question.data:
-                        question_texts[qb_item_id] = question.data.get("question_text", "Unknown question")
-                
-                question_stats[qb_item_id]["attempted"] += 1
-                if ans.get("is_correct"):
-                    question_stats[qb_item_id]["correct"] += 1
-                    
-            except Exception as e:
-                logger.error(f"Error processing answer {ans.get('id')}: {str(e)}")
+            qb_item_id = ans.get("question_bank_item_id")
+            if not qb_item_id:
                 continue
+            
+            if qb_item_id not in question_stats:
+                question_stats[qb_item_id] = {
+                    "attempted": 0,
+                    "correct": 0
+                }
+            
+            question_stats[qb_item_id]["attempted"] += 1
+            if ans.get("is_correct"):
+                question_stats[qb_item_id]["correct"] += 1
         
         # Calculate accuracy and filter
         weak_areas = []
@@ -539,7 +329,7 @@ async def get_weak_areas(
             # Only include questions with low accuracy and attempted at least twice
             if accuracy < 70 and stats["attempted"] >= 2:
                 weak_areas.append({
-                    "question_text": question_texts.get(qb_id, "Unknown question"),
+                    "question_bank_item_id": qb_id,
                     "times_attempted": stats["attempted"],
                     "times_correct": stats["correct"],
                     "accuracy": round(accuracy, 2)
@@ -547,8 +337,26 @@ async def get_weak_areas(
         
         # Sort by accuracy (lowest first)
         weak_areas.sort(key=lambda x: x["accuracy"])
+        weak_areas = weak_areas[:limit]
         
-        return [WeakAreaItem(**wa) for wa in weak_areas[:limit]]
+        # Chỉ lấy nội dung của các câu được trả về (1 query)
+        question_texts = {}
+        if weak_areas:
+            questions = supabase.table("question_bank_items")\
+                .select("id, question_text")\
+                .in_("id", [wa["question_bank_item_id"] for wa in weak_areas])\
+                .execute()
+            question_texts = {q["id"]: q.get("question_text") for q in questions.data}
+        
+        return [
+            WeakAreaItem(
+                question_text=question_texts.get(wa["question_bank_item_id"]) or "Unknown question",
+                times_attempted=wa["times_attempted"],
+                times_correct=wa["times_correct"],
+                accuracy=wa["accuracy"]
+            )
+            for wa in weak_areas
+        ]
         
     except Exception as e:
         logger.error(f"Get weak areas error: {str(e)}")
@@ -557,70 +365,4 @@ async def get_weak_areas(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
-        )
-
-
-async def _calculate_streak_days(user_id: str, supabase: Client) -> int:
-    """Calculate consecutive days user has taken exams"""
-    try:
-        # Get all graded exams sorted by date
-        user_exams = supabase.table("user_exams")\
-            .select("submitted_at")\
-            .eq("user_id", user_id)\
-            .eq("status", "graded")\
-            .not_.is_("submitted_at", "null")\
-            .order("submitted_at", desc=True)\
-            .execute()
-        
-        if not user_exams.data:
-            return 0
-        
-        # Extract unique dates
-        dates = []
-        for ue in user_exams.data:
-            submitted_at = ue["submitted_at"]
-            if isinstance(submitted_at, str):
-                date_str = submitted_at.split('T')[0]
-            else:
-                date_str = submitted_at.strftime("%Y-%m-%d")
-            
-            if date_str not in dates:
-                dates.append(date_str)
-        
-        if not dates:
-            return 0
-        
-        # Convert to datetime objects and sort
-        from datetime import datetime, timedelta, timezone
-        date_objects = sorted([datetime.fromisoformat(d) for d in dates], reverse=True)
-        
-        # Calculate streak
-        streak = 0
-        today = datetime.now(timezone.utc).date()
-        
-        for i, date in enumerate(date_objects):
-            date_only = date.date()
-            
-            if i == 0:
-                # First date should be today or yesterday
-                days_diff = (today - date_only).days
-                if days_diff > 1:
-                    return 0  # No active streak
-                streak = 1
-            else:
-                # Check if consecutive
-                prev_date = date_objects[i-1].date()
-                days_diff = (prev_date - date_only).days
-                
-                if days_diff == 1:
-                    streak += 1
-                else:
-                    break  # Streak broken
-        
-        return streak
-        
-    except Exception as e:
-        logger.error(f"Calculate streak error: {str(e)}")
-        import traceback
-        logger.error(traceback.format_exc())
-        return 0
\ No newline at end of file
+        )
\ No newline at end of file
@@ -8,7 +8,13 @@ from app.models.submission import (
     ExamResultResponse, QuestionResult
 )
 from app.services.grading_service import grading_service
-from datetime import datetime, timezone
+from app.services.spaced_repetition_service import spaced_repetition_service
+from app.services.accuracy_service import accuracy_service
+from app.services.item_stats_service import item_stats_service
+from app.services.streak_service import activity_date, streak_service
+from app.services.activity_service import activity_service, user_timezone
+from app.services.shuffle_service import attempt_seed, new_seed, shuffle_exam_questions
+from datetime import datetime, timedelta, timezone
 import logging
 import traceback
 import json
@@ -28,6 +34,21 @@ def serialize_answer(answer):
     return str(answer)
 
 
+def order_for_attempt(exam_questions: list, user_exam: dict, exam: dict) -> list:
+    """
+    Sắp xếp exam_questions theo thứ tự học sinh đã thấy ở lượt làm bài (tính lại từ shuffle_seed)
+    Returns:
+        [(exam_question, option_order hoặc None)]
+    """
+    ordered = shuffle_exam_questions(
+        [{**(eq.get("question_bank_items") or {}), "exam_question": eq} for eq in exam_questions],
+        attempt_seed(user_exam),
+        shuffle_questions=exam.get("shuffle_questions", False),
+        shuffle_options=exam.get("shuffle_options", False)
+    )
+    return [(q["exam_question"], q.get("option_order")) for q in ordered]
+
+
 @router.post("/start", response_model=StartExamResponse)
 async def start_exam(
     data: StartExamRequest,
@@ -58,11 +79,53 @@ async def start_exam(
                 detail="Exam is not published yet"
             )
         
+        # Lượt đang làm dở (vd. tải lại trang) còn trong thời gian làm bài → dùng lại để giữ nguyên seed đảo câu hỏi
+        # Lượt đã quá giờ → chuyển sang expired, không mở lại đồng hồ đã hết
+        duration = exam.data.get("duration_minutes")
+        existing = supabase.table("user_exams")\
+            .select("id, started_at")\
+            .eq("user_id", current_user["id"])\
+            .eq("exam_id", data.exam_id)\
+            .eq("status", "in_progress")\
+            .order("started_at", desc=True)\
+            .execute()
+        
+        now = datetime.now(timezone.utc)
+        resumable = None
+        expired_ids = []
+        for attempt in existing.data or []:
+            started_at = datetime.fromisoformat(str(attempt["started_at"]).replace("Z", "+00:00"))
+            if started_at.tzinfo is None:
+                started_at = started_at.replace(tzinfo=timezone.utc)
+            if duration and now >= started_at + timedelta(minutes=duration):
+                expired_ids.append(attempt["id"])
+            elif resumable is None:
+                resumable = attempt
+        
+        if expired_ids:
+            supabase.table("user_exams")\
+                .update({"status": "expired"})\
+                .in_("id", expired_ids)\
+                .eq("status", "in_progress")\
+                .execute()
+            logger.info(f"Expired {len(expired_ids)} stale attempts of exam {data.exam_id}")
+        
+        if resumable:
+            logger.info(f"User {current_user['email']} resumed exam {data.exam_id}")
+            return StartExamResponse(
+                user_exam_id=resumable["id"],
+                exam_id=data.exam_id,
+                started_at=resumable["started_at"],
+                duration=duration,
+                resumed=True
+            )
+        
         # Create user_exam record
         user_exam = {
             "user_id": current_user["id"],
             "exam_id": data.exam_id,
-            "status": "in_progress"
+            "status": "in_progress",
+            "shuffle_seed": new_seed()
         }
         
         response = supabase.table("user_exams").insert(user_exam).execute()
@@ -139,6 +202,7 @@ async def submit_answer(
             # Insert new answer
             answer = {
                 "user_exam_id": data.user_exam_id,
+                "user_id": current_user["id"],
                 "exam_question_id": data.exam_question_id,
                 "user_answer": user_answer_value
             }
@@ -215,6 +279,7 @@ async def submit_exam(
             .select("*, question_bank_items(*)")\
             .eq("exam_id", user_exam_data["exam_id"])\
             .order("order_index")\
+            .order("id")\
             .execute()
         
         if not exam_questions.data:
@@ -231,11 +296,13 @@ async def submit_exam(
         
         answer_map = {ans["exam_question_id"]: ans for ans in user_answers.data}
         
-        # Grade each question
+        # Grade each question (kết quả theo thứ tự học sinh đã thấy)
         total_score = 0
         results = []
+        review_outcomes = []
+        graded_answers = []
         
-        for exam_question in exam_questions.data:
+        for exam_question, option_order in order_for_attempt(exam_questions.data, user_exam_data, exam_data):
             question = exam_question.get("question_bank_items")
             
             if not question:
@@ -267,6 +334,9 @@ async def submit_exam(
                 )
             
             total_score += marks_obtained
+            review_outcomes.append((question["id"], is_correct))
+            if user_answer_record:
+                graded_answers.append((question, is_correct))
             
             if user_answer_record:
                 supabase.table("user_answers")\
@@ -287,7 +357,8 @@ async def submit_exam(
                 marks_obtained=marks_obtained,
                 marks=float(exam_question["marks"]),
                 explanation=question.get("explanation"),
-                ai_feedback=feedback
+                ai_feedback=feedback,
+                option_order=option_order
             ))
         
         # Calculate time spent
@@ -321,7 +392,12 @@ async def submit_exam(
             .execute()
         
         # Update user statistics
-        _update_user_statistics(current_user["id"], total_score, time_spent, supabase)
+        score_pct = (total_score / exam_data["total_marks"] * 100) if exam_data["total_marks"] > 0 else None
+        active_day = _record_daily_activity(current_user, score_pct, time_spent, submitted_at, supabase)
+        _update_user_statistics(current_user["id"], total_score, time_spent, supabase, active_day)
+        _update_review_schedule(current_user["id"], review_outcomes, supabase)
+        _update_accuracy_rollup(current_user["id"], graded_answers, supabase)
+        _update_item_counters(graded_answers, supabase)
         response = ExamResultResponse(
             user_exam_id=data.user_exam_id, 
             exam_title=exam_data["title"],
@@ -389,6 +465,7 @@ async def get_exam_result(
             .select("*, question_bank_items(*)")\
             .eq("exam_id", user_exam_data["exam_id"])\
             .order("order_index")\
+            .order("id")\
             .execute()
         
         user_answers = supabase.table("user_answers")\
@@ -398,8 +475,11 @@ async def get_exam_result(
         
         answer_map = {ans["exam_question_id"]: ans for ans in user_answers.data}
         
+        # Hiển thị theo đúng thứ tự học sinh đã thấy
+        ordered_questions = order_for_attempt(exam_questions.data, user_exam_data, exam_data)
+        
         results = []
-        for exam_question in exam_questions.data:
+        for exam_question, option_order in ordered_questions:
             question = exam_question.get("question_bank_items")
             
             if not question:
@@ -427,7 +507,8 @@ async def get_exam_result(
                 marks_obtained=float(answer.get("marks_obtained", 0)) if answer else 0.0,
                 marks=float(exam_question.get("marks", 0)),
                 explanation=question.get("explanation"),
-                ai_feedback=answer.get("ai_feedback") if answer else None
+                ai_feedback=answer.get("ai_feedback") if answer else None,
+                option_order=option_order
             ))
         
         total_score = float(user_exam_data.get("total_score") or 0)
@@ -465,7 +546,42 @@ async def get_exam_result(
             detail=str(e)
         )
 
-def _update_user_statistics(user_id: str, score: float, time_spent: int, supabase: Client):
+def _update_review_schedule(user_id: str, outcomes: list, supabase: Client):
+    """Cập nhật lịch ôn tập (spaced repetition) theo kết quả bài thi"""
+    try:
+        spaced_repetition_service.record_outcomes(supabase, user_id, outcomes)
+    except Exception as e:
+        logger.error(f"Update review schedule error: {str(e)}")
+
+
+def _update_accuracy_rollup(user_id: str, graded_answers: list, supabase: Client):
+    """Cộng dồn tỉ lệ đúng theo loại câu / category / độ khó (dùng cho gợi ý ôn luyện)"""
+    try:
+        accuracy_service.record_answers(supabase, user_id, graded_answers)
+    except Exception as e:
+        logger.error(f"Update accuracy rollup error: {str(e)}")
+
+
+def _update_item_counters(graded_answers: list, supabase: Client):
+    """Cộng số lượt đúng/sai của từng câu hỏi vào bộ đệm (ghi theo lô)"""
+    try:
+        item_stats_service.record_answers(
+            supabase, [(question["id"], is_correct) for question, is_correct in graded_answers]
+        )
+    except Exception as e:
+        logger.error(f"Update item counters error: {str(e)}")
+
+
+def _record_daily_activity(user: dict, score_pct, time_spent: int, submitted_at: datetime, supabase: Client):
+    """Cộng bài vừa chấm vào hoạt động trong ngày (theo múi giờ của user), trả về ngày đó"""
+    try:
+        return activity_service.record_exam(supabase, user["id"], score_pct, time_spent, submitted_at)
+    except Exception as e:
+        logger.error(f"Record daily activity error: {str(e)}")
+        return activity_date(submitted_at, user_timezone(user))
+
+
+def _update_user_statistics(user_id: str, score: float, time_spent: int, supabase: Client, active_day=None):
     """Update user statistics after exam"""
     try:
         # Get existing stats
@@ -486,7 +602,8 @@ def _update_user_statistics(user_id: str, score: float, time_spent: int, supabas
                     "total_exams_completed": current["total_exams_completed"] + 1,
                     "average_score": new_avg,
                     "total_time_spent": current["total_time_spent"] + time_spent,
-                    "last_activity": datetime.now(timezone.utc).isoformat()
+                    "last_activity": datetime.now(timezone.utc).isoformat(),
+                    **streak_service.apply(current, active_day)
                 })\
                 .eq("user_id", user_id)\
                 .execute()
@@ -498,7 +615,8 @@ def _update_user_statistics(user_id: str, score: float, time_spent: int, supabas
                 "total_exams_completed": 1,
                 "average_score": score,
                 "total_time_spent": time_spent,
-                "last_activity": datetime.now(timezone.utc).isoformat()
+                "last_activity": datetime.now(timezone.utc).isoformat(),
+                **streak_service.apply({}, active_day)
             }).execute()
             
     except Exception as e:
@@ -1,10 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from supabase import Client
 from app.core.supabase import get_supabase, get_supabase_admin
 from app.api.deps import get_current_user
-from app.models.upload import FileUploadResponse, FileProcessResponse, TextEditRequest
+from app.models.upload import (
+    FileUploadResponse, FileProcessResponse, TextEditRequest,
+    FileStatusResponse, FileIngestResponse
+)
 from app.services.ocr_service import ocr_service
 from app.services.file_service import file_service
+from app.services.chatgpt_service import chatgpt_service
+from app.services.progress_service import progress_tracker
+from app.api.v1.ai import create_exam_from_analysis
+from datetime import datetime, timezone
+import asyncio
+import json
+import time
 import uuid
 import os
 import logging
@@ -16,6 +28,13 @@ logger = logging.getLogger(__name__)
 ALLOWED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.pdf', '.doc', '.docx'}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 
+# Các cột nhẹ của uploaded_files (không gồm extracted_text)
+FILE_LIST_COLUMNS = "id, file_name, file_path, file_type, file_size, processing_status, exam_id, created_at"
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+PROGRESS_POLL_INTERVAL = 0.5  # seconds
+PROGRESS_DB_CHECK_INTERVAL = 5  # seconds
+PROGRESS_HEARTBEAT_INTERVAL = 15  # seconds
+
 def validate_file(filename: str, file_size: int):
     """Validate file extension and size"""
     ext = os.path.splitext(filename)[1].lower()
@@ -32,6 +51,124 @@ def validate_file(filename: str, file_size: int):
             detail=f"File too large. Maximum size: {MAX_FILE_SIZE / 1024 / 1024}MB"
         )
 
+async def _read_upload(file: UploadFile) -> bytes:
+    """Đọc file upload theo từng chunk, từ chối sớm nếu vượt quá MAX_FILE_SIZE"""
+    validate_file(file.filename, 0)
+    
+    chunks = []
+    file_size = 0
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        file_size += len(chunk)
+        validate_file(file.filename, file_size)
+        chunks.append(chunk)
+    
+    return b"".join(chunks)
+
+def _store_upload(
+    file_bytes: bytes,
+    filename: str,
+    content_type: str,
+    user_id: str,
+    supabase: Client,
+    processing_status: str = "pending"
+) -> dict:
+    """Upload bytes lên Supabase Storage và lưu metadata vào uploaded_files"""
+    # Generate unique filename
+    file_ext = os.path.splitext(filename)[1]
+    unique_filename = f"{uuid.uuid4()}{file_ext}"
+    storage_path = f"{user_id}/{unique_filename}"
+    
+    logger.info(f"Uploading file: {filename} ({len(file_bytes)} bytes)")
+    
+    # Upload to Supabase Storage
+    supabase.storage.from_("exam-files").upload(
+        storage_path,
+        file_bytes,
+        {
+            "content-type": content_type,
+            "x-upsert": "true"
+        }
+    )
+    
+    # Save metadata to database
+    file_record = {
+        "user_id": user_id,
+        "file_name": filename,
+        "file_path": storage_path,
+        "file_type": file_service.detect_file_type(filename),
+        "file_size": len(file_bytes),
+        "processing_status": processing_status
+    }
+    
+    response = supabase.table("uploaded_files").insert(file_record).execute()
+    
+    logger.info(f"File uploaded successfully: {response.data[0]['id']}")
+    
+    return response.data[0]
+
+def _extract_text(file_type: str, file_bytes: bytes, on_progress=None) -> str:
+    """
+    Trích xuất text theo loại file
+    Hàm đồng bộ (OCR/parse tốn CPU và I/O) → gọi qua run_in_threadpool
+    """
+    if file_type == "image":
+        # OCR for images
+        extracted_text = ocr_service.extract_text_from_image(file_bytes)
+        if on_progress:
+            on_progress(pages_total=1, pages_rendered=1, pages_ocr=1, characters=len(extracted_text))
+        return extracted_text
+    
+    if file_type == "pdf":
+        # Try text extraction first
+        extracted_text = file_service.extract_text_from_pdf(file_bytes, on_progress)
+        
+        # If no text, it's a scanned PDF - use OCR
+        if not extracted_text.strip():
+            logger.info("PDF is scanned, using OCR...")
+            # Save temp file for pdf2image
+            import tempfile
+            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp:
+                tmp.write(file_bytes)
+                tmp_path = tmp.name
+            
+            try:
+                extracted_text = ocr_service.extract_text_from_pdf_images(tmp_path, on_progress=on_progress)
+            finally:
+                os.unlink(tmp_path)
+        return extracted_text
+    
+    if file_type == "docx":
+        # Extract text from Word
+        extracted_text = file_service.extract_text_from_docx(file_bytes)
+        if on_progress:
+            on_progress(characters=len(extracted_text))
+        return extracted_text
+    
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Unsupported file type"
+    )
+
+def _progress_payload(file_data: dict, progress: dict = None) -> dict:
+    """Gộp trạng thái trong DB với tiến độ đang chạy (nếu có)"""
+    progress = progress or {}
+    updated_at = progress.get("updated_at")
+    return {
+        "id": file_data["id"],
+        "file_name": file_data["file_name"],
+        "file_type": file_data["file_type"],
+        "processing_status": progress.get("status") or file_data["processing_status"],
+        "pages_total": progress.get("pages_total"),
+        "pages_rendered": progress.get("pages_rendered", 0),
+        "pages_ocr": progress.get("pages_ocr", 0),
+        "characters": progress.get("characters", 0),
+        "error": progress.get("error"),
+        "updated_at": datetime.fromtimestamp(updated_at, tz=timezone.utc) if updated_at else None
+    }
+
 @router.post("/", response_model=FileUploadResponse)
 async def upload_file(
     file: UploadFile = File(...),
@@ -42,56 +179,139 @@ async def upload_file(
     Upload file lên Supabase Storage
     """
     try:
-        # Read file
-        file_bytes = await file.read()
-        file_size = len(file_bytes)
-        
-        # Validate
-        validate_file(file.filename, file_size)
+        # Read file (validates type and size while streaming)
+        file_bytes = await _read_upload(file)
         
-        # Generate unique filename
-        file_ext = os.path.splitext(file.filename)[1]
-        unique_filename = f"{uuid.uuid4()}{file_ext}"
-        storage_path = f"{current_user['id']}/{unique_filename}"
+        file_record = _store_upload(
+            file_bytes,
+            file.filename,
+            file.content_type,
+            current_user["id"],
+            supabase
+        )
         
-        logger.info(f"Uploading file: {file.filename} ({file_size} bytes)")
+        return FileUploadResponse(**file_record)
         
-        # Upload to Supabase Storage
-        supabase.storage.from_("exam-files").upload(
-            storage_path,
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Upload error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to upload file: {str(e)}"
+        )
+
+@router.post("/ingest", response_model=FileIngestResponse)
+async def ingest_file(
+    file: UploadFile = File(...),
+    language: str = Form("vi"),
+    analyze: bool = Form(True),
+    current_user: dict = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase_admin)
+):
+    """
+    Upload → xử lý → phân tích câu hỏi trong một request
+    Dùng trực tiếp bytes vừa upload (không tải lại từ storage),
+    trả về thời gian của từng bước (ms)
+    """
+    timings = {}
+    started = time.perf_counter()
+    file_id = None
+    
+    try:
+        # 1. Upload
+        stage_started = time.perf_counter()
+        file_bytes = await _read_upload(file)
+        file_data = await run_in_threadpool(
+            _store_upload,
             file_bytes,
-            {
-                "content-type": file.content_type,
-                "x-upsert": "true"
-            }
+            file.filename,
+            file.content_type,
+            current_user["id"],
+            supabase,
+            "processing"
+        )
+        file_id = file_data["id"]
+        timings["upload_ms"] = round((time.perf_counter() - stage_started) * 1000, 1)
+        
+        # 2. Process from in-memory bytes
+        stage_started = time.perf_counter()
+        progress_tracker.start(
+            file_id,
+            pages_total=None,
+            pages_rendered=0,
+            pages_ocr=0,
+            characters=0
+        )
+        extracted_text = await run_in_threadpool(
+            _extract_text,
+            file_data["file_type"],
+            file_bytes,
+            lambda **fields: progress_tracker.update(file_id, **fields)
         )
         
-        # Get public URL
-        public_url = supabase.storage.from_("exam-files").get_public_url(storage_path)
-        
-        # Save metadata to database
-        file_record = {
-            "user_id": current_user["id"],
-            "file_name": file.filename,
-            "file_path": storage_path,
-            "file_type": file_service.detect_file_type(file.filename),
-            "file_size": file_size,
-            "processing_status": "pending"
-        }
-        
-        response = supabase.table("uploaded_files").insert(file_record).execute()
+        supabase.table("uploaded_files")\
+            .update({
+                "extracted_text": extracted_text,
+                "processing_status": "completed"
+            })\
+            .eq("id", file_id)\
+            .execute()
         
-        logger.info(f"File uploaded successfully: {response.data[0]['id']}")
+        progress_tracker.finish(file_id, "completed", characters=len(extracted_text))
+        timings["process_ms"] = round((time.perf_counter() - stage_started) * 1000, 1)
         
-        return FileUploadResponse(**response.data[0])
+        # 3. Analyze extracted text into an exam (cùng cách lưu với /ai/analyze-file: exam + uploaded_files.exam_id)
+        analysis = None
+        exam_id = None
+        if analyze and extracted_text.strip():
+            stage_started = time.perf_counter()
+            result = await run_in_threadpool(
+                chatgpt_service.analyze_questions, extracted_text, language
+            )
+            
+            if result.get("questions"):
+                exam_id, _ = await run_in_threadpool(
+                    create_exam_from_analysis, result, file_data, current_user, supabase
+                )
+                analysis = result
+            else:
+                logger.info(f"No questions found in file {file_id}")
+            timings["analyze_ms"] = round((time.perf_counter() - stage_started) * 1000, 1)
+        
+        timings["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"Ingested file {file_id}: {timings}")
+        
+        return FileIngestResponse(
+            file_id=file_id,
+            file_name=file_data["file_name"],
+            file_type=file_data["file_type"],
+            processing_status="completed",
+            extracted_text=extracted_text,
+            analysis=analysis,
+            exam_id=exam_id,
+            timings=timings
+        )
         
-    except HTTPException:
+    except HTTPException as he:
+        if file_id and "process_ms" not in timings:
+            progress_tracker.finish(file_id, "failed", error=str(he.detail))
+            supabase.table("uploaded_files")\
+                .update({"processing_status": "failed"})\
+                .eq("id", file_id)\
+                .execute()
         raise
     except Exception as e:
-        logger.error(f"Upload error: {str(e)}")
+        logger.error(f"Ingest error: {str(e)}")
+        if file_id and "process_ms" not in timings:
+            progress_tracker.finish(file_id, "failed", error=str(e))
+            supabase.table("uploaded_files")\
+                .update({"processing_status": "failed"})\
+                .eq("id", file_id)\
+                .execute()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to upload file: {str(e)}"
+            detail=f"Failed to ingest file: {str(e)}"
         )
 
 @router.post("/process/{file_id}", response_model=FileProcessResponse)
@@ -131,40 +351,21 @@ async def process_file(
         # Download file from storage
         file_bytes = supabase.storage.from_("exam-files").download(file_data["file_path"])
         
-        # Process based on file type
-        extracted_text = ""
-        
-        if file_data["file_type"] == "image":
-            # OCR for images
-            extracted_text = ocr_service.extract_text_from_image(file_bytes)
-            
-        elif file_data["file_type"] == "pdf":
-            # Try text extraction first
-            extracted_text = file_service.extract_text_from_pdf(file_bytes)
-            
-            # If no text, it's a scanned PDF - use OCR
-            if not extracted_text.strip():
-                logger.info("PDF is scanned, using OCR...")
-                # Save temp file for pdf2image
-                import tempfile
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp:
-                    tmp.write(file_bytes)
-                    tmp_path = tmp.name
-                
-                try:
-                    extracted_text = ocr_service.extract_text_from_pdf_images(tmp_path)
-                finally:
-                    os.unlink(tmp_path)
-        
-        elif file_data["file_type"] == "docx":
-            # Extract text from Word
-            extracted_text = file_service.extract_text_from_docx(file_bytes)
+        progress_tracker.start(
+            file_id,
+            pages_total=None,
+            pages_rendered=0,
+            pages_ocr=0,
+            characters=0
+        )
         
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Unsupported file type"
-            )
+        # Process based on file type (in threadpool so progress can be streamed meanwhile)
+        extracted_text = await run_in_threadpool(
+            _extract_text,
+            file_data["file_type"],
+            file_bytes,
+            lambda **fields: progress_tracker.update(file_id, **fields)
+        )
         
         # Update database with extracted text
         supabase.table("uploaded_files")\
@@ -175,6 +376,7 @@ async def process_file(
             .eq("id", file_id)\
             .execute()
         
+        progress_tracker.finish(file_id, "completed", characters=len(extracted_text))
         logger.info(f"Processing completed. Extracted {len(extracted_text)} characters")
         
         return FileProcessResponse(
@@ -184,8 +386,9 @@ async def process_file(
             processing_status="completed"
         )
         
-    except HTTPException:
+    except HTTPException as he:
         # Update status to failed
+        progress_tracker.finish(file_id, "failed", error=str(he.detail))
         supabase.table("uploaded_files")\
             .update({"processing_status": "failed"})\
             .eq("id", file_id)\
@@ -193,6 +396,7 @@ async def process_file(
         raise
     except Exception as e:
         logger.error(f"Processing error: {str(e)}")
+        progress_tracker.finish(file_id, "failed", error=str(e))
         # Update status to failed
         supabase.table("uploaded_files")\
             .update({"processing_status": "failed"})\
@@ -246,17 +450,24 @@ async def edit_extracted_text(
 
 @router.get("/my-files")
 async def get_my_uploaded_files(
+    include_text: bool = Query(False, description="Trả về cả extracted_text"),
+    limit: int = Query(50, ge=1, le=200),
+    offset: int = Query(0, ge=0),
     current_user: dict = Depends(get_current_user),
     supabase: Client = Depends(get_supabase_admin)
 ):
     """
     Lấy danh sách file đã upload của user
+    Mặc định không trả về extracted_text (có thể rất lớn)
     """
     try:
+        columns = f"{FILE_LIST_COLUMNS}, extracted_text" if include_text else FILE_LIST_COLUMNS
+        
         response = supabase.table("uploaded_files")\
-            .select("*")\
+            .select(columns)\
             .eq("user_id", current_user["id"])\
             .order("created_at", desc=True)\
+            .range(offset, offset + limit - 1)\
             .execute()
         
         return response.data
@@ -268,6 +479,105 @@ async def get_my_uploaded_files(
             detail=f"Failed to get files: {str(e)}"
         )
 
+def _get_file_status_row(file_id: str, user_id: str, supabase: Client) -> dict:
+    result = supabase.table("uploaded_files")\
+        .select("id, file_name, file_type, processing_status")\
+        .eq("id", file_id)\
+        .eq("user_id", user_id)\
+        .execute()
+    
+    if not result.data:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    return result.data[0]
+
+@router.get("/status/{file_id}", response_model=FileStatusResponse)
+async def get_file_status(
+    file_id: str,
+    current_user: dict = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase_admin)
+):
+    """
+    Trạng thái xử lý file (nhẹ, không kèm extracted_text)
+    """
+    try:
+        file_data = _get_file_status_row(file_id, current_user["id"], supabase)
+        return _progress_payload(file_data, progress_tracker.get(file_id))
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Get file status error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to get file status: {str(e)}"
+        )
+
+@router.get("/progress/{file_id}")
+async def stream_file_progress(
+    file_id: str,
+    request: Request,
+    current_user: dict = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase_admin)
+):
+    """
+    Stream tiến độ xử lý file qua Server-Sent Events
+    Mỗi event là JSON giống /status/{file_id}; stream đóng khi completed/failed
+    """
+    try:
+        file_data = _get_file_status_row(file_id, current_user["id"], supabase)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Stream progress error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to stream progress: {str(e)}"
+        )
+    
+    async def event_stream():
+        nonlocal file_data
+        loop = asyncio.get_running_loop()
+        last_version = None
+        last_db_check = last_sent = loop.time()
+        
+        while not await request.is_disconnected():
+            progress = progress_tracker.get(file_id)
+            now = loop.time()
+            
+            # Không có tiến độ trong process này → định kỳ kiểm tra lại trạng thái trong DB
+            if progress is None and now - last_db_check >= PROGRESS_DB_CHECK_INTERVAL:
+                last_db_check = now
+                try:
+                    file_data = await run_in_threadpool(
+                        _get_file_status_row, file_id, current_user["id"], supabase
+                    )
+                except Exception as e:
+                    logger.warning(f"Progress DB check failed: {str(e)}")
+            
+            payload = _progress_payload(file_data, progress)
+            version = progress["version"] if progress else payload["processing_status"]
+            
+            if version != last_version:
+                last_version = version
+                last_sent = now
+                yield f"data: {json.dumps(payload, default=str)}\n\n"
+                if payload["processing_status"] in ("completed", "failed"):
+                    break
+            elif now - last_sent >= PROGRESS_HEARTBEAT_INTERVAL:
+                last_sent = now
+                yield ": keep-alive\n\n"
+            
+            await asyncio.sleep(PROGRESS_POLL_INTERVAL)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.delete("/{file_id}")
 async def delete_file(
     file_id: str,
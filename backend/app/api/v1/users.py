@@ -3,6 +3,7 @@ from supabase import Client
 from app.core.supabase import get_supabase, get_supabase_admin
 from app.api.deps import get_current_user
 from app.models.user import UserResponse, ProfileUpdate, ChangePasswordRequest
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 router = APIRouter()
 
@@ -28,6 +29,12 @@ async def update_profile(
     try:
         update_data = profile_data.dict(exclude_unset=True)
         
+        if update_data.get("timezone"):
+            try:
+                ZoneInfo(update_data["timezone"])
+            except (ZoneInfoNotFoundError, ValueError):
+                raise ValueError(f"Unknown timezone: {update_data['timezone']}")
+        
         response = supabase.table("profiles").update(update_data).eq("id", current_user["id"]).execute()
         if not response.data:
             raise HTTPException(
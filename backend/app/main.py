@@ -1,8 +1,13 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.settings import settings
+from app.core.supabase import supabase_admin
+from app.services.item_stats_service import item_stats_service
 from app.api.v1 import auth, users, admin, exams, upload, ai, submissions, statistics, categories, question_banks, practice, exam_generator, admin_analytics
+import asyncio
+import logging
 
+logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title=settings.APP_NAME,
@@ -35,6 +40,23 @@ app.include_router(practice.router, prefix="/api/v1/practice", tags=["practice"]
 app.include_router(exam_generator.router, prefix="/api/v1/exam-generator", tags=["exam-generator"])
 app.include_router(admin_analytics.router, prefix="/api/v1/admin-analytics", tags=["admin-analytics"])
 
+# Ghi định kỳ bộ đệm thống kê đúng/sai của câu hỏi
+@app.on_event("startup")
+async def start_background_tasks():
+    app.state.stats_flush_task = asyncio.create_task(
+        item_stats_service.run_periodic_flush(supabase_admin)
+    )
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    app.state.stats_flush_task.cancel()
+    try:
+        item_stats_service.flush(supabase_admin)
+    except Exception as e:
+        logger.error(f"Flush answer counters on shutdown error: {str(e)}")
+
+
 @app.get("/")
 async def root():
     return {
@@ -22,6 +22,8 @@ class AnalyzeTextResponse(BaseModel):
 class GenerateSimilarRequest(BaseModel):
     question: str
     count: int = 3
+    use_bank: bool = True  # Lấy câu hỏi có sẵn trong ngân hàng trước khi gọi AI
+    min_similarity: float = 0.35
 
 class GradeEssayRequest(BaseModel):
     question: str
@@ -64,6 +64,55 @@ class QuestionBankItemResponse(BaseModel):
     times_incorrect: int
     created_at: datetime
     updated_at: datetime
+    possible_duplicate_ids: Optional[List[str]] = None
+
+# GET /{bank_id}/items với fields=: chỉ id, created_at luôn có, các cột khác có thể vắng
+# (dùng cùng response_model_exclude_unset để không trả cột không được chọn)
+class QuestionBankItemListResponse(BaseModel):
+    id: str
+    question_bank_id: Optional[str] = None
+    question_text: Optional[str] = None
+    question_type: Optional[str] = None
+    options: Optional[dict] = None
+    correct_answer: Optional[Union[str, List[str]]] = None
+    explanation: Optional[str] = None
+    difficulty: Optional[str] = None
+    marks: Optional[int] = None
+    category_id: Optional[str] = None
+    tags: Optional[List[str]] = None
+    times_used: Optional[int] = None
+    times_correct: Optional[int] = None
+    times_incorrect: Optional[int] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+class QuestionBankItemSearchResult(QuestionBankItemResponse):
+    rank: float
+
+class QuestionBankItemSearchResponse(BaseModel):
+    items: List[QuestionBankItemSearchResult]
+    total: int
+    limit: int
+    offset: int
+
+# Duplicate detection
+class DuplicateQuestion(BaseModel):
+    id: str
+    question_bank_id: str
+    question_text: str
+    created_at: datetime
+
+class DuplicateGroup(BaseModel):
+    items: List[DuplicateQuestion]
+
+class DuplicateScanResponse(BaseModel):
+    groups: List[DuplicateGroup]
+    scanned: int
+    backfilled: int = 0
+
+class MergeDuplicatesRequest(BaseModel):
+    keep_id: str
+    duplicate_ids: List[str]
 
 # Category
 class CategoryCreate(BaseModel):
@@ -96,6 +145,9 @@ class GenerateRandomExamRequest(BaseModel):
     tags: Optional[List[str]] = None
     exam_title: Optional[str] = None
     exam_description: Optional[str] = None
+    difficulty_quotas: Optional[Dict[str, int]] = None  # {"easy": 10, "hard": 5}
+    max_per_category: Optional[int] = None
+    prefer_unused: bool = True  # Ưu tiên câu hỏi ít được dùng
 
 class GenerateRandomExamResponse(BaseModel):
     exam_id: str
@@ -103,6 +155,16 @@ class GenerateRandomExamResponse(BaseModel):
     total_questions: int
     selected_questions: List[str]
 
+class GenerateBatchExamRequest(BaseModel):
+    num_variants: int  # Số đề (vd. mỗi học sinh một đề), tối đa MAX_BATCH_VARIANTS
+    max_overlap: Optional[float] = None  # Tỉ lệ câu tối đa 2 đề được trùng nhau (0..1)
+    difficulty_quotas: Optional[Dict[str, int]] = None
+    max_per_category: Optional[int] = None
+    title_prefix: Optional[str] = None
+
+class GenerateBatchExamResponse(BaseModel):
+    exams: List[GenerateRandomExamResponse]
+
 # Exam Template
 class ExamTemplateCreate(BaseModel):
     name: str
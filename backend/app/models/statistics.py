@@ -29,9 +29,10 @@ class ExamHistoryItem(BaseModel):
     is_passed: bool
 
 class ScoreDataPoint(BaseModel):
-    date: str
-    score: float
+    date: str  # Ngày theo múi giờ của user
+    score: float  # % trung bình của các bài trong ngày
     exam_title: str
+    exams_count: int = 1
 
 class QuestionTypeStats(BaseModel):
     question_type: str
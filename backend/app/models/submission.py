@@ -10,6 +10,7 @@ class StartExamResponse(BaseModel):
     exam_id: str
     started_at: datetime
     duration: Optional[int] = None  # minutes
+    resumed: bool = False  # True nếu tiếp tục lượt đang làm dở
 
 class SubmitAnswerRequest(BaseModel):
     user_exam_id: str
@@ -29,6 +30,7 @@ class QuestionResult(BaseModel):
     marks: float  
     explanation: Optional[str] = None
     ai_feedback: Optional[str] = None
+    option_order: Optional[List[str]] = None  # Thứ tự đáp án học sinh đã thấy (nếu đảo đáp án)
 
 class ExamResultResponse(BaseModel):
     user_exam_id: str
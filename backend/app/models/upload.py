@@ -1,6 +1,7 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Dict
 from datetime import datetime
+from app.models.ai import AnalyzeTextResponse
 
 class FileUploadResponse(BaseModel):
     id: str
@@ -19,4 +20,27 @@ class FileProcessResponse(BaseModel):
     
 class TextEditRequest(BaseModel):
     file_id: str
-    edited_text: str
\ No newline at end of file
+    edited_text: str
+
+class FileStatusResponse(BaseModel):
+    id: str
+    file_name: str
+    file_type: str
+    processing_status: str
+    pages_total: Optional[int] = None
+    pages_rendered: int = 0
+    pages_ocr: int = 0
+    characters: int = 0
+    error: Optional[str] = None
+    updated_at: Optional[datetime] = None
+
+
+class FileIngestResponse(BaseModel):
+    file_id: str
+    file_name: str
+    file_type: str
+    processing_status: str
+    extracted_text: str
+    analysis: Optional[AnalyzeTextResponse] = None
+    exam_id: Optional[str] = None  # Exam tạo từ kết quả phân tích (như /ai/analyze-file)
+    timings: Dict[str, float]  # milliseconds per stage
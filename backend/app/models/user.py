@@ -17,11 +17,13 @@ class UserResponse(BaseModel):
     full_name: Optional[str] = None
     role: str = "user"
     avatar_url: Optional[str] = None
+    timezone: Optional[str] = None
     created_at: str
     
 class ProfileUpdate(BaseModel):
     full_name: Optional[str] = None
     avatar_url: Optional[str] = None
+    timezone: Optional[str] = None  # Tên IANA, vd. "Asia/Ho_Chi_Minh"
 
 class AuthResponse(BaseModel):
     user: UserResponse
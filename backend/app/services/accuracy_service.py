@@ -0,0 +1,85 @@
+from typing import Dict, Iterable, List, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+WEAK_ERROR_RATE = 0.3  # Tỉ lệ sai (đã làm trơn) từ mức này coi là điểm yếu
+MAX_WEAK_STRATA = 20
+
+class AccuracyService:
+    """
+    Thống kê tỉ lệ đúng của user theo (loại câu hỏi, category, độ khó)
+    Lưu dạng rollup cộng dồn (bảng user_accuracy_rollup), cập nhật khi chấm bài
+    """
+
+    def record_answers(self, supabase, user_id: str, answers: Iterable[Tuple[dict, bool]]):
+        """
+        Cộng dồn kết quả [(question_bank_item, is_correct)] vào rollup (1 RPC)
+        """
+        buckets: Dict[tuple, dict] = {}
+        for question, is_correct in answers:
+            if not question or not question.get('question_type'):
+                continue
+            key = (question['question_type'], question.get('category_id'), question.get('difficulty'))
+            bucket = buckets.setdefault(key, {
+                'question_type': key[0],
+                'category_id': key[1],
+                'difficulty': key[2],
+                'total': 0,
+                'correct': 0
+            })
+            bucket['total'] += 1
+            if is_correct:
+                bucket['correct'] += 1
+
+        if not buckets:
+            return
+
+        supabase.rpc('bump_accuracy_rollup', {
+            'p_user_id': user_id,
+            'p_rows': list(buckets.values())
+        }).execute()
+
+    def get_rollup(self, supabase, user_id: str) -> List[dict]:
+        result = supabase.table('user_accuracy_rollup')\
+            .select('question_type, category_id, difficulty, total, correct')\
+            .eq('user_id', user_id)\
+            .execute()
+        return result.data or []
+
+    @staticmethod
+    def accuracy_by(rows: List[dict], field: str) -> Dict[str, dict]:
+        """Gộp rollup theo một chiều (question_type / category_id / difficulty)"""
+        stats: Dict[str, dict] = {}
+        for row in rows:
+            key = row.get(field)
+            if key is None:
+                continue
+            entry = stats.setdefault(key, {'total': 0, 'correct': 0})
+            entry['total'] += row['total']
+            entry['correct'] += row['correct']
+        return stats
+
+    @staticmethod
+    def weak_strata(rows: List[dict]) -> List[dict]:
+        """
+        Các tầng (loại câu, category, độ khó) user hay sai, xếp theo tỉ lệ sai giảm dần
+        Tỉ lệ sai làm trơn (sai + 1) / (tổng + 2) để tầng ít dữ liệu không bị thổi phồng
+        """
+        strata = []
+        for row in rows:
+            if not row['total']:
+                continue
+            error_rate = (row['total'] - row['correct'] + 1) / (row['total'] + 2)
+            if error_rate >= WEAK_ERROR_RATE:
+                strata.append({
+                    'question_type': row['question_type'],
+                    'category_id': row.get('category_id'),
+                    'difficulty': row.get('difficulty'),
+                    'weight': round(error_rate, 4)
+                })
+        strata.sort(key=lambda s: s['weight'], reverse=True)
+        return strata[:MAX_WEAK_STRATA]
+
+# Singleton instance
+accuracy_service = AccuracyService()
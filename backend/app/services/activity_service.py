@@ -0,0 +1,73 @@
+from datetime import date, datetime, timedelta, timezone, tzinfo
+from typing import List, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from app.services.streak_service import activity_date
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEZONE = 'Asia/Ho_Chi_Minh'
+ACTIVITY_FIELDS = 'local_date, exams_count, scored_exams, score_pct_sum, practice_count, time_spent'
+
+
+def user_timezone(profile: Optional[dict]) -> tzinfo:
+    """Múi giờ của user (profiles.timezone), tên không hợp lệ thì dùng mặc định"""
+    name = (profile or {}).get('timezone') or DEFAULT_TIMEZONE
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning(f"Unknown timezone '{name}', falling back to {DEFAULT_TIMEZONE}")
+        return ZoneInfo(DEFAULT_TIMEZONE)
+
+
+def user_today(profile: Optional[dict]) -> date:
+    return activity_date(tz=user_timezone(profile))
+
+
+class ActivityService:
+    """
+    Hoạt động theo ngày của user (bảng user_daily_activity, khoá (user_id, local_date))
+    Ngày tính theo profiles.timezone; cộng dồn bằng RPC bump_daily_activity khi có bài chấm / luyện tập
+    Biểu đồ điểm, chuỗi ngày học và xu hướng đọc từ đây: O(số ngày) thay vì O(số lượt làm bài)
+    """
+
+    def record_exam(
+        self,
+        supabase,
+        user_id: str,
+        score_pct: Optional[float],
+        time_spent: int,
+        at: Optional[datetime] = None
+    ) -> date:
+        """
+        Ghi nhận một bài đã chấm (score_pct = None nếu đề không có tổng điểm)
+        Returns:
+            Ngày địa phương của hoạt động
+        """
+        return self._bump(supabase, user_id, at, p_exams=1, p_score_pct=score_pct, p_time_spent=time_spent)
+
+    def record_practice(self, supabase, user_id: str, at: Optional[datetime] = None) -> date:
+        """Ghi nhận một practice session đã hoàn thành"""
+        return self._bump(supabase, user_id, at, p_practice=1)
+
+    @staticmethod
+    def _bump(supabase, user_id: str, at: Optional[datetime], **counts) -> date:
+        result = supabase.rpc('bump_daily_activity', {
+            'p_user_id': user_id,
+            'p_at': (at or datetime.now(timezone.utc)).isoformat(),
+            **counts
+        }).execute()
+        return date.fromisoformat(str(result.data)[:10])
+
+    def get_days(self, supabase, user_id: str, since: date, until: Optional[date] = None) -> List[dict]:
+        """Các ngày có hoạt động trong [since, until], tăng dần"""
+        query = supabase.table('user_daily_activity')\
+            .select(ACTIVITY_FIELDS)\
+            .eq('user_id', user_id)\
+            .gte('local_date', since.isoformat())
+        if until:
+            query = query.lte('local_date', until.isoformat())
+        return query.order('local_date').execute().data or []
+
+# Singleton instance
+activity_service = ActivityService()
@@ -0,0 +1,53 @@
+from collections import OrderedDict
+from typing import Any, Optional
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class TTLCache:
+    """
+    Cache trong bộ nhớ của process, có TTL và giới hạn số phần tử (LRU)
+    Dùng cho dữ liệu đọc nhiều, ghi ít; phía ghi phải gọi delete() để invalidate
+    TTL giới hạn thời gian dữ liệu cũ tồn tại khi chạy nhiều worker
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: int = 300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+# Đề thi dạng dành cho học sinh (đã bỏ đáp án), key = exam_id
+exam_payload_cache = TTLCache(max_entries=500, ttl_seconds=600)
+
+# Câu hỏi của practice session đã ghép sẵn, key = "{session_id}:{hide_answers}"
+practice_questions_cache = TTLCache(max_entries=1000, ttl_seconds=600)
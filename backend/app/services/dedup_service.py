@@ -0,0 +1,243 @@
+from app.services.search_service import search_tokens
+from typing import Dict, Iterable, List, Optional, Tuple
+import hashlib
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SHINGLE_SIZE = 5
+FINGERPRINT_BITS = 64
+LSH_BANDS = 4  # 4 dải 16 bit: 2 fingerprint lệch <= 3 bit chắc chắn trùng ít nhất 1 dải
+BAND_BITS = FINGERPRINT_BITS // LSH_BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+DEFAULT_MAX_DISTANCE = 3
+SCAN_PAGE_SIZE = 1000
+ID_CHUNK_SIZE = 200  # Giới hạn số id trong một filter in_ (độ dài URL)
+
+_UINT64 = 1 << 64
+
+
+def to_signed64(value: int) -> int:
+    """uint64 → int64 để lưu vào cột bigint"""
+    return value - _UINT64 if value >= (1 << 63) else value
+
+
+def to_unsigned64(value: int) -> int:
+    return value & (_UINT64 - 1)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(to_unsigned64(a) ^ to_unsigned64(b)).count('1')
+
+
+def fingerprint_bands(fingerprint: int) -> List[int]:
+    """Các dải LSH của fingerprint (khớp với cột fp_band0..3 trong DB)"""
+    value = to_unsigned64(fingerprint)
+    return [(value >> (band * BAND_BITS)) & BAND_MASK for band in range(LSH_BANDS)]
+
+
+class DedupService:
+    """
+    Phát hiện câu hỏi gần trùng lặp bằng SimHash trên shingle ký tự của text đã bỏ dấu
+    Fingerprint 64 bit, tra cứu ứng viên qua LSH (chia 4 dải 16 bit)
+    """
+
+    def canonical_text(self, question_text: str, options: Optional[dict] = None) -> str:
+        """
+        Text dùng để tính fingerprint: câu hỏi + các đáp án (không phụ thuộc thứ tự/nhãn)
+        Chỉ giữ token đã bỏ dấu để dấu câu / khoảng trắng không làm lệch fingerprint
+        """
+        parts = [question_text or ""]
+        if isinstance(options, dict):
+            parts.extend(sorted(str(value) for value in options.values() if value is not None))
+        return " ".join(search_tokens(" ".join(parts)))
+
+    def _shingle_hashes(self, text: str) -> np.ndarray:
+        if len(text) <= SHINGLE_SIZE:
+            shingles = {text}
+        else:
+            shingles = {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+        hashes = [
+            int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), 'little')
+            for s in shingles
+        ]
+        return np.array(hashes, dtype='<u8')
+
+    def fingerprint(self, question_text: str, options: Optional[dict] = None) -> Optional[int]:
+        """
+        SimHash 64 bit (int64 có dấu, lưu được vào bigint)
+        Trả về None nếu không có nội dung
+        """
+        text = self.canonical_text(question_text, options)
+        if not text:
+            return None
+
+        hashes = self._shingle_hashes(text)
+        # Đếm số shingle có bit i = 1 cho cả 64 bit cùng lúc
+        bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+        votes = bits.sum(axis=0, dtype=np.int64) * 2 > len(hashes)
+        value = int(np.packbits(votes, bitorder='little').view('<u8')[0])
+        return to_signed64(value)
+
+    def fingerprint_item(self, item: dict) -> Optional[int]:
+        return self.fingerprint(item.get('question_text'), item.get('options'))
+
+    def find_duplicate_groups(
+        self,
+        items: Iterable[dict],
+        max_distance: int = DEFAULT_MAX_DISTANCE
+    ) -> List[List[dict]]:
+        """
+        Gom nhóm các câu hỏi gần trùng (batch mode)
+        items cần có id, question_text, options; dùng text_fingerprint nếu đã có sẵn
+        """
+        items = list(items)
+        fingerprints = []
+        buckets: Dict[Tuple[int, int], List[int]] = {}
+
+        for idx, item in enumerate(items):
+            fp = item.get('text_fingerprint')
+            if fp is None:
+                fp = self.fingerprint_item(item)
+            fingerprints.append(fp)
+            if fp is None:
+                continue
+            for band, value in enumerate(fingerprint_bands(fp)):
+                buckets.setdefault((band, value), []).append(idx)
+
+        # Union-find trên các cặp ứng viên cùng dải
+        parent = list(range(len(items)))
+
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        checked = set()
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            for i, a in enumerate(members):
+                for b in members[i + 1:]:
+                    if (a, b) in checked:
+                        continue
+                    checked.add((a, b))
+                    if hamming_distance(fingerprints[a], fingerprints[b]) <= max_distance:
+                        root_a, root_b = find(a), find(b)
+                        if root_a != root_b:
+                            parent[root_b] = root_a
+
+        groups: Dict[int, List[dict]] = {}
+        for idx, item in enumerate(items):
+            if fingerprints[idx] is not None:
+                groups.setdefault(find(idx), []).append(item)
+
+        return [group for group in groups.values() if len(group) > 1]
+
+    def find_similar_in_banks(
+        self,
+        supabase,
+        fingerprint: Optional[int],
+        bank_ids: List[str],
+        exclude_id: Optional[str] = None,
+        max_distance: int = DEFAULT_MAX_DISTANCE
+    ) -> List[str]:
+        """Tìm id câu hỏi gần trùng trong các bank (tra theo index fp_band0..3)"""
+        if fingerprint is None or not bank_ids:
+            return []
+
+        band_filter = ",".join(
+            f"fp_band{band}.eq.{value}" for band, value in enumerate(fingerprint_bands(fingerprint))
+        )
+        query = supabase.table('question_bank_items')\
+            .select('id, text_fingerprint')\
+            .in_('question_bank_id', bank_ids)\
+            .or_(band_filter)
+        if exclude_id:
+            query = query.neq('id', exclude_id)
+
+        candidates = query.limit(100).execute()
+        return [
+            row['id'] for row in candidates.data
+            if row.get('text_fingerprint') is not None
+            and hamming_distance(row['text_fingerprint'], fingerprint) <= max_distance
+        ]
+
+    def scan_banks(
+        self,
+        supabase,
+        bank_ids: List[str],
+        max_distance: int = DEFAULT_MAX_DISTANCE,
+        backfill: bool = True
+    ) -> dict:
+        """
+        Quét toàn bộ câu hỏi của các bank và gom nhóm gần trùng (batch mode)
+        Chỉ đọc cột fingerprint; câu hỏi chưa có fingerprint được tính và ghi lại (backfill)
+        Returns:
+            {"groups": [[{id, question_bank_id, question_text, created_at}]], "scanned", "backfilled"}
+        """
+        rows = []
+        last_id = None
+        while True:
+            query = supabase.table('question_bank_items')\
+                .select('id, question_bank_id, text_fingerprint')\
+                .in_('question_bank_id', bank_ids)
+            if last_id:
+                query = query.gt('id', last_id)
+            page = query.order('id').limit(SCAN_PAGE_SIZE).execute().data
+            rows.extend(page)
+            if len(page) < SCAN_PAGE_SIZE:
+                break
+            last_id = page[-1]['id']
+
+        missing = [row for row in rows if row.get('text_fingerprint') is None]
+        backfilled = 0
+        for start in range(0, len(missing), ID_CHUNK_SIZE):
+            chunk = missing[start:start + ID_CHUNK_SIZE]
+            contents = supabase.table('question_bank_items')\
+                .select('id, question_text, options')\
+                .in_('id', [row['id'] for row in chunk])\
+                .execute()
+            fingerprints = {item['id']: self.fingerprint_item(item) for item in contents.data}
+            for row in chunk:
+                row['text_fingerprint'] = fingerprints.get(row['id'])
+
+            computed = [row for row in chunk if row['text_fingerprint'] is not None]
+            if backfill and computed:
+                supabase.rpc('set_question_fingerprints', {
+                    'p_ids': [row['id'] for row in computed],
+                    'p_fingerprints': [row['text_fingerprint'] for row in computed]
+                }).execute()
+                backfilled += len(computed)
+
+        groups = self.find_duplicate_groups(rows, max_distance)
+
+        # Chỉ lấy nội dung cho các câu hỏi nằm trong nhóm trùng
+        grouped_ids = [row['id'] for group in groups for row in group]
+        details = {}
+        for start in range(0, len(grouped_ids), ID_CHUNK_SIZE):
+            result = supabase.table('question_bank_items')\
+                .select('id, question_bank_id, question_text, created_at')\
+                .in_('id', grouped_ids[start:start + ID_CHUNK_SIZE])\
+                .execute()
+            details.update({item['id']: item for item in result.data})
+
+        groups = [
+            sorted(
+                (details[row['id']] for row in group if row['id'] in details),
+                key=lambda item: item['created_at']
+            )
+            for group in groups
+        ]
+
+        logger.info(f"Dedup scan: {len(rows)} items, {len(groups)} groups, {backfilled} backfilled")
+        return {
+            "groups": [group for group in groups if len(group) > 1],
+            "scanned": len(rows),
+            "backfilled": backfilled
+        }
+
+# Singleton instance
+dedup_service = DedupService()
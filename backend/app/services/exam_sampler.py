@@ -0,0 +1,241 @@
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List, Optional
+import random
+import logging
+
+from app.services.shuffle_service import new_seed
+
+logger = logging.getLogger(__name__)
+
+ID_CHUNK_SIZE = 200
+MAX_POOL_PER_STRATUM = 5000  # Giới hạn số ứng viên mỗi tầng khi sinh nhiều đề
+CANDIDATE_PAGE_SIZE = 1000  # Không vượt max-rows của PostgREST (kết quả bị cắt ngầm)
+MAX_CANDIDATES = 50000  # Chặn vòng đọc trang
+SELECTED_QUESTION_FIELDS = 'id, question_text, question_type, options, correct_answer, explanation, marks, times_used'
+
+
+class SamplingError(ValueError):
+    """Không đủ câu hỏi để thoả yêu cầu lấy mẫu"""
+
+
+class ExamSampler:
+    """
+    Lấy mẫu câu hỏi cho đề ngẫu nhiên
+    - DB (RPC sample_question_candidates) lọc và xếp hạng có trọng số theo times_used,
+      chỉ trả id + cột phân tầng, mỗi tầng (difficulty, category) tối đa số dòng cần thiết,
+      đọc theo trang CANDIDATE_PAGE_SIZE dòng
+    - Python phân bổ theo quota độ khó và giới hạn số câu mỗi category
+    - Chỉ đọc đầy đủ nội dung của các câu được chọn
+    """
+
+    def sample(
+        self,
+        supabase,
+        bank_ids: List[str],
+        num_questions: int,
+        category_ids: Optional[List[str]] = None,
+        difficulty_levels: Optional[List[str]] = None,
+        tags: Optional[List[str]] = None,
+        difficulty_quotas: Optional[Dict[str, int]] = None,
+        max_per_category: Optional[int] = None,
+        prefer_unused: bool = True
+    ) -> List[dict]:
+        """
+        Returns:
+            Danh sách câu hỏi đầy đủ (theo thứ tự đã chọn)
+        Raises:
+            SamplingError nếu không đủ câu hỏi thoả điều kiện
+        """
+        quotas = self._clean_quotas(difficulty_quotas, num_questions)
+
+        # Một tầng không bao giờ đóng góp nhiều hơn mức này
+        per_stratum = num_questions
+        if max_per_category:
+            per_stratum = min(per_stratum, max_per_category)
+
+        candidates = self._fetch_candidates(
+            supabase, bank_ids, category_ids, difficulty_levels, tags, per_stratum, prefer_unused
+        )
+        selected_ids = self.allocate(candidates, num_questions, quotas, max_per_category)
+        return self.fetch_questions(supabase, selected_ids)
+
+    def sample_variants(
+        self,
+        supabase,
+        bank_ids: List[str],
+        num_questions: int,
+        num_variants: int,
+        category_ids: Optional[List[str]] = None,
+        difficulty_levels: Optional[List[str]] = None,
+        tags: Optional[List[str]] = None,
+        difficulty_quotas: Optional[Dict[str, int]] = None,
+        max_per_category: Optional[int] = None,
+        max_overlap: Optional[float] = None,
+        prefer_unused: bool = True
+    ) -> List[List[dict]]:
+        """
+        Sinh nhiều đề khác nhau từ cùng một pool ứng viên (chỉ 1 lần gọi DB)
+        - max_overlap: tỉ lệ câu tối đa 2 đề bất kỳ được trùng nhau (0..1)
+        - Trọng số theo times_used (như đề đơn) cộng số lần đã dùng ở các đề trước trong đợt → các đề trải đều pool
+        Returns:
+            Mỗi đề là danh sách ứng viên {id, difficulty, category_id, marks}
+        """
+        quotas = self._clean_quotas(difficulty_quotas, num_questions)
+
+        per_stratum = min(num_questions * num_variants, MAX_POOL_PER_STRATUM)
+        if max_per_category:
+            per_stratum = min(per_stratum, max_per_category * num_variants)
+
+        pool = self._fetch_candidates(
+            supabase, bank_ids, category_ids, difficulty_levels, tags, per_stratum, prefer_unused
+        )
+        candidates_by_id = {c['id']: c for c in pool}
+
+        max_shared = int(max_overlap * num_questions) if max_overlap is not None else None
+        rng = random.Random()
+        uses = Counter()  # Số đề trước trong đợt đã chứa câu
+        prior_uses = {c['id']: (c.get('times_used') or 0) if prefer_unused else 0 for c in pool}
+        item_variants = defaultdict(list)  # id → các đề đã chứa câu này
+        variants = []
+
+        for variant_idx in range(num_variants):
+            # Khoá Efraimidis–Spirakis như RPC: random()^(1/w), w = 1 / (1 + số lần đã dùng)
+            keyed = [
+                {**c, 'sort_key': rng.random() ** (1 + prior_uses[c['id']] + uses[c['id']])}
+                for c in pool
+            ]
+            overlap = [0] * variant_idx
+
+            def can_take(candidate):
+                return max_shared is None or all(
+                    overlap[j] < max_shared for j in item_variants[candidate['id']]
+                )
+
+            def on_take(candidate):
+                for j in item_variants[candidate['id']]:
+                    overlap[j] += 1
+
+            try:
+                ids = self.allocate(keyed, num_questions, quotas, max_per_category, can_take, on_take)
+            except SamplingError as e:
+                raise SamplingError(f"Variant {variant_idx + 1}: {str(e)}")
+
+            for item_id in ids:
+                uses[item_id] += 1
+                item_variants[item_id].append(variant_idx)
+            variants.append([candidates_by_id[item_id] for item_id in ids])
+
+        logger.info(f"Sampled {num_variants} variants from a pool of {len(pool)} questions")
+        return variants
+
+    @staticmethod
+    def _clean_quotas(difficulty_quotas: Optional[Dict[str, int]], num_questions: int) -> Dict[str, int]:
+        quotas = {level: count for level, count in (difficulty_quotas or {}).items() if count > 0}
+        if sum(quotas.values()) > num_questions:
+            raise SamplingError("Sum of difficulty quotas exceeds num_questions")
+        return quotas
+
+    @staticmethod
+    def _fetch_candidates(
+        supabase,
+        bank_ids: List[str],
+        category_ids: Optional[List[str]],
+        difficulty_levels: Optional[List[str]],
+        tags: Optional[List[str]],
+        per_stratum: int,
+        prefer_unused: bool
+    ) -> List[dict]:
+        # Đọc theo trang; cùng seed → các trang thuộc cùng một lần lấy mẫu
+        params = {
+            'p_bank_ids': bank_ids,
+            'p_seed': new_seed(),
+            'p_category_ids': category_ids or None,
+            'p_difficulties': difficulty_levels or None,
+            'p_tags': tags or None,
+            'p_per_stratum': per_stratum,
+            'p_prefer_unused': prefer_unused,
+            'p_limit': CANDIDATE_PAGE_SIZE
+        }
+        candidates = []
+        while len(candidates) < MAX_CANDIDATES:
+            page = supabase.rpc(
+                'sample_question_candidates', {**params, 'p_offset': len(candidates)}
+            ).execute().data or []
+            candidates.extend(page)
+            if len(page) < CANDIDATE_PAGE_SIZE:
+                break
+
+        if not candidates:
+            raise SamplingError("No questions found matching the criteria")
+        return candidates
+
+    def allocate(
+        self,
+        candidates: List[dict],
+        num_questions: int,
+        quotas: Dict[str, int],
+        max_per_category: Optional[int] = None,
+        can_take: Optional[Callable[[dict], bool]] = None,
+        on_take: Optional[Callable[[dict], None]] = None
+    ) -> List[str]:
+        """
+        Chọn id theo sort_key giảm dần: đúng số câu theo quota của từng độ khó,
+        phần còn lại lấy từ các độ khó không có quota
+        Giới hạn max_per_category áp dụng chung cho cả hai bước
+        can_take / on_take: ràng buộc bổ sung (vd. độ trùng giữa các đề khi sinh nhiều đề)
+        """
+        candidates = sorted(candidates, key=lambda c: c['sort_key'], reverse=True)
+        category_counts: Dict[Optional[str], int] = {}
+        selected = []
+        taken = set()
+
+        def take(pool, limit):
+            picked = 0
+            for candidate in pool:
+                if picked >= limit:
+                    break
+                if candidate['id'] in taken:
+                    continue
+                category = candidate.get('category_id')
+                if max_per_category and category is not None and category_counts.get(category, 0) >= max_per_category:
+                    continue
+                if can_take and not can_take(candidate):
+                    continue
+                if on_take:
+                    on_take(candidate)
+                taken.add(candidate['id'])
+                selected.append(candidate['id'])
+                category_counts[category] = category_counts.get(category, 0) + 1
+                picked += 1
+            return picked
+
+        for level, count in quotas.items():
+            picked = take((c for c in candidates if c.get('difficulty') == level), count)
+            if picked < count:
+                raise SamplingError(
+                    f"Not enough '{level}' questions. Found {picked}, requested {count}"
+                )
+
+        remaining = num_questions - len(selected)
+        if remaining > 0:
+            picked = take((c for c in candidates if c.get('difficulty') not in quotas), remaining)
+            if picked < remaining:
+                raise SamplingError(
+                    f"Not enough questions. Found {len(selected)}, requested {num_questions}"
+                )
+
+        return selected
+
+    def fetch_questions(self, supabase, question_ids: List[str]) -> List[dict]:
+        """Đọc đầy đủ các câu đã chọn, giữ thứ tự"""
+        rows = {}
+        for start in range(0, len(question_ids), ID_CHUNK_SIZE):
+            result = supabase.table('question_bank_items')\
+                .select(SELECTED_QUESTION_FIELDS)\
+                .in_('id', question_ids[start:start + ID_CHUNK_SIZE])\
+                .execute()
+            rows.update({row['id']: row for row in result.data})
+        return [rows[question_id] for question_id in question_ids if question_id in rows]
+
+# Singleton instance
+exam_sampler = ExamSampler()
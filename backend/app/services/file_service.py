@@ -1,24 +1,319 @@
 from PyPDF2 import PdfReader
 from docx import Document
+from docx.oxml.ns import qn
+from typing import Callable, Optional
 import io
 import logging
 
 logger = logging.getLogger(__name__)
 
+# WordprocessingML tags dùng khi duyệt DOCX
+W_P = qn('w:p')
+W_TBL = qn('w:tbl')
+W_TR = qn('w:tr')
+W_TC = qn('w:tc')
+W_SDT = qn('w:sdt')
+W_SDT_CONTENT = qn('w:sdtContent')
+W_T = qn('w:t')
+W_TAB = qn('w:tab')
+W_BR = qn('w:br')
+W_CR = qn('w:cr')
+W_NO_BREAK_HYPHEN = qn('w:noBreakHyphen')
+W_LAST_RENDERED_PAGE_BREAK = qn('w:lastRenderedPageBreak')
+W_TXBX_CONTENT = qn('w:txbxContent')
+W_PPR = qn('w:pPr')
+W_RPR = qn('w:rPr')
+W_PSTYLE = qn('w:pStyle')
+W_NUMPR = qn('w:numPr')
+W_NUMID = qn('w:numId')
+W_ILVL = qn('w:ilvl')
+W_SECTPR = qn('w:sectPr')
+W_TYPE = qn('w:type')
+W_VAL = qn('w:val')
+MC_FALLBACK = '{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback'
+
+PAGE_BREAK = object()
+
+
+def _to_roman(number: int) -> str:
+    numerals = [
+        (1000, 'M'), (900, 'CM'), (500, 'D'), (400, 'CD'), (100, 'C'), (90, 'XC'),
+        (50, 'L'), (40, 'XL'), (10, 'X'), (9, 'IX'), (5, 'V'), (4, 'IV'), (1, 'I')
+    ]
+    result = []
+    for value, numeral in numerals:
+        while number >= value:
+            result.append(numeral)
+            number -= value
+    return ''.join(result)
+
+
+def _to_letter(number: int) -> str:
+    # Word: a..z, aa..zz, aaa..
+    letter = chr(ord('A') + (number - 1) % 26)
+    return letter * ((number - 1) // 26 + 1)
+
+
+def _format_number(number: int, num_fmt: str) -> str:
+    if num_fmt == 'lowerLetter':
+        return _to_letter(number).lower()
+    if num_fmt == 'upperLetter':
+        return _to_letter(number)
+    if num_fmt == 'lowerRoman':
+        return _to_roman(number).lower()
+    if num_fmt == 'upperRoman':
+        return _to_roman(number)
+    if num_fmt == 'decimalZero':
+        return f"{number:02d}"
+    if num_fmt == 'none':
+        return ''
+    return str(number)
+
+
+class _DocxWalker:
+    """
+    Duyệt trực tiếp cây XML của body (nhanh hơn nhiều so với object Paragraph/Table
+    của python-docx) và yield text theo đúng thứ tự xuất hiện trong tài liệu
+    """
+    
+    def __init__(self, doc):
+        self.body = doc.element.body
+        self.levels = self._load_numbering(doc)
+        self.style_numbering = self._load_style_numbering(doc)
+        self.counters = {}
+        self.page = 1
+        self.page_has_text = False
+    
+    def _load_numbering(self, doc) -> dict:
+        """numId -> {ilvl: (numFmt, lvlText, start)}"""
+        try:
+            numbering = doc.part.numbering_part.element
+        except Exception:
+            return {}
+        
+        abstract_levels = {}
+        for abstract in numbering.findall(qn('w:abstractNum')):
+            levels = {}
+            for lvl in abstract.findall(qn('w:lvl')):
+                num_fmt = lvl.find(qn('w:numFmt'))
+                lvl_text = lvl.find(qn('w:lvlText'))
+                start = lvl.find(qn('w:start'))
+                levels[int(lvl.get(qn('w:ilvl'), 0))] = (
+                    num_fmt.get(W_VAL) if num_fmt is not None else 'decimal',
+                    lvl_text.get(W_VAL) if lvl_text is not None else '',
+                    int(start.get(W_VAL)) if start is not None else 1
+                )
+            abstract_levels[abstract.get(qn('w:abstractNumId'))] = levels
+        
+        levels_by_num = {}
+        for num in numbering.findall(qn('w:num')):
+            abstract_id = num.find(qn('w:abstractNumId'))
+            if abstract_id is not None:
+                levels_by_num[num.get(qn('w:numId'))] = abstract_levels.get(abstract_id.get(W_VAL), {})
+        return levels_by_num
+    
+    def _load_style_numbering(self, doc) -> dict:
+        """styleId -> (numId, ilvl) cho các style danh sách (List Number, List Bullet...)"""
+        try:
+            styles = doc.styles.element
+        except Exception:
+            return {}
+        
+        direct = {}
+        based_on = {}
+        for style in styles.findall(qn('w:style')):
+            style_id = style.get(qn('w:styleId'))
+            parent = style.find(qn('w:basedOn'))
+            if parent is not None:
+                based_on[style_id] = parent.get(W_VAL)
+            ppr = style.find(W_PPR)
+            num_pr = ppr.find(W_NUMPR) if ppr is not None else None
+            if num_pr is not None:
+                num_id = num_pr.find(W_NUMID)
+                ilvl = num_pr.find(W_ILVL)
+                if num_id is not None:
+                    direct[style_id] = (num_id.get(W_VAL), int(ilvl.get(W_VAL)) if ilvl is not None else 0)
+        
+        resolved = {}
+        for style_id in set(direct) | set(based_on):
+            current, seen = style_id, set()
+            while current and current not in direct and current not in seen:
+                seen.add(current)
+                current = based_on.get(current)
+            if current in direct:
+                resolved[style_id] = direct[current]
+        return resolved
+    
+    def iter_lines(self):
+        yield f"--- Page {self.page} ---"
+        for item in self._iter_blocks(self.body):
+            if item is PAGE_BREAK:
+                # Bỏ qua ngắt trang liên tiếp (ví dụ: page break + lastRenderedPageBreak)
+                if self.page_has_text:
+                    self.page += 1
+                    self.page_has_text = False
+                    yield ""
+                    yield f"--- Page {self.page} ---"
+            else:
+                self.page_has_text = True
+                yield item
+    
+    def _iter_blocks(self, container):
+        for child in container.iterchildren():
+            tag = child.tag
+            if tag == W_P:
+                yield from self._iter_paragraph(child)
+            elif tag == W_TBL:
+                yield from self._iter_table(child)
+            elif tag == W_SDT:
+                content = child.find(W_SDT_CONTENT)
+                if content is not None:
+                    yield from self._iter_blocks(content)
+    
+    def _iter_paragraph(self, p):
+        parts = []
+        text_boxes = []
+        has_page_break = self._collect_runs(p, parts, text_boxes)
+        
+        # Ngắt trang nằm trước nội dung đoạn → coi như đoạn bắt đầu trang mới
+        if has_page_break == 'before':
+            yield PAGE_BREAK
+        
+        text = ''.join(parts).strip()
+        if text:
+            prefix = self._numbering_prefix(p)
+            yield f"{prefix} {text}" if prefix else text
+        
+        for box in text_boxes:
+            yield from self._iter_blocks(box)
+        
+        if has_page_break == 'after' or self._ends_section(p):
+            yield PAGE_BREAK
+    
+    def _collect_runs(self, element, parts: list, text_boxes: list):
+        """
+        Gom text của các run; text box được tách ra để xử lý như block riêng
+        Trả về vị trí ngắt trang ('before' / 'after') nếu có
+        """
+        page_break = None
+        for child in element.iterchildren():
+            tag = child.tag
+            if tag == W_T:
+                if child.text:
+                    parts.append(child.text)
+            elif tag == W_TAB:
+                parts.append('\t')
+            elif tag == W_BR:
+                if child.get(W_TYPE) == 'page':
+                    page_break = 'after' if ''.join(parts).strip() else 'before'
+                else:
+                    parts.append('\n')
+            elif tag == W_CR:
+                parts.append('\n')
+            elif tag == W_NO_BREAK_HYPHEN:
+                parts.append('-')
+            elif tag == W_LAST_RENDERED_PAGE_BREAK:
+                if not ''.join(parts).strip():
+                    page_break = page_break or 'before'
+            elif tag == W_TXBX_CONTENT:
+                text_boxes.append(child)
+            elif tag in (W_PPR, W_RPR, MC_FALLBACK):
+                # mc:Fallback lặp lại nội dung của mc:Choice (text box dạng VML)
+                continue
+            else:
+                nested = self._collect_runs(child, parts, text_boxes)
+                page_break = page_break or nested
+        return page_break
+    
+    def _ends_section(self, p) -> bool:
+        ppr = p.find(W_PPR)
+        if ppr is None:
+            return False
+        sect_pr = ppr.find(W_SECTPR)
+        if sect_pr is None:
+            return False
+        sect_type = sect_pr.find(W_TYPE)
+        return sect_type is None or sect_type.get(W_VAL) != 'continuous'
+    
+    def _numbering_prefix(self, p) -> str:
+        num_id, ilvl = None, 0
+        ppr = p.find(W_PPR)
+        if ppr is not None:
+            num_pr = ppr.find(W_NUMPR)
+            if num_pr is not None:
+                num_id_el = num_pr.find(W_NUMID)
+                ilvl_el = num_pr.find(W_ILVL)
+                num_id = num_id_el.get(W_VAL) if num_id_el is not None else None
+                ilvl = int(ilvl_el.get(W_VAL)) if ilvl_el is not None else 0
+            else:
+                style = ppr.find(W_PSTYLE)
+                if style is not None and style.get(W_VAL) in self.style_numbering:
+                    num_id, ilvl = self.style_numbering[style.get(W_VAL)]
+        
+        # numId = 0 nghĩa là tắt đánh số
+        if not num_id or num_id == '0' or num_id not in self.levels:
+            return ''
+        
+        levels = self.levels[num_id]
+        counters = self.counters.setdefault(num_id, {})
+        counters[ilvl] = counters.get(ilvl, levels.get(ilvl, ('decimal', '', 1))[2] - 1) + 1
+        for deeper in [lvl for lvl in counters if lvl > ilvl]:
+            del counters[deeper]
+        
+        num_fmt, lvl_text, _ = levels.get(ilvl, ('decimal', f"%{ilvl + 1}.", 1))
+        if num_fmt == 'bullet':
+            return '-'
+        
+        prefix = lvl_text
+        for lvl in range(ilvl + 1):
+            placeholder = f"%{lvl + 1}"
+            if placeholder in prefix:
+                lvl_fmt, _, lvl_start = levels.get(lvl, ('decimal', '', 1))
+                prefix = prefix.replace(placeholder, _format_number(counters.get(lvl, lvl_start), lvl_fmt))
+        return prefix.strip()
+    
+    def _iter_table(self, tbl):
+        for tr in tbl.iterchildren(W_TR):
+            cells = []
+            row_has_break = False
+            for tc in tr.iterchildren(W_TC):
+                lines = []
+                for item in self._iter_blocks(tc):
+                    if item is PAGE_BREAK:
+                        row_has_break = True
+                    else:
+                        lines.append(item)
+                cells.append(' '.join(lines))
+            
+            if row_has_break:
+                yield PAGE_BREAK
+            if any(cell.strip() for cell in cells):
+                yield ' | '.join(cells)
+
 class FileProcessingService:
     
-    def extract_text_from_pdf(self, pdf_bytes: bytes) -> str:
+    def extract_text_from_pdf(
+        self,
+        pdf_bytes: bytes,
+        on_progress: Optional[Callable[..., None]] = None
+    ) -> str:
         """
         Trích xuất text từ PDF (text-based PDF)
         """
         try:
             pdf_reader = PdfReader(io.BytesIO(pdf_bytes))
+            if on_progress:
+                on_progress(pages_total=len(pdf_reader.pages))
             
             all_text = []
+            characters = 0
             for i, page in enumerate(pdf_reader.pages):
                 text = page.extract_text()
                 if text.strip():
                     all_text.append(f"--- Page {i+1} ---\n{text}")
+                    characters += len(text)
+                if on_progress:
+                    on_progress(pages_rendered=i + 1, characters=characters)
             
             result = "\n\n".join(all_text)
             
@@ -37,16 +332,10 @@ class FileProcessingService:
     def extract_text_from_docx(self, docx_bytes: bytes) -> str:
         """
         Trích xuất text từ Word document
+        Giữ nguyên thứ tự nội dung: đoạn văn, bảng, danh sách đánh số, text box
         """
         try:
-            doc = Document(io.BytesIO(docx_bytes))
-            
-            all_text = []
-            for para in doc.paragraphs:
-                if para.text.strip():
-                    all_text.append(para.text)
-            
-            result = "\n".join(all_text)
+            result = "\n".join(self.iter_docx_text(docx_bytes))
             logger.info(f"Extracted {len(result)} characters from DOCX")
             return result
             
@@ -54,6 +343,15 @@ class FileProcessingService:
             logger.error(f"DOCX extraction error: {str(e)}")
             raise Exception(f"Failed to extract text from DOCX: {str(e)}")
     
+    def iter_docx_text(self, docx_bytes: bytes):
+        """
+        Duyệt body của DOCX theo thứ tự và yield từng dòng text
+        Dùng cùng marker "--- Page N ---" như PDF (theo ngắt trang / ngắt section)
+        """
+        doc = Document(io.BytesIO(docx_bytes))
+        walker = _DocxWalker(doc)
+        yield from walker.iter_lines()
+    
     def detect_file_type(self, filename: str) -> str:
         """
         Phát hiện loại file từ extension
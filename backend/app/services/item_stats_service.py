@@ -0,0 +1,87 @@
+from typing import Dict, Iterable, List, Tuple
+import asyncio
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL_SECONDS = 30
+MAX_PENDING_ITEMS = 500  # Đủ số câu này thì ghi ngay, không chờ đến chu kỳ
+
+class ItemStatsService:
+    """
+    Cập nhật thống kê sử dụng của câu hỏi trong ngân hàng (times_used...) bằng RPC atomic
+    times_correct / times_incorrect được cộng dồn trong bộ nhớ rồi ghi theo lô (flush định kỳ)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[str, List[int]] = {}  # item id → [đúng, sai] chưa ghi
+
+    def increment_usage(self, supabase, item_ids: Iterable[str]):
+        """times_used += 1 cho mỗi id (1 round trip cho cả đề)"""
+        item_ids = [item_id for item_id in item_ids if item_id]
+        if not item_ids:
+            return
+        supabase.rpc('increment_question_usage', {'p_item_ids': item_ids}).execute()
+
+    def record_answers(self, supabase, outcomes: Iterable[Tuple[str, bool]]):
+        """Ghi nhận kết quả [(question_bank_item_id, is_correct)] vào bộ đệm"""
+        with self._lock:
+            for item_id, is_correct in outcomes:
+                if not item_id:
+                    continue
+                pending = self._pending.setdefault(item_id, [0, 0])
+                pending[0 if is_correct else 1] += 1
+            full = len(self._pending) >= MAX_PENDING_ITEMS
+
+        if full:
+            self.flush(supabase)
+
+    def _restore(self, counts: Dict[str, List[int]]):
+        for item_id, (correct, incorrect) in counts.items():
+            pending = self._pending.setdefault(item_id, [0, 0])
+            pending[0] += correct
+            pending[1] += incorrect
+
+    def flush(self, supabase) -> int:
+        """
+        Ghi toàn bộ delta đang chờ trong 1 lần gọi RPC
+        Lỗi thì trả delta lại bộ đệm để lần sau ghi tiếp
+        Returns:
+            Số câu hỏi đã cập nhật
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        if not pending:
+            return 0
+
+        item_ids = list(pending)
+        try:
+            supabase.rpc('increment_question_answer_counts', {
+                'p_item_ids': item_ids,
+                'p_correct': [pending[item_id][0] for item_id in item_ids],
+                'p_incorrect': [pending[item_id][1] for item_id in item_ids]
+            }).execute()
+        except Exception:
+            with self._lock:
+                self._restore(pending)
+            raise
+
+        return len(item_ids)
+
+    async def run_periodic_flush(self, supabase, interval: int = FLUSH_INTERVAL_SECONDS):
+        """Vòng lặp nền: flush bộ đệm mỗi interval giây (chạy từ startup của app)"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                flushed = await loop.run_in_executor(None, self.flush, supabase)
+                if flushed:
+                    logger.info(f"Flushed answer counters for {flushed} questions")
+            except Exception as e:
+                logger.error(f"Flush answer counters error: {str(e)}")
+
+# Singleton instance
+item_stats_service = ItemStatsService()
@@ -1,4 +1,5 @@
 from PIL import Image
+from typing import Callable, Optional
 import io
 import base64
 from openai import OpenAI
@@ -62,16 +63,28 @@ class OCRService:
             raise Exception(f"Failed to extract text using GPT Vision: {str(e)}")
     
     
-    def extract_text_from_pdf_images(self, pdf_path: str, lang: str = 'vie+eng') -> str:
+    def extract_text_from_pdf_images(
+        self,
+        pdf_path: str,
+        lang: str = 'vie+eng',
+        on_progress: Optional[Callable[..., None]] = None
+    ) -> str:
         """
         Trích xuất text từ PDF bằng cách convert sang ảnh rồi OCR
+        
+        Args:
+            on_progress: Callback nhận các trường tiến độ
+                (pages_total, pages_rendered, pages_ocr, characters)
         """
         try:
             from pdf2image import convert_from_path
             
             # Convert PDF to images
             images = convert_from_path(pdf_path)
+            if on_progress:
+                on_progress(pages_total=len(images), pages_rendered=len(images))
             
+            characters = 0
             all_text = []
             for i, image in enumerate(images):
                 logger.info(f"Processing page {i+1}/{len(images)}")
@@ -84,6 +97,10 @@ class OCRService:
                 # OCR
                 text = self.extract_text_from_image(img_byte_arr, lang)
                 all_text.append(f"--- Page {i+1} ---\n{text}")
+                
+                characters += len(text)
+                if on_progress:
+                    on_progress(pages_ocr=i + 1, characters=characters)
             
             return "\n\n".join(all_text)
             
@@ -0,0 +1,70 @@
+from typing import Optional
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ProgressTracker:
+    """
+    Theo dõi tiến độ các tác vụ xử lý dài (xử lý file, import...)
+    Lưu trong bộ nhớ của process, mỗi key là id của tác vụ
+    """
+
+    def __init__(self, ttl_seconds: int = 3600):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def start(self, key: str, **fields) -> dict:
+        """Bắt đầu theo dõi một tác vụ (ghi đè trạng thái cũ nếu có)"""
+        with self._lock:
+            self._evict_expired()
+            entry = {
+                "status": "processing",
+                **fields,
+                "version": 1,
+                "updated_at": time.time()
+            }
+            self._entries[key] = entry
+            return dict(entry)
+
+    def update(self, key: str, **fields) -> Optional[dict]:
+        """Cập nhật các trường tiến độ"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            entry.update(fields)
+            entry["version"] += 1
+            entry["updated_at"] = time.time()
+            return dict(entry)
+
+    def increment(self, key: str, field: str, amount: int = 1) -> Optional[dict]:
+        """Tăng một bộ đếm tiến độ"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            entry[field] = entry.get(field, 0) + amount
+            entry["version"] += 1
+            entry["updated_at"] = time.time()
+            return dict(entry)
+
+    def finish(self, key: str, status: str = "completed", **fields) -> Optional[dict]:
+        """Đánh dấu tác vụ đã kết thúc (completed / failed)"""
+        return self.update(key, status=status, **fields)
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            return dict(entry) if entry is not None else None
+
+    def _evict_expired(self):
+        cutoff = time.time() - self.ttl_seconds
+        expired = [key for key, entry in self._entries.items() if entry["updated_at"] < cutoff]
+        for key in expired:
+            del self._entries[key]
+
+# Singleton instance
+progress_tracker = ProgressTracker()
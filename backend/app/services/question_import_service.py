@@ -0,0 +1,233 @@
+from app.models.question_bank import QuestionBankItemCreate
+from app.services.dedup_service import dedup_service
+from app.services.similarity_service import similarity_index
+from pydantic import ValidationError
+from typing import Callable, Iterator, Optional, Tuple
+import codecs
+import csv
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+OPTION_KEYS = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H']
+MAX_REPORTED_ERRORS = 1000
+
+class QuestionImportService:
+    """
+    Import hàng loạt câu hỏi từ CSV / XLSX / JSON vào ngân hàng câu hỏi
+    Đọc file theo từng dòng, validate theo QuestionBankItemCreate và insert theo batch
+    """
+
+    def __init__(self, batch_size: int = 500):
+        self.batch_size = batch_size
+
+    def detect_format(self, filename: str) -> str:
+        ext = os.path.splitext(filename or "")[1].lower()
+        if ext == '.csv':
+            return 'csv'
+        if ext in ('.xlsx', '.xlsm'):
+            return 'xlsx'
+        if ext in ('.jsonl', '.ndjson'):
+            return 'jsonl'
+        if ext == '.json':
+            return 'json'
+        return 'unknown'
+
+    def iter_rows(self, file_obj, file_format: str) -> Iterator[Tuple[int, dict]]:
+        """
+        Yield (số dòng, dict) từ file nhị phân
+        Số dòng tính theo file gốc để báo lỗi (CSV/XLSX: header là dòng 1)
+        """
+        if file_format == 'csv':
+            reader = csv.DictReader(codecs.iterdecode(file_obj, 'utf-8-sig'))
+            for row_number, row in enumerate(reader, start=2):
+                yield row_number, row
+
+        elif file_format == 'xlsx':
+            from openpyxl import load_workbook
+
+            workbook = load_workbook(file_obj, read_only=True, data_only=True)
+            try:
+                rows = workbook.active.iter_rows(values_only=True)
+                header = next(rows, None)
+                if header is None:
+                    return
+                columns = [str(col).strip() if col is not None else '' for col in header]
+                for row_number, values in enumerate(rows, start=2):
+                    yield row_number, dict(zip(columns, values))
+            finally:
+                workbook.close()
+
+        elif file_format == 'jsonl':
+            for row_number, line in enumerate(codecs.iterdecode(file_obj, 'utf-8-sig'), start=1):
+                if line.strip():
+                    # Parse trong normalize_row để lỗi JSON chỉ ảnh hưởng dòng đó
+                    yield row_number, line
+
+        elif file_format == 'json':
+            data = json.load(codecs.getreader('utf-8-sig')(file_obj))
+            if isinstance(data, dict):
+                data = data.get('questions', [])
+            for row_number, row in enumerate(data, start=1):
+                yield row_number, row
+
+        else:
+            raise ValueError(f"Unsupported import format: {file_format}")
+
+    def normalize_row(self, row: dict) -> Optional[dict]:
+        """
+        Chuyển một dòng thô (CSV/XLSX có giá trị dạng text) về dạng QuestionBankItemCreate
+        Trả về None nếu dòng trống
+        """
+        if isinstance(row, str):
+            row = json.loads(row)
+        if not isinstance(row, dict):
+            raise ValueError("Row must be an object")
+
+        row = {
+            str(key).strip().lower(): (value.strip() if isinstance(value, str) else value)
+            for key, value in row.items()
+            if key is not None
+        }
+        if not any(value not in (None, '') for value in row.values()):
+            return None
+
+        item = {
+            key: row.get(key)
+            for key in ('question_text', 'question_type', 'explanation', 'difficulty', 'category_id')
+            if row.get(key) not in (None, '')
+        }
+        item.setdefault('question_type', 'multiple_choice')
+
+        # Options: cột "options" (JSON) hoặc các cột option_a / a ...
+        options = self._parse_json(row.get('options'))
+        if not isinstance(options, dict):
+            options = {}
+            for key in OPTION_KEYS:
+                value = row.get(f'option_{key.lower()}', row.get(key.lower()))
+                if value not in (None, ''):
+                    options[key] = str(value)
+        if options:
+            item['options'] = options
+
+        correct_answer = row.get('correct_answer')
+        if correct_answer not in (None, ''):
+            parsed = self._parse_json(correct_answer)
+            if isinstance(parsed, list):
+                correct_answer = [str(x) for x in parsed]
+            elif item['question_type'] in ('multiple_answer', 'ordering') and isinstance(correct_answer, str):
+                correct_answer = [x.strip() for x in correct_answer.split(',') if x.strip()]
+            else:
+                correct_answer = str(correct_answer)
+            item['correct_answer'] = correct_answer
+
+        if row.get('marks') not in (None, ''):
+            item['marks'] = row['marks']
+
+        tags = row.get('tags')
+        if isinstance(tags, str):
+            parsed = self._parse_json(tags)
+            tags = parsed if isinstance(parsed, list) else [
+                tag.strip() for tag in tags.replace(';', ',').split(',') if tag.strip()
+            ]
+        if tags:
+            item['tags'] = [str(tag) for tag in tags]
+
+        return item
+
+    def import_rows(
+        self,
+        rows: Iterator[Tuple[int, dict]],
+        bank_id: str,
+        supabase,
+        on_progress: Optional[Callable[..., None]] = None
+    ) -> dict:
+        """
+        Validate và insert theo batch
+        Returns:
+            {"total_rows", "imported", "failed", "errors": [{"row", "error"}], "item_ids"}
+        """
+        summary = {"total_rows": 0, "imported": 0, "failed": 0, "errors": [], "item_ids": []}
+        batch = []
+        batch_rows = []
+
+        def add_error(row_number, message):
+            summary["failed"] += 1
+            if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+                summary["errors"].append({"row": row_number, "error": message})
+
+        def flush():
+            if not batch:
+                return
+            inserted = []
+            try:
+                inserted = supabase.table('question_bank_items').insert(batch).execute().data
+                summary["imported"] += len(inserted)
+                summary["item_ids"].extend(item['id'] for item in inserted)
+            except Exception as e:
+                logger.error(f"Bulk insert error: {str(e)}")
+                for row_number in batch_rows:
+                    add_error(row_number, f"Insert failed: {str(e)}")
+            # Lỗi cập nhật index không làm các dòng đã insert bị tính là lỗi
+            try:
+                similarity_index.invalidate_items(inserted)
+            except Exception as e:
+                logger.error(f"Similarity index update error: {str(e)}")
+            batch.clear()
+            batch_rows.clear()
+            if on_progress:
+                on_progress(
+                    total_rows=summary["total_rows"],
+                    imported=summary["imported"],
+                    failed=summary["failed"]
+                )
+
+        try:
+            for row_number, row in rows:
+                try:
+                    item = self.normalize_row(row)
+                    if item is None:
+                        continue
+                    summary["total_rows"] += 1
+                    validated = QuestionBankItemCreate(**item)
+                except ValidationError as e:
+                    add_error(row_number, "; ".join(
+                        f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in e.errors()
+                    ))
+                    continue
+                except (ValueError, TypeError) as e:
+                    summary["total_rows"] += 1
+                    add_error(row_number, str(e))
+                    continue
+
+                batch.append({
+                    'question_bank_id': bank_id,
+                    **validated.dict(),
+                    'text_fingerprint': dedup_service.fingerprint(validated.question_text, validated.options)
+                })
+                batch_rows.append(row_number)
+                if len(batch) >= self.batch_size:
+                    flush()
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            # Lỗi đọc file giữa chừng: giữ lại các batch đã insert
+            flush()
+            raise ValueError(f"Could not read file: {str(e)}")
+
+        flush()
+        return summary
+
+    @staticmethod
+    def _parse_json(value):
+        if isinstance(value, (dict, list)):
+            return value
+        if isinstance(value, str) and value[:1] in ('{', '['):
+            try:
+                return json.loads(value)
+            except ValueError:
+                return None
+        return None
+
+# Singleton instance
+question_import_service = QuestionImportService()
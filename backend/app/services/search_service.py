@@ -0,0 +1,91 @@
+from typing import List, Optional, Tuple
+import re
+import unicodedata
+import logging
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_TOKEN_RE = re.compile(r'\w+')
+
+# Cột tsvector chỉ dùng để tìm kiếm (generated column), không trả ra API
+SEARCH_COLUMNS = ('search_vector', 'title_search')
+
+# Các cột trả về cho câu hỏi (không gồm cột nội bộ như search_vector)
+ITEM_FIELDS = [
+    'id', 'question_bank_id', 'question_text', 'question_type', 'options', 'correct_answer',
+    'explanation', 'difficulty', 'marks', 'category_id', 'tags',
+    'times_used', 'times_correct', 'times_incorrect', 'created_at', 'updated_at'
+]
+
+
+def without_search_columns(row: dict) -> dict:
+    """Bỏ các cột tsvector khỏi dòng đọc bằng select('*') / dữ liệu trả về sau insert, update"""
+    return {key: value for key, value in row.items() if key not in SEARCH_COLUMNS}
+
+
+def normalize_search_text(text: str) -> str:
+    """
+    Chuẩn hoá text để tìm kiếm: bỏ dấu tiếng Việt (kể cả đ/Đ), lowercase, gộp khoảng trắng
+    Khớp với immutable_unaccent(lower(...)) phía Postgres
+    """
+    if not text:
+        return ""
+    text = text.replace('đ', 'd').replace('Đ', 'D')
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return _WHITESPACE_RE.sub(' ', text).strip().lower()
+
+
+def search_tokens(text: str) -> List[str]:
+    """Tách token đã chuẩn hoá"""
+    return _TOKEN_RE.findall(normalize_search_text(text))
+
+
+def build_prefix_tsquery(text: str) -> str:
+    """
+    Tạo tsquery dạng prefix ('phuong:* & trinh:*') để tìm khi người dùng đang gõ dở
+    Trả về chuỗi rỗng nếu không có token nào
+    """
+    return ' & '.join(f"{token}:*" for token in search_tokens(text))
+
+
+class SearchService:
+    """Tìm kiếm câu hỏi trong ngân hàng qua full-text index (tsvector + trigram)"""
+
+    def search_questions(
+        self,
+        supabase,
+        user_id: str,
+        query: str,
+        bank_id: Optional[str] = None,
+        limit: int = 20,
+        offset: int = 0
+    ) -> Tuple[List[dict], int]:
+        """
+        Tìm câu hỏi trong các ngân hàng của user và ngân hàng công khai, xếp hạng theo độ liên quan
+        Returns:
+            (items kèm "rank", tổng số kết quả)
+        """
+        tsquery = build_prefix_tsquery(query)
+        if not tsquery:
+            return [], 0
+
+        result = supabase.rpc('search_question_bank_items', {
+            'p_user_id': user_id,
+            'p_tsquery': tsquery,
+            'p_plain_query': normalize_search_text(query),
+            'p_bank_id': bank_id,
+            'p_limit': limit,
+            'p_offset': offset
+        }).execute()
+
+        rows = result.data or []
+        items = [{**row['item'], 'rank': row['rank']} for row in rows]
+        total = rows[0]['total_count'] if rows else 0
+
+        logger.info(f"🔎 Search '{query}' → {total} results")
+        return items, total
+
+# Singleton instance
+search_service = SearchService()
@@ -0,0 +1,54 @@
+from typing import List
+import hashlib
+import random
+
+# Chỉ đảo đáp án với các dạng chọn đáp án (nhãn A/B/C... giữ nguyên để chấm điểm)
+SHUFFLE_OPTION_TYPES = ('multiple_choice', 'multiple_answer')
+
+
+def make_seed(*parts) -> int:
+    """Seed ổn định từ các thành phần (vd. exam_id + user_id)"""
+    raw = ":".join(str(part) for part in parts).encode()
+    return int.from_bytes(hashlib.sha256(raw).digest()[:8], 'big')
+
+
+def new_seed() -> int:
+    """Seed ngẫu nhiên cho một lượt làm bài (vừa cột bigint)"""
+    return random.SystemRandom().getrandbits(63)
+
+
+def attempt_seed(user_exam: dict) -> int:
+    """Seed của lượt làm bài; lượt cũ chưa có shuffle_seed thì suy ra từ id"""
+    seed = user_exam.get("shuffle_seed")
+    return int(seed) if seed is not None else make_seed(user_exam["id"])
+
+
+def permutation(n: int, seed: int) -> List[int]:
+    order = list(range(n))
+    random.Random(seed).shuffle(order)
+    return order
+
+
+def shuffle_exam_questions(
+    questions: List[dict],
+    seed: int,
+    shuffle_questions: bool = True,
+    shuffle_options: bool = False
+) -> List[dict]:
+    """
+    Đảo thứ tự câu hỏi / đáp án theo seed, không sửa danh sách gốc (payload dùng chung trong cache)
+    Đáp án được đảo bằng thứ tự key của dict options, kèm "option_order" để client hiển thị
+    """
+    order = permutation(len(questions), seed) if shuffle_questions else range(len(questions))
+
+    result = []
+    for idx, source_idx in enumerate(order):
+        question = {**questions[source_idx], "order_index": idx}
+        options = question.get("options")
+        if shuffle_options and isinstance(options, dict) and question.get("question_type") in SHUFFLE_OPTION_TYPES:
+            keys = list(options.keys())
+            keys = [keys[i] for i in permutation(len(keys), seed ^ make_seed(question.get("id")))]
+            question["options"] = {key: options[key] for key in keys}
+            question["option_order"] = keys
+        result.append(question)
+    return result
@@ -0,0 +1,206 @@
+from app.services.search_service import search_tokens
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+import hashlib
+import logging
+import math
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LOAD_PAGE_SIZE = 1000
+INDEX_TTL_SECONDS = 300        # Worker khác có thể đã sửa bank → nạp lại sau TTL
+MAX_INDEXED_ITEMS = 200000     # Tổng số câu giữ trong bộ nhớ, vượt thì bỏ bank ít dùng nhất
+INDEX_COLUMNS = 'id, question_text, options'
+RESULT_FIELDS = 'id, question_bank_id, question_text, question_type, options, correct_answer, explanation, difficulty'
+
+
+def _feature_hash(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), 'little')
+
+
+def text_features(question_text: str, options: Optional[dict] = None) -> List[str]:
+    """Đặc trưng của câu hỏi: unigram + bigram token đã bỏ dấu (câu hỏi và các đáp án)"""
+    parts = [question_text or ""]
+    if isinstance(options, dict):
+        parts.extend(str(value) for value in options.values() if value is not None)
+    tokens = search_tokens(" ".join(parts))
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+class BankIndex:
+    """
+    Index TF-IDF của một bank dạng inverted index trên mảng NumPy
+    Đặc trưng băm 64 bit (không gộp chiều → gần như không va chạm), vector đã chuẩn hoá L2
+    Chỉ giữ id câu hỏi và trọng số, không giữ nội dung / đáp án
+    """
+
+    def __init__(self, rows: List[dict]):
+        self.ids = [row['id'] for row in rows]
+        counts = [Counter(_feature_hash(f) for f in text_features(row.get('question_text'), row.get('options')))
+                  for row in rows]
+
+        doc_freq = Counter()
+        for doc in counts:
+            doc_freq.update(doc.keys())
+        self.doc_count = len(rows)
+
+        hashes, docs, weights = [], [], []
+        for doc_idx, doc in enumerate(counts):
+            doc_weights = {h: (1 + math.log(c)) * self._idf(doc_freq[h]) for h, c in doc.items()}
+            norm = math.sqrt(sum(w * w for w in doc_weights.values())) or 1.0
+            for h, w in doc_weights.items():
+                hashes.append(h)
+                docs.append(doc_idx)
+                weights.append(w / norm)
+
+        order = np.argsort(np.array(hashes, dtype=np.uint64), kind='stable')
+        self.hashes = np.array(hashes, dtype=np.uint64)[order]
+        self.docs = np.array(docs, dtype=np.int32)[order]
+        self.weights = np.array(weights, dtype=np.float32)[order]
+
+    def _idf(self, df: int) -> float:
+        return math.log((1 + self.doc_count) / (1 + df)) + 1
+
+    def scores(self, features: List[str]) -> np.ndarray:
+        """Cosine similarity giữa text truy vấn và mọi câu trong bank"""
+        scores = np.zeros(self.doc_count, dtype=np.float32)
+        query = Counter(_feature_hash(f) for f in features)
+        if not query or not self.doc_count:
+            return scores
+
+        postings = []
+        for h, count in query.items():
+            key = np.uint64(h)
+            lo = np.searchsorted(self.hashes, key, side='left')
+            hi = np.searchsorted(self.hashes, key, side='right')
+            postings.append((lo, hi, (1 + math.log(count)) * self._idf(hi - lo)))
+
+        norm = math.sqrt(sum(w * w for _, _, w in postings)) or 1.0
+        for lo, hi, w in postings:
+            if hi > lo:
+                np.add.at(scores, self.docs[lo:hi], self.weights[lo:hi] * (w / norm))
+        return scores
+
+
+class SimilarityIndex:
+    """
+    Tìm câu hỏi tương tự trong các bank: mỗi bank một BankIndex, nạp lười khi truy vấn
+    - Ghi trong process → invalidate bank ngay; ghi từ worker khác → hết hạn sau INDEX_TTL_SECONDS
+    - LRU theo bank, tổng số câu không vượt MAX_INDEXED_ITEMS
+    - Bản nạp dở bị bỏ nếu bank bị invalidate trong lúc nạp (không mất câu vừa thêm)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._banks: "OrderedDict[str, Tuple[BankIndex, float]]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._size = 0
+
+    def invalidate_banks(self, bank_ids: Iterable[str]):
+        with self._lock:
+            for bank_id in bank_ids:
+                if not bank_id:
+                    continue
+                self._generations[bank_id] = self._generations.get(bank_id, 0) + 1
+                entry = self._banks.pop(bank_id, None)
+                if entry:
+                    self._size -= entry[0].doc_count
+
+    def invalidate_items(self, items: Iterable[dict]):
+        """Câu hỏi được thêm / sửa / xóa (cần question_bank_id)"""
+        self.invalidate_banks({item.get('question_bank_id') for item in items})
+
+    def _get_bank(self, supabase, bank_id: str) -> BankIndex:
+        with self._lock:
+            entry = self._banks.get(bank_id)
+            if entry and time.time() - entry[1] < INDEX_TTL_SECONDS:
+                self._banks.move_to_end(bank_id)
+                return entry[0]
+            generation = self._generations.get(bank_id, 0)
+
+        index = BankIndex(self._fetch_items(supabase, bank_id))
+
+        with self._lock:
+            if self._generations.get(bank_id, 0) != generation:
+                # Bank đổi trong lúc nạp: dùng cho lần này nhưng không lưu
+                return index
+            old = self._banks.pop(bank_id, None)
+            if old:
+                self._size -= old[0].doc_count
+            self._banks[bank_id] = (index, time.time())
+            self._size += index.doc_count
+            while self._size > MAX_INDEXED_ITEMS and len(self._banks) > 1:
+                _, (evicted, _) = self._banks.popitem(last=False)
+                self._size -= evicted.doc_count
+        return index
+
+    @staticmethod
+    def _fetch_items(supabase, bank_id: str) -> List[dict]:
+        rows = []
+        last_id = None
+        while True:
+            query = supabase.table('question_bank_items')\
+                .select(INDEX_COLUMNS)\
+                .eq('question_bank_id', bank_id)
+            if last_id:
+                query = query.gt('id', last_id)
+            page = query.order('id').limit(LOAD_PAGE_SIZE).execute().data
+            rows.extend(page)
+            if len(page) < LOAD_PAGE_SIZE:
+                break
+            last_id = page[-1]['id']
+        return rows
+
+    def query(
+        self,
+        supabase,
+        text: str,
+        bank_ids: List[str],
+        top_k: int = 5,
+        min_similarity: float = 0.0,
+        max_similarity: float = 1.0
+    ) -> List[dict]:
+        """
+        Top-k câu hỏi gần nhất trong các bank cho phép
+        Returns:
+            Danh sách item (RESULT_FIELDS) kèm "similarity", giảm dần
+        """
+        started = time.time()
+        features = text_features(text)
+        if not features or top_k <= 0:
+            return []
+
+        hits = []
+        for bank_id in dict.fromkeys(bank_ids):
+            index = self._get_bank(supabase, bank_id)
+            scores = index.scores(features)
+            allowed = np.flatnonzero((scores >= min_similarity) & (scores <= max_similarity) & (scores > 0))
+            if not len(allowed):
+                continue
+            k = min(top_k, len(allowed))
+            best = allowed[np.argpartition(-scores[allowed], k - 1)[:k]]
+            hits.extend((float(scores[i]), index.ids[i]) for i in best)
+
+        hits = sorted(hits, reverse=True)[:top_k]
+        if not hits:
+            return []
+
+        # Chỉ đọc nội dung đầy đủ của các câu được chọn
+        rows = supabase.table('question_bank_items')\
+            .select(RESULT_FIELDS)\
+            .in_('id', [item_id for _, item_id in hits])\
+            .execute().data
+        rows_by_id = {row['id']: row for row in rows}
+
+        logger.info(f"🧭 Similarity query over {len(bank_ids)} banks in {time.time() - started:.3f}s")
+        return [
+            {**rows_by_id[item_id], 'similarity': round(score, 4)}
+            for score, item_id in hits
+            if item_id in rows_by_id
+        ]
+
+# Singleton instance
+similarity_index = SimilarityIndex()
@@ -0,0 +1,123 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+RELEARN_MINUTES = 10  # Trả lời sai → ôn lại sau 10 phút
+QUALITY_CORRECT = 4
+QUALITY_INCORRECT = 1
+STATE_FIELDS = 'question_bank_item_id, ease, interval_days, repetitions, lapses, due_at, last_reviewed_at'
+
+
+def schedule(state: Optional[dict], quality: int, now: datetime) -> dict:
+    """
+    Một bước SM-2: trạng thái hiện tại + chất lượng trả lời (0-5) → trạng thái mới
+    quality < 3 là trả lời sai (lapse)
+    """
+    state = state or {}
+    ease = float(state.get('ease') or DEFAULT_EASE)
+    interval = float(state.get('interval_days') or 0)
+    repetitions = int(state.get('repetitions') or 0)
+    lapses = int(state.get('lapses') or 0)
+
+    ease = max(MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+
+    if quality < 3:
+        repetitions = 0
+        lapses += 1
+        interval = 0
+        due_at = now + timedelta(minutes=RELEARN_MINUTES)
+    else:
+        repetitions += 1
+        if repetitions == 1:
+            interval = 1
+        elif repetitions == 2:
+            interval = 6
+        else:
+            interval = round(interval * ease, 2)
+        due_at = now + timedelta(days=interval)
+
+    return {
+        'ease': round(ease, 3),
+        'interval_days': interval,
+        'repetitions': repetitions,
+        'lapses': lapses,
+        'due_at': due_at.isoformat(),
+        'last_reviewed_at': now.isoformat()
+    }
+
+
+class SpacedRepetitionService:
+    """
+    Lịch ôn tập theo SM-2 cho từng user / câu hỏi (bảng review_items)
+    Mỗi lần ghi nhận kết quả: 1 query đọc trạng thái + 1 upsert cho cả lô
+    """
+
+    def record_outcomes(
+        self,
+        supabase,
+        user_id: str,
+        outcomes: Iterable[Tuple[str, bool]]
+    ) -> int:
+        """
+        Ghi nhận kết quả trả lời [(question_bank_item_id, is_correct)]
+        Câu xuất hiện nhiều lần trong lô được áp dụng lần lượt
+        Returns:
+            Số câu được cập nhật
+        """
+        outcomes = [(item_id, is_correct) for item_id, is_correct in outcomes if item_id]
+        if not outcomes:
+            return 0
+
+        item_ids = list(dict.fromkeys(item_id for item_id, _ in outcomes))
+        existing = supabase.table('review_items')\
+            .select(STATE_FIELDS)\
+            .eq('user_id', user_id)\
+            .in_('question_bank_item_id', item_ids)\
+            .execute()
+        states: Dict[str, dict] = {row['question_bank_item_id']: row for row in existing.data}
+
+        now = datetime.now(timezone.utc)
+        for item_id, is_correct in outcomes:
+            quality = QUALITY_CORRECT if is_correct else QUALITY_INCORRECT
+            states[item_id] = schedule(states.get(item_id), quality, now)
+
+        supabase.table('review_items').upsert(
+            [
+                {'user_id': user_id, 'question_bank_item_id': item_id, **states[item_id]}
+                for item_id in item_ids
+            ],
+            on_conflict='user_id,question_bank_item_id'
+        ).execute()
+
+        return len(item_ids)
+
+    def due_items(
+        self,
+        supabase,
+        user_id: str,
+        limit: int = 20,
+        lapsed_only: bool = False,
+        include_upcoming: bool = False
+    ) -> List[str]:
+        """
+        N câu đến hạn ôn sớm nhất (theo index (user_id, due_at))
+        - lapsed_only: chỉ các câu đã từng trả lời sai
+        - include_upcoming: lấy cả câu chưa đến hạn (xếp sau các câu đã đến hạn)
+        """
+        query = supabase.table('review_items')\
+            .select('question_bank_item_id')\
+            .eq('user_id', user_id)
+        if not include_upcoming:
+            query = query.lte('due_at', datetime.now(timezone.utc).isoformat())
+        if lapsed_only:
+            query = query.gt('lapses', 0)
+
+        result = query.order('due_at').limit(limit).execute()
+        return [row['question_bank_item_id'] for row in result.data]
+
+# Singleton instance
+spaced_repetition_service = SpacedRepetitionService()
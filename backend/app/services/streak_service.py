@@ -0,0 +1,97 @@
+from datetime import date, datetime, timedelta, timezone, tzinfo
+from typing import Optional, Tuple, Union
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def activity_date(moment: Optional[datetime] = None, tz: tzinfo = timezone.utc) -> date:
+    """Ngày (theo múi giờ tz) của một thời điểm hoạt động, mặc định là hiện tại"""
+    moment = moment or datetime.now(timezone.utc)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(tz).date()
+
+
+def _as_date(value: Union[str, date, None]) -> Optional[date]:
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def advance_streak(
+    current_streak: int,
+    last_active_date: Union[str, date, None],
+    day: date
+) -> Tuple[int, date]:
+    """
+    Cập nhật chuỗi ngày liên tiếp khi có hoạt động vào ngày day
+    - Cùng ngày: giữ nguyên
+    - Ngày kế tiếp: +1
+    - Cách quãng: bắt đầu lại từ 1
+    - Hoạt động ghi muộn (day < last_active_date): bỏ qua
+    Returns:
+        (current_streak, last_active_date) mới
+    """
+    last = _as_date(last_active_date)
+    if last is None or not current_streak:
+        return 1, day
+    if day <= last:
+        return current_streak, last
+    if day - last == timedelta(days=1):
+        return current_streak + 1, day
+    return 1, day
+
+
+def current_streak(
+    stored_streak: Optional[int],
+    last_active_date: Union[str, date, None],
+    today: Optional[date] = None
+) -> int:
+    """Chuỗi hiện tại khi đọc: còn hiệu lực nếu lần hoạt động cuối là hôm nay hoặc hôm qua"""
+    last = _as_date(last_active_date)
+    if last is None or not stored_streak:
+        return 0
+    today = today or activity_date()
+    return stored_streak if (today - last).days <= 1 else 0
+
+
+class StreakService:
+    """
+    Chuỗi ngày học liên tiếp, lưu trong user_statistics (current_streak, last_active_date)
+    Cập nhật tăng dần mỗi lần chấm bài / hoàn thành luyện tập, đọc ra O(1)
+    """
+
+    def apply(self, stats: dict, day: Optional[date] = None) -> dict:
+        """Các cột cần ghi vào user_statistics (dùng chung với lệnh update sẵn có)"""
+        streak, last = advance_streak(
+            stats.get("current_streak") or 0,
+            stats.get("last_active_date"),
+            day or activity_date()
+        )
+        return {"current_streak": streak, "last_active_date": last.isoformat()}
+
+    def record_activity(self, supabase, user_id: str, day: Optional[date] = None):
+        """Ghi nhận hoạt động của user (vd. hoàn thành practice session)"""
+        stats = supabase.table("user_statistics")\
+            .select("current_streak, last_active_date")\
+            .eq("user_id", user_id)\
+            .execute()
+
+        if stats.data:
+            supabase.table("user_statistics")\
+                .update(self.apply(stats.data[0], day))\
+                .eq("user_id", user_id)\
+                .execute()
+        else:
+            supabase.table("user_statistics").insert({
+                "user_id": user_id,
+                "total_exams_taken": 0,
+                "total_exams_completed": 0,
+                "average_score": 0,
+                "total_time_spent": 0,
+                **self.apply({}, day)
+            }).execute()
+
+# Singleton instance
+streak_service = StreakService()
@@ -0,0 +1,75 @@
+"""
+Benchmark trích xuất text DOCX (FileProcessingService.extract_text_from_docx)
+
+Sinh một tài liệu đề thi giả lập (đoạn văn, danh sách đánh số, bảng, ngắt trang) rồi đo thời gian trích xuất
+
+Chạy từ thư mục backend:
+    python benchmarks/bench_docx_extract.py --pages 200 --repeat 3
+"""
+from pathlib import Path
+import argparse
+import io
+import statistics
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from docx import Document
+from docx.enum.text import WD_BREAK
+from app.services.file_service import FileProcessingService
+
+QUESTIONS_PER_PAGE = 5
+
+
+def build_docx(pages: int) -> bytes:
+    doc = Document()
+    number = 1
+    for page in range(pages):
+        for _ in range(QUESTIONS_PER_PAGE):
+            doc.add_paragraph(
+                f"Câu {number}: Phát biểu nào sau đây đúng về định luật bảo toàn năng lượng?",
+                style='List Number'
+            )
+            for label in "ABCD":
+                doc.add_paragraph(f"{label}. Đáp án {label} của câu {number}", style='List Bullet')
+            number += 1
+
+        table = doc.add_table(rows=3, cols=3)
+        for r, row in enumerate(table.rows):
+            for c, cell in enumerate(row.cells):
+                cell.text = f"Ô {r}-{c} trang {page + 1}"
+
+        if page < pages - 1:
+            doc.add_paragraph().add_run().add_break(WD_BREAK.PAGE)
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    data = build_docx(args.pages)
+    print(f"Generated {args.pages}-page DOCX ({len(data) / 1024:.0f} KiB) in {time.perf_counter() - started:.2f}s")
+
+    service = FileProcessingService()
+    timings = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        text = service.extract_text_from_docx(data)
+        timings.append(time.perf_counter() - started)
+
+    best = min(timings)
+    print(f"Extracted {len(text)} characters, {text.count('--- Page ')} page markers")
+    print(f"best {best:.3f}s | median {statistics.median(timings):.3f}s | "
+          f"{args.pages / best:.0f} pages/s | {len(data) / best / 1024 / 1024:.1f} MiB/s")
+
+
+if __name__ == '__main__':
+    main()
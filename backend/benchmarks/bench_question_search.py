@@ -0,0 +1,125 @@
+"""
+Benchmark tìm kiếm câu hỏi: ilike '%term%' (cách cũ) so với full-text index (tsvector + trigram)
+
+Cần project Supabase đã chạy migrations/002_question_search.sql và biến môi trường như khi chạy app
+(SUPABASE_URL, SUPABASE_SERVICE_KEY...). Script tạo 1 ngân hàng riêng cho benchmark, nạp N câu hỏi giả lập
+(mặc định 100k), đo từng cách tìm rồi xóa ngân hàng (trừ khi --keep)
+
+Chạy từ thư mục backend:
+    python benchmarks/bench_question_search.py --user-id <profile uuid> --items 100000
+    python benchmarks/bench_question_search.py --user-id <uuid> --bank-id <bank đã nạp sẵn>  # bỏ qua bước nạp
+"""
+from pathlib import Path
+import argparse
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.core.supabase import supabase_admin
+from app.services.search_service import build_prefix_tsquery, search_service
+
+INSERT_BATCH_SIZE = 1000
+SEARCH_TERMS = ['quang hợp', 'định luật', 'phương trình bậc hai', 'Việt Nam', 'xyzkhongco']
+WORDS = [
+    'năng lượng', 'định luật', 'bảo toàn', 'quang hợp', 'tế bào', 'phương trình', 'bậc hai', 'nghiệm',
+    'lịch sử', 'Việt Nam', 'cách mạng', 'hóa học', 'phản ứng', 'oxi hóa', 'địa lý', 'khí hậu',
+    'văn học', 'tác giả', 'nhân vật', 'ngữ pháp', 'tiếng Anh', 'vận tốc', 'gia tốc', 'điện trở'
+]
+
+
+def seed_bank(supabase, user_id: str, items: int) -> str:
+    bank = supabase.table('question_banks').insert({
+        'user_id': user_id,
+        'name': f'[benchmark] search {items}',
+        'is_public': False
+    }).execute().data[0]
+
+    rng = random.Random(42)
+    started = time.perf_counter()
+    for start in range(0, items, INSERT_BATCH_SIZE):
+        rows = []
+        for n in range(start, min(start + INSERT_BATCH_SIZE, items)):
+            words = rng.sample(WORDS, 6)
+            rows.append({
+                'question_bank_id': bank['id'],
+                'question_text': f"Câu {n + 1}: {' '.join(words)} là gì?",
+                'question_type': 'multiple_choice',
+                'options': {label: f"{rng.choice(WORDS)} {label}" for label in 'ABCD'},
+                'correct_answer': 'A',
+                'marks': 1
+            })
+        supabase.table('question_bank_items').insert(rows).execute()
+    print(f"Seeded {items} items into bank {bank['id']} in {time.perf_counter() - started:.1f}s")
+    return bank['id']
+
+
+def timed(fn, repeat: int):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return result, min(timings), statistics.median(timings)
+
+
+def ilike_search(supabase, bank_id: str, term: str):
+    result = supabase.table('question_bank_items')\
+        .select('id', count='exact')\
+        .eq('question_bank_id', bank_id)\
+        .ilike('question_text', f'%{term}%')\
+        .limit(20)\
+        .execute()
+    return result.count or 0
+
+
+def tsvector_search(supabase, bank_id: str, term: str):
+    result = supabase.table('question_bank_items')\
+        .select('id', count='exact')\
+        .eq('question_bank_id', bank_id)\
+        .text_search('search_vector', build_prefix_tsquery(term), options={'config': 'simple'})\
+        .limit(20)\
+        .execute()
+    return result.count or 0
+
+
+def ranked_search(supabase, user_id: str, bank_id: str, term: str):
+    _, total = search_service.search_questions(supabase, user_id, term, bank_id=bank_id, limit=20)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--user-id', required=True, help='Chủ sở hữu ngân hàng benchmark (profiles.id)')
+    parser.add_argument('--items', type=int, default=100_000)
+    parser.add_argument('--bank-id', help='Dùng ngân hàng có sẵn thay vì nạp mới')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--keep', action='store_true', help='Không xóa ngân hàng benchmark')
+    args = parser.parse_args()
+
+    supabase = supabase_admin
+    bank_id = args.bank_id or seed_bank(supabase, args.user_id, args.items)
+
+    try:
+        print(f"{'term':<24}{'path':<12}{'matches':>9}{'best ms':>10}{'median ms':>11}")
+        for term in SEARCH_TERMS:
+            paths = [
+                ('ilike', lambda: ilike_search(supabase, bank_id, term)),
+                ('tsvector', lambda: tsvector_search(supabase, bank_id, term)),
+                ('rpc ranked', lambda: ranked_search(supabase, args.user_id, bank_id, term)),
+            ]
+            for name, fn in paths:
+                matches, best, median = timed(fn, args.repeat)
+                print(f"{term:<24}{name:<12}{matches:>9}{best:>10.1f}{median:>11.1f}")
+    finally:
+        if not args.bank_id and not args.keep:
+            supabase.table('question_bank_items').delete().eq('question_bank_id', bank_id).execute()
+            supabase.table('question_banks').delete().eq('id', bank_id).execute()
+            print(f"Removed benchmark bank {bank_id}")
+
+
+if __name__ == '__main__':
+    main()
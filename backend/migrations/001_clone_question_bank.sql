@@ -0,0 +1,52 @@
+-- Clone ngân hàng câu hỏi phía server (dùng bởi POST /question-banks/import/{share_code})
+-- Một lần gọi RPC = 1 INSERT bank + 1 INSERT ... SELECT cho toàn bộ câu hỏi
+
+create or replace function clone_question_bank(
+    p_source_bank_id uuid,
+    p_user_id uuid,
+    p_name text,
+    p_description text
+)
+returns table (bank_id uuid, questions_imported integer)
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_bank_id uuid;
+    v_count integer;
+begin
+    insert into question_banks (user_id, name, description, is_public)
+    values (p_user_id, p_name, p_description, false)
+    returning id into v_bank_id;
+
+    insert into question_bank_items (
+        question_bank_id, question_text, question_type, options, correct_answer,
+        explanation, difficulty, marks, category_id, tags,
+        times_used, times_correct, times_incorrect
+    )
+    select
+        v_bank_id, question_text, question_type, options, correct_answer,
+        explanation, difficulty, marks, category_id, tags,
+        0, 0, 0
+    from question_bank_items
+    where question_bank_id = p_source_bank_id
+    order by created_at;
+
+    get diagnostics v_count = row_count;
+
+    return query select v_bank_id, v_count;
+end;
+$$;
+
+-- Chỉ backend (service role) được gọi: hàm chạy security definer (bỏ qua RLS) và tin tham số do bên gọi truyền vào
+revoke execute on function clone_question_bank(uuid, uuid, text, text) from public, anon, authenticated;
+grant execute on function clone_question_bank(uuid, uuid, text, text) to service_role;
+
+-- Kiểm tra trùng tên khi import (thay cho ilike '%name%')
+create index if not exists idx_question_banks_user_name
+    on question_banks (user_id, name);
+
+-- Đọc câu hỏi theo bank
+create index if not exists idx_question_bank_items_bank_created
+    on question_bank_items (question_bank_id, created_at);
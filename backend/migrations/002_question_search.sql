@@ -0,0 +1,74 @@
+-- Tìm kiếm full-text không phân biệt dấu trên question_bank_items
+-- (dùng bởi GET /question-banks/search và filter `search` của GET /question-banks/{bank_id}/items)
+
+create extension if not exists unaccent with schema extensions;
+create extension if not exists pg_trgm with schema extensions;
+
+-- unaccent() không IMMUTABLE nên không dùng trực tiếp trong generated column / index được
+create or replace function immutable_unaccent(text)
+returns text
+language sql
+immutable
+parallel safe
+strict
+set search_path = public, extensions
+as $$
+    select extensions.unaccent('extensions.unaccent'::regdictionary, $1)
+$$;
+
+alter table question_bank_items
+    add column if not exists search_vector tsvector
+    generated always as (
+        to_tsvector('simple', immutable_unaccent(lower(coalesce(question_text, ''))))
+    ) stored;
+
+create index if not exists idx_question_bank_items_search_vector
+    on question_bank_items using gin (search_vector);
+
+-- Trigram index cho tìm kiếm gần đúng (gõ sai chính tả)
+create index if not exists idx_question_bank_items_text_trgm
+    on question_bank_items using gin (immutable_unaccent(lower(question_text)) extensions.gin_trgm_ops);
+
+-- p_tsquery: prefix query đã chuẩn hoá phía backend, ví dụ 'phuong:* & trinh:*'
+-- p_plain_query: text đã bỏ dấu, dùng cho trigram similarity
+create or replace function search_question_bank_items(
+    p_user_id uuid,
+    p_tsquery text,
+    p_plain_query text,
+    p_bank_id uuid default null,
+    p_limit integer default 20,
+    p_offset integer default 0
+)
+returns table (item jsonb, rank real, total_count bigint)
+language sql
+stable
+security definer
+set search_path = public, extensions
+as $$
+    with query as (
+        select to_tsquery('simple', p_tsquery) as q
+    )
+    select
+        to_jsonb(i) - 'search_vector' as item,
+        greatest(
+            ts_rank_cd(i.search_vector, query.q),
+            similarity(immutable_unaccent(lower(i.question_text)), p_plain_query)
+        )::real as rank,
+        count(*) over () as total_count
+    from question_bank_items i
+    join question_banks b on b.id = i.question_bank_id
+    cross join query
+    where (b.user_id = p_user_id or b.is_public)
+      and (p_bank_id is null or i.question_bank_id = p_bank_id)
+      and (
+          i.search_vector @@ query.q
+          or immutable_unaccent(lower(i.question_text)) % p_plain_query
+      )
+    order by rank desc, i.created_at desc
+    limit p_limit
+    offset p_offset
+$$;
+
+-- Chỉ backend (service role) được gọi: hàm chạy security definer (bỏ qua RLS) và tin tham số do bên gọi truyền vào
+revoke execute on function search_question_bank_items(uuid, text, text, uuid, integer, integer) from public, anon, authenticated;
+grant execute on function search_question_bank_items(uuid, text, text, uuid, integer, integer) to service_role;
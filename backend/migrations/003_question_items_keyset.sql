@@ -0,0 +1,8 @@
+-- Keyset pagination cho GET /question-banks/{bank_id}/items
+-- ORDER BY created_at DESC, id DESC với cursor (created_at, id)
+
+create index if not exists idx_question_bank_items_bank_keyset
+    on question_bank_items (question_bank_id, created_at desc, id desc);
+
+-- Index cũ (question_bank_id, created_at) đã được bao bởi index trên
+drop index if exists idx_question_bank_items_bank_created;
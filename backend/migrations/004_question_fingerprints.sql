@@ -0,0 +1,80 @@
+-- Fingerprint SimHash (64 bit) cho phát hiện câu hỏi gần trùng lặp
+-- Giá trị do backend tính (app/services/dedup_service.py), 4 dải 16 bit làm index LSH
+
+alter table question_bank_items
+    add column if not exists text_fingerprint bigint;
+
+alter table question_bank_items
+    add column if not exists fp_band0 integer generated always as ((text_fingerprint & 65535)::integer) stored,
+    add column if not exists fp_band1 integer generated always as (((text_fingerprint >> 16) & 65535)::integer) stored,
+    add column if not exists fp_band2 integer generated always as (((text_fingerprint >> 32) & 65535)::integer) stored,
+    add column if not exists fp_band3 integer generated always as (((text_fingerprint >> 48) & 65535)::integer) stored;
+
+create index if not exists idx_question_bank_items_fp_band0 on question_bank_items (fp_band0);
+create index if not exists idx_question_bank_items_fp_band1 on question_bank_items (fp_band1);
+create index if not exists idx_question_bank_items_fp_band2 on question_bank_items (fp_band2);
+create index if not exists idx_question_bank_items_fp_band3 on question_bank_items (fp_band3);
+
+-- Clone bank giữ nguyên fingerprint
+create or replace function clone_question_bank(
+    p_source_bank_id uuid,
+    p_user_id uuid,
+    p_name text,
+    p_description text
+)
+returns table (bank_id uuid, questions_imported integer)
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_bank_id uuid;
+    v_count integer;
+begin
+    insert into question_banks (user_id, name, description, is_public)
+    values (p_user_id, p_name, p_description, false)
+    returning id into v_bank_id;
+
+    insert into question_bank_items (
+        question_bank_id, question_text, question_type, options, correct_answer,
+        explanation, difficulty, marks, category_id, tags, text_fingerprint,
+        times_used, times_correct, times_incorrect
+    )
+    select
+        v_bank_id, question_text, question_type, options, correct_answer,
+        explanation, difficulty, marks, category_id, tags, text_fingerprint,
+        0, 0, 0
+    from question_bank_items
+    where question_bank_id = p_source_bank_id
+    order by created_at;
+
+    get diagnostics v_count = row_count;
+
+    return query select v_bank_id, v_count;
+end;
+$$;
+
+-- Chỉ backend (service role) được gọi: hàm chạy security definer (bỏ qua RLS) và tin tham số do bên gọi truyền vào
+revoke execute on function clone_question_bank(uuid, uuid, text, text) from public, anon, authenticated;
+grant execute on function clone_question_bank(uuid, uuid, text, text) to service_role;
+
+-- Ghi fingerprint hàng loạt (backfill khi quét trùng lặp)
+-- Các câu hỏi cũ chưa có fingerprint được tính khi gọi GET /question-banks/duplicates
+create or replace function set_question_fingerprints(
+    p_ids uuid[],
+    p_fingerprints bigint[]
+)
+returns void
+language sql
+security definer
+set search_path = public
+as $$
+    update question_bank_items q
+    set text_fingerprint = f.fingerprint
+    from unnest(p_ids, p_fingerprints) as f(id, fingerprint)
+    where q.id = f.id;
+$$;
+
+-- Chỉ backend (service role) được gọi: hàm chạy security definer (bỏ qua RLS) và tin tham số do bên gọi truyền vào
+revoke execute on function set_question_fingerprints(uuid[], bigint[]) from public, anon, authenticated;
+grant execute on function set_question_fingerprints(uuid[], bigint[]) to service_role;
@@ -0,0 +1,19 @@
+-- GET /exams/: đếm câu hỏi bằng embedded aggregate, tìm kiếm theo tiêu đề qua full-text index
+
+-- Tiêu đề đã bỏ dấu (immutable_unaccent định nghĩa trong 002_question_search.sql)
+alter table exams
+    add column if not exists title_search tsvector
+    generated always as (
+        to_tsvector('simple', immutable_unaccent(lower(coalesce(title, ''))))
+    ) stored;
+
+create index if not exists idx_exams_title_search
+    on exams using gin (title_search);
+
+-- Danh sách đề của user, mới nhất trước
+create index if not exists idx_exams_created_by_created
+    on exams (created_by, created_at desc);
+
+-- exam_questions(count) theo exam
+create index if not exists idx_exam_questions_exam
+    on exam_questions (exam_id, order_index);
@@ -0,0 +1,20 @@
+-- Seed đảo thứ tự câu hỏi / đáp án cho từng lượt làm bài
+-- Tạo ở POST /submissions/start; thứ tự được tính lại từ seed khi cần (làm bài, xem kết quả)
+
+alter table user_exams
+    add column if not exists shuffle_seed bigint;
+
+-- POST /submissions/start dùng lại lượt in_progress của (user, exam) → seed không đổi khi tải lại trang
+create index if not exists idx_user_exams_user_exam_status
+    on user_exams (user_id, exam_id, status, started_at desc);
+
+-- Lượt in_progress đã quá thời gian làm bài được chuyển sang 'expired' thay vì mở lại
+do $$
+begin
+    if exists (select 1 from pg_constraint where conname = 'user_exams_status_check') then
+        alter table user_exams drop constraint user_exams_status_check;
+        alter table user_exams add constraint user_exams_status_check
+            check (status in ('in_progress', 'submitted', 'graded', 'expired')) not valid;
+    end if;
+end;
+$$;
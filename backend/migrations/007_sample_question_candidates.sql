@@ -0,0 +1,62 @@
+-- Ứng viên cho sinh đề ngẫu nhiên (POST /exam-generator/generate-random)
+-- Lọc và lấy mẫu có trọng số ngay trong DB, chỉ trả về id + cột phân tầng
+--
+-- Mỗi tầng (difficulty, category_id) trả tối đa p_per_stratum dòng có sort_key lớn nhất
+-- sort_key = random() ^ (1 + times_used) (Efraimidis–Spirakis, trọng số 1 / (1 + times_used))
+-- → câu hỏi ít được dùng có xác suất được chọn cao hơn
+-- p_prefer_unused = false → trọng số đều (sort_key = random())
+
+create or replace function sample_question_candidates(
+    p_bank_ids uuid[],
+    p_category_ids uuid[] default null,
+    p_difficulties text[] default null,
+    p_tags text[] default null,
+    p_per_stratum integer default 100,
+    p_prefer_unused boolean default true
+)
+returns table (
+    id uuid,
+    difficulty text,
+    category_id uuid,
+    marks integer,
+    sort_key double precision
+)
+language sql
+volatile
+security definer
+set search_path = public
+as $$
+    select id, difficulty, category_id, marks, sort_key
+    from (
+        select
+            c.*,
+            row_number() over (
+                partition by c.difficulty, c.category_id
+                order by c.sort_key desc
+            ) as stratum_rank
+        from (
+            select
+                q.id,
+                q.difficulty,
+                q.category_id,
+                q.marks,
+                case
+                    when p_prefer_unused then power(random(), 1 + coalesce(q.times_used, 0))
+                    else random()
+                end as sort_key
+            from question_bank_items q
+            where q.question_bank_id = any(p_bank_ids)
+              and (p_category_ids is null or q.category_id = any(p_category_ids))
+              and (p_difficulties is null or q.difficulty = any(p_difficulties))
+              and (p_tags is null or q.tags @> p_tags)
+        ) c
+    ) ranked
+    where stratum_rank <= p_per_stratum;
+$$;
+
+-- Chỉ backend (service role) được gọi: hàm chạy security definer (bỏ qua RLS) và tin tham số do bên gọi truyền vào
+revoke execute on function sample_question_candidates(uuid[], uuid[], text[], text[], integer, boolean) from public, anon, authenticated;
+grant execute on function sample_question_candidates(uuid[], uuid[], text[], text[], integer, boolean) to service_role;
+
+create index if not exists idx_question_bank_items_bank_strata
+    on question_bank_items (question_bank_id, difficulty, category_id);
@@ -0,0 +1,22 @@
+-- Tăng times_used cho nhiều câu hỏi trong 1 lệnh (atomic, không mất lượt tăng khi chạy đồng thời)
+-- p_item_ids có thể chứa id lặp lại: mỗi lần xuất hiện tăng 1
+
+create or replace function increment_question_usage(p_item_ids uuid[])
+returns void
+language sql
+security definer
+set search_path = public
+as $$
+    update question_bank_items q
+    set times_used = coalesce(q.times_used, 0) + u.uses
+    from (
+        select item_id, count(*)::integer as uses
+        from unnest(p_item_ids) as item_id
+        group by item_id
+    ) u
+    where q.id = u.item_id;
+$$;
+
+-- Chỉ backend (service role) được gọi: hàm chạy security definer (bỏ qua RLS) và tin tham số do bên gọi truyền vào
+revoke execute on function increment_question_usage(uuid[]) from public, anon, authenticated;
+grant execute on function increment_question_usage(uuid[]) to service_role;
@@ -0,0 +1,18 @@
+-- Trạng thái ghi nhớ (spaced repetition, SM-2) của từng user với từng câu hỏi
+-- Cập nhật bởi app/services/spaced_repetition_service.py khi chấm bài thi / luyện tập
+
+create table if not exists review_items (
+    user_id uuid not null references profiles (id) on delete cascade,
+    question_bank_item_id uuid not null references question_bank_items (id) on delete cascade,
+    ease real not null default 2.5,
+    interval_days real not null default 0,
+    repetitions integer not null default 0,
+    lapses integer not null default 0,
+    due_at timestamptz not null default now(),
+    last_reviewed_at timestamptz,
+    primary key (user_id, question_bank_item_id)
+);
+
+-- "N câu đến hạn tiếp theo" = 1 index range scan
+create index if not exists idx_review_items_user_due
+    on review_items (user_id, due_at);
@@ -0,0 +1,64 @@
+-- Tỉ lệ đúng của từng user theo (loại câu hỏi, category, độ khó)
+-- Cộng dồn khi chấm bài (RPC bump_accuracy_rollup), dùng cho GET /practice/suggestions
+
+create table if not exists user_accuracy_rollup (
+    user_id uuid not null references profiles (id) on delete cascade,
+    question_type text not null,
+    category_id uuid,
+    difficulty text,
+    total integer not null default 0,
+    correct integer not null default 0,
+    updated_at timestamptz not null default now()
+);
+
+create unique index if not exists idx_user_accuracy_rollup_key
+    on user_accuracy_rollup (
+        user_id,
+        question_type,
+        coalesce(category_id, '00000000-0000-0000-0000-000000000000'::uuid),
+        coalesce(difficulty, '')
+    );
+
+-- p_rows: [{"question_type", "category_id", "difficulty", "total", "correct"}]
+create or replace function bump_accuracy_rollup(p_user_id uuid, p_rows jsonb)
+returns void
+language sql
+security definer
+set search_path = public
+as $$
+    insert into user_accuracy_rollup as r (user_id, question_type, category_id, difficulty, total, correct)
+    select p_user_id, x.question_type, x.category_id, x.difficulty, x.total, x.correct
+    from jsonb_to_recordset(p_rows) as x(
+        question_type text, category_id uuid, difficulty text, total integer, correct integer
+    )
+    on conflict (
+        user_id,
+        question_type,
+        coalesce(category_id, '00000000-0000-0000-0000-000000000000'::uuid),
+        coalesce(difficulty, '')
+    )
+    do update set
+        total = r.total + excluded.total,
+        correct = r.correct + excluded.correct,
+        updated_at = now();
+$$;
+
+-- Chỉ backend (service role) được gọi: hàm chạy security definer (bỏ qua RLS) và tin tham số do bên gọi truyền vào
+revoke execute on function bump_accuracy_rollup(uuid, jsonb) from public, anon, authenticated;
+grant execute on function bump_accuracy_rollup(uuid, jsonb) to service_role;
+
+-- Backfill từ các bài thi đã chấm
+insert into user_accuracy_rollup (user_id, question_type, category_id, difficulty, total, correct)
+select
+    ue.user_id,
+    q.question_type,
+    q.category_id,
+    q.difficulty,
+    count(*),
+    count(*) filter (where ua.is_correct)
+from user_answers ua
+join user_exams ue on ue.id = ua.user_exam_id and ue.status = 'graded'
+join exam_questions eq on eq.id = ua.exam_question_id
+join question_bank_items q on q.id = eq.question_bank_item_id
+group by ue.user_id, q.question_type, q.category_id, q.difficulty
+on conflict do nothing;
@@ -0,0 +1,79 @@
+-- Chọn câu hỏi cho phiên luyện điểm yếu (session_type = weak_topics)
+-- p_strata: [{"question_type", "category_id", "difficulty", "weight"}], weight = tỉ lệ sai của user ở tầng đó
+-- Lấy mẫu có trọng số (random() ^ (1 / weight)), bỏ câu vừa ôn gần đây, bỏ câu trùng nội dung (text_fingerprint)
+-- p_categories: category id hoặc loại câu hỏi (gợi ý luyện tập trả về loại câu hỏi)
+
+create index if not exists idx_question_bank_items_category_difficulty_type
+    on question_bank_items (category_id, difficulty, question_type);
+
+create or replace function weak_topic_candidates(
+    p_user_id uuid,
+    p_strata jsonb,
+    p_limit integer,
+    p_recent_since timestamptz,
+    p_categories text[] default null,
+    p_difficulty text default null
+)
+returns table (
+    id uuid,
+    question_type text,
+    category_id uuid,
+    difficulty text,
+    score double precision
+)
+language sql
+volatile
+security definer
+set search_path = public
+as $$
+    with strata as (
+        select *
+        from jsonb_to_recordset(p_strata) as s(
+            question_type text, category_id uuid, difficulty text, weight double precision
+        )
+        where s.weight > 0
+    ),
+    candidates as (
+        select
+            q.id,
+            q.question_type,
+            q.category_id,
+            q.difficulty,
+            coalesce(q.text_fingerprint::text, q.id::text) as content_key,
+            power(random(), 1.0 / s.weight) as score
+        from strata s
+        join question_bank_items q
+            on q.question_type = s.question_type
+           and q.category_id is not distinct from s.category_id
+           and q.difficulty is not distinct from s.difficulty
+        join question_banks b
+            on b.id = q.question_bank_id
+           and (b.user_id = p_user_id or b.is_public)
+        where (
+                p_categories is null
+                or q.category_id::text = any(p_categories)
+                or q.question_type = any(p_categories)
+              )
+          and (p_difficulty is null or q.difficulty = p_difficulty)
+          and not exists (
+              select 1
+              from review_items r
+              where r.user_id = p_user_id
+                and r.question_bank_item_id = q.id
+                and r.last_reviewed_at >= p_recent_since
+          )
+    ),
+    deduped as (
+        select distinct on (content_key) *
+        from candidates
+        order by content_key, score desc
+    )
+    select id, question_type, category_id, difficulty, score
+    from deduped
+    order by score desc
+    limit p_limit;
+$$;
+
+-- Chỉ backend (service role) được gọi: hàm chạy security definer (bỏ qua RLS) và tin tham số do bên gọi truyền vào
+revoke execute on function weak_topic_candidates(uuid, jsonb, integer, timestamptz, text[], text) from public, anon, authenticated;
+grant execute on function weak_topic_candidates(uuid, jsonb, integer, timestamptz, text[], text) to service_role;
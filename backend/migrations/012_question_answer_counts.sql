@@ -0,0 +1,27 @@
+-- Cộng dồn times_correct / times_incorrect cho nhiều câu hỏi trong 1 lệnh
+-- Gọi bởi app/services/item_stats_service.py khi flush bộ đệm (mỗi phần tử: 1 câu hỏi và số lượt đúng/sai)
+
+create or replace function increment_question_answer_counts(
+    p_item_ids uuid[],
+    p_correct integer[],
+    p_incorrect integer[]
+)
+returns void
+language sql
+security definer
+set search_path = public
+as $$
+    update question_bank_items q
+    set times_correct = coalesce(q.times_correct, 0) + d.correct,
+        times_incorrect = coalesce(q.times_incorrect, 0) + d.incorrect
+    from (
+        select item_id, sum(correct)::integer as correct, sum(incorrect)::integer as incorrect
+        from unnest(p_item_ids, p_correct, p_incorrect) as u(item_id, correct, incorrect)
+        group by item_id
+    ) d
+    where q.id = d.item_id;
+$$;
+
+-- Chỉ backend (service role) được gọi: hàm chạy security definer (bỏ qua RLS) và tin tham số do bên gọi truyền vào
+revoke execute on function increment_question_answer_counts(uuid[], integer[], integer[]) from public, anon, authenticated;
+grant execute on function increment_question_answer_counts(uuid[], integer[], integer[]) to service_role;
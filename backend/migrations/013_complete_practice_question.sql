@@ -0,0 +1,48 @@
+-- Đánh dấu câu đã làm trong practice session: append-if-absent atomic trong 1 lệnh UPDATE
+-- Các biểu thức SET đọc dòng hiện tại (đã khoá), nên nhiều request đồng thời không làm mất tiến độ
+-- Làm hết câu → status = 'completed', completed_at = now() (giữ nguyên nếu đã có)
+-- Không trả dòng nào nếu session không tồn tại / không thuộc user
+
+create or replace function complete_practice_question(
+    p_session_id uuid,
+    p_user_id uuid,
+    p_question_id uuid
+)
+returns table (
+    completed integer,
+    total integer,
+    status text
+)
+language sql
+volatile
+security definer
+set search_path = public
+as $$
+    update practice_sessions s
+    set completed_question_ids = case
+            when p_question_id = any(coalesce(s.completed_question_ids, '{}')) then s.completed_question_ids
+            else array_append(coalesce(s.completed_question_ids, '{}'), p_question_id)
+        end,
+        status = case
+            when cardinality(coalesce(s.completed_question_ids, '{}'))
+                 + (case when p_question_id = any(coalesce(s.completed_question_ids, '{}')) then 0 else 1 end)
+                 >= cardinality(s.question_ids) then 'completed'
+            else s.status
+        end,
+        completed_at = case
+            when cardinality(coalesce(s.completed_question_ids, '{}'))
+                 + (case when p_question_id = any(coalesce(s.completed_question_ids, '{}')) then 0 else 1 end)
+                 >= cardinality(s.question_ids) then coalesce(s.completed_at, now())
+            else s.completed_at
+        end
+    where s.id = p_session_id
+      and s.user_id = p_user_id
+    returning
+        cardinality(s.completed_question_ids),
+        cardinality(s.question_ids),
+        s.status;
+$$;
+
+-- Chỉ backend (service role) được gọi: hàm chạy security definer (bỏ qua RLS) và tin tham số do bên gọi truyền vào
+revoke execute on function complete_practice_question(uuid, uuid, uuid) from public, anon, authenticated;
+grant execute on function complete_practice_question(uuid, uuid, uuid) to service_role;
@@ -0,0 +1,58 @@
+-- Lịch sử trả lời theo user: thêm user_id, question_bank_item_id, question_type vào user_answers
+-- Thống kê / luyện tập lọc thẳng theo user_id thay vì gửi danh sách user_exam_id (in_) ngày càng dài
+
+alter table user_answers
+    add column if not exists user_id uuid references profiles (id) on delete cascade,
+    add column if not exists question_bank_item_id uuid references question_bank_items (id) on delete set null,
+    add column if not exists question_type text;
+
+-- Trigger điền các cột khi thêm câu trả lời (mọi đường ghi đều được phủ)
+create or replace function fill_user_answer_refs()
+returns trigger
+language plpgsql
+as $$
+begin
+    if new.user_id is null then
+        select ue.user_id into new.user_id
+        from user_exams ue
+        where ue.id = new.user_exam_id;
+    end if;
+
+    if new.question_bank_item_id is null or new.question_type is null then
+        select eq.question_bank_item_id, q.question_type
+        into new.question_bank_item_id, new.question_type
+        from exam_questions eq
+        left join question_bank_items q on q.id = eq.question_bank_item_id
+        where eq.id = new.exam_question_id;
+    end if;
+
+    return new;
+end;
+$$;
+
+drop trigger if exists trg_fill_user_answer_refs on user_answers;
+create trigger trg_fill_user_answer_refs
+    before insert or update of user_exam_id, exam_question_id on user_answers
+    for each row execute function fill_user_answer_refs();
+
+-- Backfill dữ liệu cũ
+update user_answers ua
+set user_id = ue.user_id
+from user_exams ue
+where ue.id = ua.user_exam_id
+  and ua.user_id is null;
+
+update user_answers ua
+set question_bank_item_id = eq.question_bank_item_id,
+    question_type = q.question_type
+from exam_questions eq
+left join question_bank_items q on q.id = eq.question_bank_item_id
+where eq.id = ua.exam_question_id
+  and (ua.question_bank_item_id is null or ua.question_type is null);
+
+-- is_correct chỉ có giá trị sau khi bài đã được chấm
+create index if not exists idx_user_answers_user_correct
+    on user_answers (user_id, is_correct);
+
+create index if not exists idx_user_answers_user_item
+    on user_answers (user_id, question_bank_item_id);
@@ -0,0 +1,31 @@
+-- Chuỗi ngày học liên tiếp lưu sẵn trong user_statistics
+-- current_streak = độ dài chuỗi kết thúc ở last_active_date; khi đọc, chuỗi hết hiệu lực nếu last_active_date < hôm qua
+-- Cập nhật bởi app/services/streak_service.py khi chấm bài / hoàn thành luyện tập
+
+alter table user_statistics
+    add column if not exists current_streak integer not null default 0,
+    add column if not exists last_active_date date;
+
+-- Backfill từ các bài đã chấm (gaps-and-islands theo ngày UTC)
+with days as (
+    select distinct user_id, (submitted_at at time zone 'utc')::date as day
+    from user_exams
+    where status = 'graded'
+      and submitted_at is not null
+),
+islands as (
+    select user_id, day,
+           day - (row_number() over (partition by user_id order by day))::integer as island
+    from days
+),
+latest as (
+    select distinct on (user_id) user_id, max(day) as last_day, count(*)::integer as length
+    from islands
+    group by user_id, island
+    order by user_id, max(day) desc
+)
+update user_statistics s
+set current_streak = l.length,
+    last_active_date = l.last_day
+from latest l
+where s.user_id = l.user_id;
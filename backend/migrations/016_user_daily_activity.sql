@@ -0,0 +1,168 @@
+-- Hoạt động theo ngày (theo múi giờ của user): nguồn chung cho biểu đồ điểm, chuỗi ngày học và xu hướng điểm
+-- Cập nhật tăng dần bởi app/services/activity_service.py khi chấm bài / hoàn thành luyện tập
+
+alter table profiles
+    add column if not exists timezone text not null default 'Asia/Ho_Chi_Minh';
+
+create table if not exists user_daily_activity (
+    user_id uuid not null references profiles (id) on delete cascade,
+    local_date date not null,
+    exams_count integer not null default 0,
+    scored_exams integer not null default 0,      -- Bài có total_marks > 0 (tính vào điểm trung bình)
+    score_pct_sum double precision not null default 0,  -- Tổng % điểm của các bài trên
+    practice_count integer not null default 0,
+    time_spent integer not null default 0,        -- giây
+    updated_at timestamptz not null default now(),
+    primary key (user_id, local_date)
+);
+
+-- Cộng dồn vào ngày (theo profiles.timezone) của thời điểm p_at, trả về ngày đó
+create or replace function bump_daily_activity(
+    p_user_id uuid,
+    p_at timestamptz default now(),
+    p_exams integer default 0,
+    p_score_pct double precision default null,
+    p_practice integer default 0,
+    p_time_spent integer default 0
+)
+returns date
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_date date;
+begin
+    select (p_at at time zone coalesce(p.timezone, 'UTC'))::date
+    into v_date
+    from profiles p
+    where p.id = p_user_id;
+
+    v_date := coalesce(v_date, (p_at at time zone 'UTC')::date);
+
+    insert into user_daily_activity as a (
+        user_id, local_date, exams_count, scored_exams, score_pct_sum, practice_count, time_spent
+    )
+    values (
+        p_user_id,
+        v_date,
+        p_exams,
+        case when p_score_pct is null then 0 else 1 end,
+        coalesce(p_score_pct, 0),
+        p_practice,
+        p_time_spent
+    )
+    on conflict (user_id, local_date) do update
+    set exams_count = a.exams_count + excluded.exams_count,
+        scored_exams = a.scored_exams + excluded.scored_exams,
+        score_pct_sum = a.score_pct_sum + excluded.score_pct_sum,
+        practice_count = a.practice_count + excluded.practice_count,
+        time_spent = a.time_spent + excluded.time_spent,
+        updated_at = now();
+
+    return v_date;
+end;
+$$;
+
+-- Chỉ backend (service role) được gọi: hàm chạy security definer (bỏ qua RLS) và tin tham số do bên gọi truyền vào
+revoke execute on function bump_daily_activity(uuid, timestamptz, integer, double precision, integer, integer) from public, anon, authenticated;
+grant execute on function bump_daily_activity(uuid, timestamptz, integer, double precision, integer, integer) to service_role;
+
+-- complete_practice_question trả thêm newly_completed: session vừa chuyển sang completed ở lần gọi này
+-- (completed_at = now() chỉ khi chính lệnh UPDATE này đặt nó) → ghi nhận luyện tập đúng 1 lần
+drop function if exists complete_practice_question(uuid, uuid, uuid);
+
+create or replace function complete_practice_question(
+    p_session_id uuid,
+    p_user_id uuid,
+    p_question_id uuid
+)
+returns table (
+    completed integer,
+    total integer,
+    status text,
+    newly_completed boolean
+)
+language sql
+volatile
+security definer
+set search_path = public
+as $$
+    update practice_sessions s
+    set completed_question_ids = case
+            when p_question_id = any(coalesce(s.completed_question_ids, '{}')) then s.completed_question_ids
+            else array_append(coalesce(s.completed_question_ids, '{}'), p_question_id)
+        end,
+        status = case
+            when cardinality(coalesce(s.completed_question_ids, '{}'))
+                 + (case when p_question_id = any(coalesce(s.completed_question_ids, '{}')) then 0 else 1 end)
+                 >= cardinality(s.question_ids) then 'completed'
+            else s.status
+        end,
+        completed_at = case
+            when cardinality(coalesce(s.completed_question_ids, '{}'))
+                 + (case when p_question_id = any(coalesce(s.completed_question_ids, '{}')) then 0 else 1 end)
+                 >= cardinality(s.question_ids) then coalesce(s.completed_at, now())
+            else s.completed_at
+        end
+    where s.id = p_session_id
+      and s.user_id = p_user_id
+    returning
+        cardinality(s.completed_question_ids),
+        cardinality(s.question_ids),
+        s.status,
+        s.status = 'completed' and s.completed_at = now();
+$$;
+
+-- Chỉ backend (service role) được gọi: hàm chạy security definer (bỏ qua RLS) và tin tham số do bên gọi truyền vào
+revoke execute on function complete_practice_question(uuid, uuid, uuid) from public, anon, authenticated;
+grant execute on function complete_practice_question(uuid, uuid, uuid) to service_role;
+
+-- Backfill từ các bài đã chấm và practice session đã hoàn thành
+insert into user_daily_activity (
+    user_id, local_date, exams_count, scored_exams, score_pct_sum, practice_count, time_spent
+)
+select user_id, local_date,
+       sum(exams_count), sum(scored_exams), sum(score_pct_sum), sum(practice_count), sum(time_spent)
+from (
+    select ue.user_id,
+           (ue.submitted_at at time zone p.timezone)::date as local_date,
+           1 as exams_count,
+           case when e.total_marks > 0 then 1 else 0 end as scored_exams,
+           case when e.total_marks > 0 then ue.total_score * 100.0 / e.total_marks else 0 end as score_pct_sum,
+           0 as practice_count,
+           coalesce(ue.time_spent, 0) as time_spent
+    from user_exams ue
+    join exams e on e.id = ue.exam_id
+    join profiles p on p.id = ue.user_id
+    where ue.status = 'graded'
+      and ue.submitted_at is not null
+    union all
+    select ps.user_id,
+           (ps.completed_at at time zone p.timezone)::date,
+           0, 0, 0, 1, 0
+    from practice_sessions ps
+    join profiles p on p.id = ps.user_id
+    where ps.status = 'completed'
+      and ps.completed_at is not null
+) rows
+group by user_id, local_date
+on conflict (user_id, local_date) do nothing;
+
+-- Chuỗi ngày học tính lại theo ngày địa phương (gaps-and-islands trên bảng mới)
+with islands as (
+    select user_id, local_date,
+           local_date - (row_number() over (partition by user_id order by local_date))::integer as island
+    from user_daily_activity
+),
+latest as (
+    select distinct on (user_id) user_id, max(local_date) as last_day, count(*)::integer as length
+    from islands
+    group by user_id, island
+    order by user_id, max(local_date) desc
+)
+update user_statistics s
+set current_streak = l.length,
+    last_active_date = l.last_day
+from latest l
+where s.user_id = l.user_id;
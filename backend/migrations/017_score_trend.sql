@@ -0,0 +1,41 @@
+-- Xu hướng điểm: % trung bình 7 ngày gần nhất trừ 7 ngày trước đó (ngày theo profiles.timezone)
+-- 1 truy vấn gộp trên user_daily_activity (% đã tính theo exams.total_marks lúc chấm bài)
+-- Giữ nguyên quy ước cũ:
+--   - không có bài nào trong 7 ngày gần nhất → 0
+--   - không có bài nào trong 7 ngày trước đó → điểm TB gần nhất nếu > 50, ngược lại 0
+
+create or replace function score_trend(p_user_id uuid)
+returns double precision
+language sql
+stable
+security definer
+set search_path = public
+as $$
+    with today as (
+        select (now() at time zone coalesce(
+            (select timezone from profiles where id = p_user_id), 'UTC'
+        ))::date as day
+    ),
+    windows as (
+        select
+            sum(a.score_pct_sum) filter (where a.local_date > t.day - 7)
+                / nullif(sum(a.scored_exams) filter (where a.local_date > t.day - 7), 0) as recent_avg,
+            sum(a.score_pct_sum) filter (where a.local_date <= t.day - 7)
+                / nullif(sum(a.scored_exams) filter (where a.local_date <= t.day - 7), 0) as previous_avg
+        from today t
+        left join user_daily_activity a
+            on a.user_id = p_user_id
+           and a.local_date > t.day - 14
+           and a.local_date <= t.day
+    )
+    select case
+        when recent_avg is null then 0
+        when previous_avg is null then case when recent_avg > 50 then round(recent_avg::numeric, 1)::double precision else 0 end
+        else round((recent_avg - previous_avg)::numeric, 1)::double precision
+    end
+    from windows;
+$$;
+
+-- Chỉ backend (service role) được gọi: hàm chạy security definer (bỏ qua RLS) và tin tham số do bên gọi truyền vào
+revoke execute on function score_trend(uuid) from public, anon, authenticated;
+grant execute on function score_trend(uuid) to service_role;
@@ -0,0 +1,163 @@
+-- Gộp câu hỏi trùng vào một câu giữ lại trong 1 transaction (gọi bởi POST /question-banks/duplicates/merge)
+-- Chuyển mọi tham chiếu sang câu giữ lại:
+--   exam_questions (chỉ đề do user tạo; đề đã có câu giữ lại và chưa có lượt làm → bỏ dòng trùng, tính lại total_marks),
+--   user_answers.question_bank_item_id, review_items, practice_sessions.question_ids / completed_question_ids
+-- Cộng dồn times_used / times_correct / times_incorrect rồi xóa bản trùng
+-- Từ chối gộp nếu phải sửa đề của user khác hoặc đề đã có lượt làm bài (điểm cũ không đổi ngầm)
+-- Lỗi ở bất kỳ bước nào → rollback toàn bộ
+
+-- Thay các id trùng bằng id giữ lại, bỏ phần tử lặp, giữ thứ tự xuất hiện đầu tiên
+create or replace function merge_id_array(p_ids uuid[], p_duplicate_ids uuid[], p_keep_id uuid)
+returns uuid[]
+language sql
+immutable
+as $$
+    select coalesce(array_agg(m.id order by m.first_pos), '{}')
+    from (
+        select case when u.id = any(p_duplicate_ids) then p_keep_id else u.id end as id,
+               min(u.pos) as first_pos
+        from unnest(p_ids) with ordinality as u(id, pos)
+        group by 1
+    ) m;
+$$;
+
+create or replace function merge_duplicate_questions(
+    p_user_id uuid,
+    p_keep_id uuid,
+    p_duplicate_ids uuid[]
+)
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_found integer;
+    v_affected_exams uuid[];
+begin
+    p_duplicate_ids := array(
+        select distinct d from unnest(p_duplicate_ids) as d where d <> p_keep_id
+    );
+    if cardinality(p_duplicate_ids) = 0 then
+        return 0;
+    end if;
+
+    -- Tất cả câu hỏi phải thuộc ngân hàng của user (khoá các dòng để tránh gộp đồng thời)
+    select count(*) into v_found
+    from (
+        select q.id
+        from question_bank_items q
+        join question_banks b on b.id = q.question_bank_id
+        where q.id = any(p_duplicate_ids || p_keep_id)
+          and b.user_id = p_user_id
+        for update of q
+    ) owned;
+
+    if v_found <> cardinality(p_duplicate_ids) + 1 then
+        raise exception 'Question not found' using errcode = 'P0002';
+    end if;
+
+    -- Đề thi của user khác (tạo từ ngân hàng public / bản clone) đang dùng bản trùng → từ chối,
+    -- không sửa đề và kết quả của người khác
+    if exists (
+        select 1
+        from exam_questions eq
+        join exams e on e.id = eq.exam_id
+        where eq.question_bank_item_id = any(p_duplicate_ids)
+          and e.created_by <> p_user_id
+    ) then
+        raise exception 'Duplicates are used in exams created by other users' using errcode = 'P0001';
+    end if;
+
+    -- exam_questions: mỗi đề chỉ giữ 1 dòng cho câu hỏi sau khi gộp
+    -- (ưu tiên dòng của câu giữ lại, sau đó dòng có order_index nhỏ nhất)
+    create temporary table merge_exam_rows on commit drop as
+    select eq.id,
+           eq.exam_id,
+           first_value(eq.id) over (
+               partition by eq.exam_id
+               order by (eq.question_bank_item_id = p_keep_id) desc, eq.order_index, eq.id
+           ) as survivor_id
+    from exam_questions eq
+    where eq.question_bank_item_id = any(p_duplicate_ids || p_keep_id);
+
+    select array_agg(distinct exam_id) into v_affected_exams
+    from merge_exam_rows
+    where id <> survivor_id;
+
+    -- Bỏ dòng trùng sẽ đổi total_marks và điểm của các lượt đã làm → chỉ làm khi đề chưa có lượt làm bài nào
+    -- (không bao giờ xóa câu trả lời đã chấm)
+    if v_affected_exams is not null and exists (
+        select 1 from user_exams ue where ue.exam_id = any(v_affected_exams)
+    ) then
+        raise exception 'An exam containing both questions already has attempts' using errcode = 'P0001';
+    end if;
+
+    delete from exam_questions eq
+    using merge_exam_rows r
+    where eq.id = r.id
+      and r.id <> r.survivor_id;
+
+    update exam_questions
+    set question_bank_item_id = p_keep_id
+    where question_bank_item_id = any(p_duplicate_ids);
+
+    if v_affected_exams is not null then
+        update exams e
+        set total_marks = coalesce((
+            select sum(eq.marks) from exam_questions eq where eq.exam_id = e.id
+        ), 0)
+        where e.id = any(v_affected_exams);
+    end if;
+
+    -- Lịch sử trả lời
+    update user_answers
+    set question_bank_item_id = p_keep_id
+    where question_bank_item_id = any(p_duplicate_ids);
+
+    -- Lịch ôn tập: user chưa có lịch cho câu giữ lại → lấy lịch đến hạn sớm nhất của các bản trùng
+    insert into review_items (
+        user_id, question_bank_item_id, ease, interval_days, repetitions, lapses, due_at, last_reviewed_at
+    )
+    select distinct on (r.user_id)
+        r.user_id, p_keep_id, r.ease, r.interval_days, r.repetitions, r.lapses, r.due_at, r.last_reviewed_at
+    from review_items r
+    where r.question_bank_item_id = any(p_duplicate_ids)
+    order by r.user_id, r.due_at
+    on conflict (user_id, question_bank_item_id) do nothing;
+
+    delete from review_items
+    where question_bank_item_id = any(p_duplicate_ids);
+
+    -- Practice session đang chứa bản trùng
+    update practice_sessions
+    set question_ids = merge_id_array(question_ids, p_duplicate_ids, p_keep_id),
+        completed_question_ids = merge_id_array(coalesce(completed_question_ids, '{}'), p_duplicate_ids, p_keep_id)
+    where question_ids && p_duplicate_ids
+       or completed_question_ids && p_duplicate_ids;
+
+    -- Cộng dồn thống kê rồi xóa bản trùng
+    update question_bank_items k
+    set times_used = coalesce(k.times_used, 0) + d.times_used,
+        times_correct = coalesce(k.times_correct, 0) + d.times_correct,
+        times_incorrect = coalesce(k.times_incorrect, 0) + d.times_incorrect,
+        updated_at = now()
+    from (
+        select coalesce(sum(times_used), 0)::integer as times_used,
+               coalesce(sum(times_correct), 0)::integer as times_correct,
+               coalesce(sum(times_incorrect), 0)::integer as times_incorrect
+        from question_bank_items
+        where id = any(p_duplicate_ids)
+    ) d
+    where k.id = p_keep_id;
+
+    delete from question_bank_items
+    where id = any(p_duplicate_ids);
+
+    return cardinality(p_duplicate_ids);
+end;
+$$;
+
+-- Chỉ backend (service role) được gọi: hàm chạy security definer (bỏ qua RLS) và tin tham số do bên gọi truyền vào
+revoke execute on function merge_duplicate_questions(uuid, uuid, uuid[]) from public, anon, authenticated;
+grant execute on function merge_duplicate_questions(uuid, uuid, uuid[]) to service_role;
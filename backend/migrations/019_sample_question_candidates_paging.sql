@@ -0,0 +1,70 @@
+-- sample_question_candidates trả tới (số tầng × p_per_stratum) dòng, vượt max-rows của PostgREST (1000 trên Supabase)
+-- và bị cắt ngầm → lệch trọng số / báo thiếu câu sai. Bản mới:
+--   - ORDER BY stratum_rank: trang đầu chứa top-N của mọi tầng trước, không tầng nào bị bỏ
+--   - p_limit / p_offset để backend đọc theo trang (p_limit <= max-rows)
+--   - sort_key tính từ p_seed + id (không dùng random()) → các trang của cùng một lần lấy mẫu nhất quán
+--   - trả thêm times_used để sinh nhiều đề (sample_variants) dùng cùng trọng số
+
+drop function if exists sample_question_candidates(uuid[], uuid[], text[], text[], integer, boolean);
+
+create or replace function sample_question_candidates(
+    p_bank_ids uuid[],
+    p_seed bigint,
+    p_category_ids uuid[] default null,
+    p_difficulties text[] default null,
+    p_tags text[] default null,
+    p_per_stratum integer default 100,
+    p_prefer_unused boolean default true,
+    p_limit integer default 1000,
+    p_offset integer default 0
+)
+returns table (
+    id uuid,
+    difficulty text,
+    category_id uuid,
+    marks integer,
+    times_used integer,
+    sort_key double precision
+)
+language sql
+stable
+security definer
+set search_path = public
+as $$
+    select id, difficulty, category_id, marks, times_used, sort_key
+    from (
+        select
+            c.*,
+            row_number() over (
+                partition by c.difficulty, c.category_id
+                order by c.sort_key desc, c.id
+            ) as stratum_rank
+        from (
+            select
+                q.id,
+                q.difficulty,
+                q.category_id,
+                q.marks,
+                coalesce(q.times_used, 0) as times_used,
+                power(
+                    -- Số ngẫu nhiên giả trong (0, 1], ổn định theo (p_seed, id)
+                    ((hashtextextended(q.id::text, p_seed) & 9007199254740991) + 1)::double precision
+                        / 9007199254740992,
+                    case when p_prefer_unused then 1 + coalesce(q.times_used, 0) else 1 end
+                ) as sort_key
+            from question_bank_items q
+            where q.question_bank_id = any(p_bank_ids)
+              and (p_category_ids is null or q.category_id = any(p_category_ids))
+              and (p_difficulties is null or q.difficulty = any(p_difficulties))
+              and (p_tags is null or q.tags @> p_tags)
+        ) c
+    ) ranked
+    where stratum_rank <= p_per_stratum
+    order by stratum_rank, sort_key desc, id
+    limit p_limit
+    offset p_offset;
+$$;
+
+-- Chỉ backend (service role) được gọi: hàm chạy security definer (bỏ qua RLS) và tin tham số do bên gọi truyền vào
+revoke execute on function sample_question_candidates(uuid[], bigint, uuid[], text[], text[], integer, boolean, integer, integer) from public, anon, authenticated;
+grant execute on function sample_question_candidates(uuid[], bigint, uuid[], text[], text[], integer, boolean, integer, integer) to service_role;
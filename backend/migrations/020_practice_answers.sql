@@ -0,0 +1,80 @@
+-- Chỉ ghi nhận câu trả lời đầu tiên cho mỗi (session, câu hỏi) trong practice
+-- practice_answers: {question_id: kết quả chấm lần đầu}; lần gọi lặp lại trả lại kết quả đã lưu,
+-- không cập nhật review_items / user_accuracy_rollup / times_correct nữa
+alter table practice_sessions
+    add column if not exists practice_answers jsonb not null default '{}'::jsonb;
+
+drop function if exists complete_practice_question(uuid, uuid, uuid);
+
+-- p_answer (nếu có) chỉ được lưu khi câu chưa có kết quả; newly_answered = lần gọi này đã lưu nó
+-- answer = kết quả đang lưu cho câu (của lần đầu)
+create or replace function complete_practice_question(
+    p_session_id uuid,
+    p_user_id uuid,
+    p_question_id uuid,
+    p_answer jsonb default null
+)
+returns table (
+    completed integer,
+    total integer,
+    status text,
+    newly_completed boolean,
+    newly_answered boolean,
+    answer jsonb
+)
+language plpgsql
+volatile
+security definer
+set search_path = public
+as $$
+#variable_conflict use_column
+declare
+    v_session practice_sessions%rowtype;
+    v_completed uuid[];
+    v_newly_answered boolean;
+    v_newly_completed boolean;
+begin
+    -- Khoá dòng: các lần gọi đồng thời cho cùng session chạy tuần tự
+    select * into v_session
+    from practice_sessions s
+    where s.id = p_session_id
+      and s.user_id = p_user_id
+    for update;
+
+    if not found then
+        return;
+    end if;
+
+    v_completed := coalesce(v_session.completed_question_ids, '{}');
+    if not p_question_id = any(v_completed) then
+        v_completed := array_append(v_completed, p_question_id);
+    end if;
+
+    v_newly_answered := p_answer is not null
+        and not v_session.practice_answers ? p_question_id::text;
+    v_newly_completed := v_session.status <> 'completed'
+        and cardinality(v_completed) >= cardinality(v_session.question_ids);
+
+    update practice_sessions s
+    set completed_question_ids = v_completed,
+        practice_answers = case
+            when v_newly_answered then s.practice_answers || jsonb_build_object(p_question_id::text, p_answer)
+            else s.practice_answers
+        end,
+        status = case when v_newly_completed then 'completed' else s.status end,
+        completed_at = case when v_newly_completed then coalesce(s.completed_at, now()) else s.completed_at end
+    where s.id = p_session_id
+    returning s.practice_answers -> p_question_id::text into answer;
+
+    completed := cardinality(v_completed);
+    total := cardinality(v_session.question_ids);
+    status := case when v_newly_completed then 'completed' else v_session.status end;
+    newly_completed := v_newly_completed;
+    newly_answered := v_newly_answered;
+    return next;
+end;
+$$;
+
+-- Chỉ backend (service role) được gọi: hàm chạy security definer (bỏ qua RLS) và tin tham số do bên gọi truyền vào
+revoke execute on function complete_practice_question(uuid, uuid, uuid, jsonb) from public, anon, authenticated;
+grant execute on function complete_practice_question(uuid, uuid, uuid, jsonb) to service_role;
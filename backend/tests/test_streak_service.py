@@ -0,0 +1,86 @@
+from datetime import date, datetime, timezone
+from zoneinfo import ZoneInfo
+
+from app.services.activity_service import DEFAULT_TIMEZONE, user_timezone
+from app.services.streak_service import activity_date, advance_streak, current_streak
+
+HCM = ZoneInfo('Asia/Ho_Chi_Minh')  # UTC+7
+
+
+# ---- advance_streak ----
+
+def test_first_activity_starts_streak():
+    assert advance_streak(0, None, date(2024, 3, 1)) == (1, date(2024, 3, 1))
+
+
+def test_same_day_twice_keeps_streak():
+    streak, last = advance_streak(3, date(2024, 3, 1), date(2024, 3, 1))
+    assert (streak, last) == (3, date(2024, 3, 1))
+
+
+def test_next_day_increments():
+    assert advance_streak(3, '2024-03-01', date(2024, 3, 2)) == (4, date(2024, 3, 2))
+
+
+def test_skipped_day_resets():
+    assert advance_streak(5, date(2024, 3, 1), date(2024, 3, 3)) == (1, date(2024, 3, 3))
+
+
+def test_late_activity_is_ignored():
+    assert advance_streak(2, date(2024, 3, 5), date(2024, 3, 4)) == (2, date(2024, 3, 5))
+
+
+def test_month_and_year_rollover():
+    assert advance_streak(1, date(2024, 2, 29), date(2024, 3, 1)) == (2, date(2024, 3, 1))
+    assert advance_streak(7, date(2023, 12, 31), date(2024, 1, 1)) == (8, date(2024, 1, 1))
+
+
+# ---- current_streak ----
+
+def test_current_streak_valid_today_and_yesterday():
+    assert current_streak(4, date(2024, 3, 2), today=date(2024, 3, 2)) == 4
+    assert current_streak(4, date(2024, 3, 1), today=date(2024, 3, 2)) == 4
+
+
+def test_current_streak_expires_after_skipped_day():
+    assert current_streak(4, date(2024, 3, 1), today=date(2024, 3, 3)) == 0
+
+
+def test_current_streak_without_activity():
+    assert current_streak(None, None, today=date(2024, 3, 1)) == 0
+
+
+# ---- activity_date: ranh giới ngày theo múi giờ ----
+
+def test_midnight_rollover_utc():
+    assert activity_date(datetime(2024, 3, 1, 23, 59, 59, tzinfo=timezone.utc)) == date(2024, 3, 1)
+    assert activity_date(datetime(2024, 3, 2, 0, 0, 0, tzinfo=timezone.utc)) == date(2024, 3, 2)
+
+
+def test_naive_datetime_is_treated_as_utc():
+    assert activity_date(datetime(2024, 3, 1, 20, 0), HCM) == date(2024, 3, 2)
+
+
+def test_non_utc_timezone_midnight():
+    # 16:59:59 UTC = 23:59:59 giờ VN, 17:00 UTC = 00:00 ngày hôm sau giờ VN
+    assert activity_date(datetime(2024, 3, 1, 16, 59, 59, tzinfo=timezone.utc), HCM) == date(2024, 3, 1)
+    assert activity_date(datetime(2024, 3, 1, 17, 0, 0, tzinfo=timezone.utc), HCM) == date(2024, 3, 2)
+
+
+def test_streak_across_local_midnight():
+    # Hai lần làm bài cách nhau 2 phút: cùng ngày UTC nhưng khác ngày giờ VN
+    first = activity_date(datetime(2024, 3, 1, 16, 59, tzinfo=timezone.utc), HCM)
+    second = activity_date(datetime(2024, 3, 1, 17, 1, tzinfo=timezone.utc), HCM)
+    streak, last = advance_streak(0, None, first)
+    assert advance_streak(streak, last, second) == (2, date(2024, 3, 2))
+
+
+# ---- user_timezone ----
+
+def test_user_timezone_from_profile():
+    assert user_timezone({'timezone': 'America/New_York'}) == ZoneInfo('America/New_York')
+
+
+def test_user_timezone_falls_back_to_default():
+    assert user_timezone(None) == ZoneInfo(DEFAULT_TIMEZONE)
+    assert user_timezone({'timezone': 'Not/AZone'}) == ZoneInfo(DEFAULT_TIMEZONE)
@@ -73,7 +73,6 @@ const PracticeSession = () => {
   };
 
   const handleCheckAnswer = async (questionId) => {
-    const currentQuestion = questions.find(q => q.id === questionId);
     const userAnswer = answers[questionId];
 
     if (!userAnswer || (Array.isArray(userAnswer) && userAnswer.length === 0)) {
@@ -81,9 +80,9 @@ const PracticeSession = () => {
       return;
     }
 
-    // Mark question as completed
+    // Chấm trên server (đồng thời đánh dấu câu đã hoàn thành)
     try {
-      await practiceService.completeQuestion(sessionId, questionId);
+      const result = await practiceService.answerQuestion(sessionId, questionId, userAnswer);
       
       // Show answer
       setShowAnswer(prev => ({
@@ -96,8 +95,10 @@ const PracticeSession = () => {
       if (completedCount === questions.length) {
         await practiceService.completeSession(sessionId);
         toast.success('🎉 Bạn đã hoàn thành bài ôn luyện!');
+      } else if (result.is_correct) {
+        toast.success('✓ Chính xác!');
       } else {
-        toast.success('✓ Đã kiểm tra đáp án');
+        toast.error('✗ Chưa đúng, xem lại đáp án');
       }
     } catch (error) {
       console.error('Failed to mark question:', error);
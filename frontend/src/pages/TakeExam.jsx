@@ -79,8 +79,12 @@ const TakeExam = () => {
     try {
       setLoading(true);
       
+      // Start attempt first: thứ tự câu hỏi / đáp án được đảo theo seed của lượt làm bài
+      const startResponse = await submissionService.startExam(examId);
+      setAttemptId(startResponse.user_exam_id);
+
       // Load exam with questions
-      const examData = await examService.takeExam(examId);
+      const examData = await examService.takeExam(examId, startResponse.user_exam_id);
       
       if (!examData.is_published) {
         toast.error('Đề thi chưa được công bố');
@@ -90,9 +94,6 @@ const TakeExam = () => {
 
       setExam(examData);
       setQuestions(examData.questions || []);
-
-      const startResponse = await submissionService.startExam(examId);
-      setAttemptId(startResponse.user_exam_id);
       
       // Initialize timer
       const durationInSeconds = (examData.duration_minutes || 30) * 60;
@@ -52,9 +52,11 @@ export const examService = {
   },
 
   // TAKE EXAM - Get exam for student
-  takeExam: async (examId) => {
+  takeExam: async (examId, userExamId) => {
     // This will be used when student takes the exam
-    const { data } = await api.get(`/api/v1/exams/${examId}/take`);
+    const { data } = await api.get(`/api/v1/exams/${examId}/take`, {
+      params: userExamId ? { user_exam_id: userExamId } : undefined,
+    });
     return data;
   },
 
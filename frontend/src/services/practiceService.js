@@ -34,6 +34,15 @@ export const practiceService = {
     return data;
   },
 
+  // Chấm ngay một câu trả lời (server-side)
+  answerQuestion: async (sessionId, questionId, userAnswer) => {
+    const { data } = await api.post(
+      `/api/v1/practice/sessions/${sessionId}/answer`,
+      { question_id: questionId, user_answer: userAnswer }
+    );
+    return data;
+  },
+
   // Complete session
   completeSession: async (sessionId) => {
     const { data } = await api.post(`/api/v1/practice/sessions/${sessionId}/complete`);